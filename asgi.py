@@ -0,0 +1,5 @@
+#!/usr/bin/env python
+
+from swpt_debtors.asgi import create_asgi_app
+
+app = create_asgi_app()
@@ -25,6 +25,7 @@ export GUNICORN_THREADS=${WEBSERVER_THREADS:-3}
 # public interface to the "sqlalchemy" library, which we may, or may
 # not use in the future.
 export SQLALCHEMY_DATABASE_URI=${POSTGRES_URL}
+export SQLALCHEMY_REPLICA_DATABASE_URI=${POSTGRES_REPLICA_URL}
 
 # This function tries to upgrade the database schema with exponential
 # backoff. This is necessary during development, because the database
@@ -117,7 +118,7 @@ case $1 in
     consume_messages)
         exec flask swpt_debtors "$@"
         ;;
-    scan_debtors)
+    scan_debtors | scan_document_blobs)
         exec flask swpt_debtors "$@"
         ;;
     flush_configure_accounts  | flush_prepare_transfers | flush_finalize_transfers \
@@ -0,0 +1,130 @@
+"""document blobs
+
+Revision ID: 5c1e8a9b2f60
+Revises: 3b9f1c2d7a45
+Create Date: 2026-10-19 15:21:09.308164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1e8a9b2f60'
+down_revision = '3b9f1c2d7a45'
+branch_labels = None
+depends_on = None
+
+MIN_INT64 = -1 << 63
+BACKFILL_CHUNK_SIZE = 1000
+
+# Moves the contents of a chunk of documents (the next ones in primary
+# key order) to the `document_blob` table. Returns the primary keys of
+# the moved documents.
+MOVE_CONTENTS_CHUNK = sa.text("""
+WITH chunk AS (
+  SELECT debtor_id, document_id, content,
+         coalesce(content_hash, sha256(content)) AS content_hash
+  FROM document
+  WHERE (debtor_id, document_id) > (:debtor_id, :document_id)
+    AND content IS NOT NULL
+  ORDER BY debtor_id, document_id
+  LIMIT :chunk_size
+  FOR UPDATE
+),
+inserted_blob AS (
+  INSERT INTO document_blob (content_hash, content)
+  SELECT DISTINCT ON (content_hash) content_hash, content FROM chunk
+  ON CONFLICT (content_hash) DO NOTHING
+)
+UPDATE document
+SET content_hash = chunk.content_hash, content = NULL
+FROM chunk
+WHERE document.debtor_id = chunk.debtor_id
+  AND document.document_id = chunk.document_id
+RETURNING document.debtor_id, document.document_id
+""")
+
+RESTORE_CONTENTS_CHUNK = sa.text("""
+WITH chunk AS (
+  SELECT debtor_id, document_id, content_hash
+  FROM document
+  WHERE (debtor_id, document_id) > (:debtor_id, :document_id)
+    AND content IS NULL
+  ORDER BY debtor_id, document_id
+  LIMIT :chunk_size
+  FOR UPDATE
+)
+UPDATE document
+SET content = document_blob.content
+FROM chunk, document_blob
+WHERE document.debtor_id = chunk.debtor_id
+  AND document.document_id = chunk.document_id
+  AND document_blob.content_hash = chunk.content_hash
+RETURNING document.debtor_id, document.document_id
+""")
+
+
+def set_storage_params(table, **kwargs):
+    storage_params = ', '.join(
+        f"{param} = {str(value).lower()}" for param, value in kwargs.items()
+    )
+    op.execute(f"ALTER TABLE {table} SET ({storage_params})")
+
+
+def execute_in_chunks(statement):
+    # NOTE: Each chunk is processed in its own transaction, so that
+    # the table is never locked for long, and the migration can run
+    # while the application is serving requests.
+    connection = op.get_bind()
+    last_key = (MIN_INT64, MIN_INT64)
+    with op.get_context().autocommit_block():
+        while True:
+            keys = connection.execute(
+                statement,
+                {
+                    "debtor_id": last_key[0],
+                    "document_id": last_key[1],
+                    "chunk_size": BACKFILL_CHUNK_SIZE,
+                },
+            ).all()
+            if not keys:
+                break
+            last_key = max(tuple(k) for k in keys)
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table('document_blob',
+    sa.Column('content_hash', sa.LargeBinary(), nullable=False, comment='The SHA-256 hash of the content.'),
+    sa.Column('content', sa.LargeBinary(), nullable=False),
+    sa.PrimaryKeyConstraint('content_hash'),
+    comment='Represents the content of one or more saved documents. Documents that have identical contents share the same row in this table.'
+    )
+    op.alter_column('document', 'content',
+               existing_type=sa.LargeBinary(),
+               nullable=True,
+               comment='The document\'s content, for documents that have been saved before the `document_blob` table was introduced. A `NULL` value means that the content is stored in the `document_blob` row with the same content hash.')
+    # ### end Alembic commands ###
+
+    set_storage_params(
+        'document_blob',
+        fillfactor=100,
+        autovacuum_vacuum_insert_threshold=-1,
+        autovacuum_analyze_threshold=2000000000,
+    )
+
+    execute_in_chunks(MOVE_CONTENTS_CHUNK)
+
+
+def downgrade():
+    execute_in_chunks(RESTORE_CONTENTS_CHUNK)
+
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.alter_column('document', 'content',
+               existing_type=sa.LargeBinary(),
+               nullable=False,
+               comment=None,
+               existing_comment='The document\'s content, for documents that have been saved before the `document_blob` table was introduced. A `NULL` value means that the content is stored in the `document_blob` row with the same content hash.')
+    op.drop_table('document_blob')
+    # ### end Alembic commands ###
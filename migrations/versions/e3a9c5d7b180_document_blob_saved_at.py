@@ -0,0 +1,45 @@
+"""document blob saved_at
+
+Revision ID: e3a9c5d7b180
+Revises: b7d3e5f9a214
+Create Date: 2026-10-19 23:12:41.630257
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3a9c5d7b180'
+down_revision = 'b7d3e5f9a214'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('document_blob', sa.Column('saved_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False, comment='The moment at which a document with this content has been saved for the last time.'))
+    op.alter_column('document_blob', 'saved_at', server_default=None)
+    op.create_table_comment(
+        'document_blob',
+        'Represents the content of one or more saved documents. Documents that have identical contents share the same row in this table. Rows that are not referenced by any document get deleted eventually.',
+        existing_comment='Represents the content of one or more saved documents. Documents that have identical contents share the same row in this table.',
+    )
+    op.execute("CREATE TYPE document_blob_pktype AS (content_hash BYTEA)")
+
+    # NOTE: The index is created concurrently, so that the `document`
+    # table is not locked while the index is being built.
+    with op.get_context().autocommit_block():
+        op.create_index('idx_document_content_hash', 'document', ['content_hash'], unique=False, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('idx_document_content_hash', table_name='document', postgresql_concurrently=True)
+
+    op.execute("DROP TYPE IF EXISTS document_blob_pktype")
+    op.create_table_comment(
+        'document_blob',
+        'Represents the content of one or more saved documents. Documents that have identical contents share the same row in this table.',
+        existing_comment='Represents the content of one or more saved documents. Documents that have identical contents share the same row in this table. Rows that are not referenced by any document get deleted eventually.',
+    )
+    op.drop_column('document_blob', 'saved_at')
@@ -1,6 +1,7 @@
 import logging
 import json
 from datetime import datetime, date
+from flask import current_app
 from marshmallow import ValidationError
 from swpt_pythonlib import rabbitmq
 import swpt_pythonlib.protocol_schemas as ps
@@ -72,6 +73,9 @@ def _on_account_update_signal(
         transfer_note_max_bytes=transfer_note_max_bytes,
         ts=ts,
         ttl=ttl,
+        publish_balance_changes=current_app.config[
+            "APP_PUBLISH_BALANCE_CHANGES"
+        ],
     )
 
 
@@ -0,0 +1,224 @@
+"""Admission control for the web API.
+
+When a web server process gets overloaded, some of the incoming
+requests are rejected right away, with a "503 Service Unavailable"
+response and a "Retry-After" header, instead of being queued. The
+requests have priorities: low-priority requests (enumerations,
+paginated lists, public documents, and streams of events) are shed
+first, and the rest (most importantly, creating and finalizing
+transfers) are shed only when the overload becomes severe. The health
+check and metrics endpoints are never shed.
+
+Two signals are used to detect overload: the number of requests that
+the process is currently serving, and the recent average time
+requests have spent waiting for a database connection (as measured
+by `instrumentation`, for the WSGI and the ASGI connection pools).
+The rejected requests are counted in the
+`swpt_debtors_shed_requests_total` metric.
+
+Requests that wait for change notifications (streams of events, and
+waiting for transfers to finalize) are admitted or rejected like all
+other requests, but are not counted as being served, because they
+spend most of their time parked, without holding a database
+connection. Note that under a thread-based WSGI server (gunicorn's
+"gthread" worker, for example), a process never serves more requests
+than it has threads, and therefore, the limits on the number of
+requests are effective only if they are lower than the number of
+threads, or when the ASGI application (see `asgi`) is used.
+
+"""
+
+import math
+import time
+import threading
+from typing import Optional
+from flask import Flask, current_app, request, g
+from flask_smorest import abort
+from swpt_debtors import metrics
+from swpt_debtors.instrumentation import get_request_stats
+
+PRIORITY_LOW = "low"
+PRIORITY_HIGH = "high"
+
+# Safe requests to these endpoints have low priority.
+LOW_PRIORITY_ENDPOINTS = frozenset([
+    "admin.DebtorsListEndpoint",
+    "admin.DebtorEnumerateEndpoint",
+    "debtors.DebtorEventsEndpoint",
+    "transfers.TransfersListEndpoint",
+    "transfers.TransfersPageEndpoint",
+    "documents.RedirectToDebtorsInfoEndpoint",
+    "documents.DocumentEndpoint",
+])
+LOW_PRIORITY_METHODS = frozenset(["GET", "HEAD"])
+EXEMPT_BLUEPRINTS = frozenset(["health"])
+
+# Requests to these endpoints wait for change notifications, and are
+# not counted as being served.
+WAITING_ENDPOINTS = frozenset(["debtors.DebtorEventsEndpoint"])
+WAITING_QUERY_ENDPOINTS = {"transfers.TransferEndpoint": "waitFor"}
+
+# The average pool wait time is forgotten with this half-life, when
+# no new requests get measured (for example, because all requests are
+# being shed).
+POOL_WAIT_HALF_LIFE_SECONDS = 2.0
+POOL_WAIT_SMOOTHING_FACTOR = 0.1
+
+SHED_REQUESTS = metrics.Counter(
+    "swpt_debtors_shed_requests_total",
+    "The number of requests rejected by the admission control, by"
+    " priority and reason.",
+)
+IN_FLIGHT_REQUESTS = metrics.Gauge(
+    "swpt_debtors_in_flight_requests",
+    "The number of requests that are currently being served.",
+)
+
+
+def get_request_priority() -> Optional[str]:
+    """Return the priority of the current request.
+
+    Returns `None` for requests which must never be shed.
+    """
+
+    if request.method == "OPTIONS" or request.blueprint in EXEMPT_BLUEPRINTS:
+        return None
+
+    if (
+        request.endpoint in LOW_PRIORITY_ENDPOINTS
+        and request.method in LOW_PRIORITY_METHODS
+    ):
+        return PRIORITY_LOW
+
+    return PRIORITY_HIGH
+
+
+def is_waiting_request() -> bool:
+    """Return whether the current request waits for change notifications."""
+
+    if request.endpoint in WAITING_ENDPOINTS:
+        return True
+
+    query_arg = WAITING_QUERY_ENDPOINTS.get(request.endpoint)
+    return query_arg is not None and query_arg in request.args
+
+
+class PoolWaitAverage:
+    """An exponentially weighted moving average of pool wait times.
+
+    The average decays towards zero while no new values are observed.
+    """
+
+    def __init__(
+        self,
+        smoothing_factor: float = POOL_WAIT_SMOOTHING_FACTOR,
+        half_life_seconds: float = POOL_WAIT_HALF_LIFE_SECONDS,
+    ):
+        assert 0.0 < smoothing_factor <= 1.0
+        assert half_life_seconds > 0.0
+        self.smoothing_factor = smoothing_factor
+        self.decay_rate = math.log(2) / half_life_seconds
+        self._lock = threading.Lock()
+        self._value = 0.0
+        self._updated_at = time.monotonic()
+
+    def _get_decayed_value(self, now: float) -> float:
+        elapsed_seconds = max(now - self._updated_at, 0.0)
+        return self._value * math.exp(-self.decay_rate * elapsed_seconds)
+
+    def observe(self, seconds: float) -> None:
+        now = time.monotonic()
+        with self._lock:
+            value = self._get_decayed_value(now)
+            self._value = value + self.smoothing_factor * (seconds - value)
+            self._updated_at = now
+
+    def get(self) -> float:
+        return self._get_decayed_value(time.monotonic())
+
+
+class AdmissionState:
+    """The load of a web server process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.in_flight_requests = 0
+        self.pool_wait = PoolWaitAverage()
+
+    def enter(self) -> None:
+        with self._lock:
+            self.in_flight_requests += 1
+        IN_FLIGHT_REQUESTS.inc()
+
+    def leave(self) -> None:
+        with self._lock:
+            self.in_flight_requests -= 1
+        IN_FLIGHT_REQUESTS.dec()
+
+
+class AdmissionControl:
+    """Reject requests when the web server process is overloaded.
+
+    Every limit can be disabled by setting it to zero. `init_app` must
+    be called after `RequestInstrumentation.init_app`, so that the
+    pool wait times are still available when the requests end.
+    """
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["swpt_admission"] = AdmissionState()
+        app.before_request(self._admit_request)
+        app.teardown_request(self._release_request)
+
+    def _admit_request(self):
+        priority = get_request_priority()
+        if priority is None:
+            return
+
+        state = current_app.extensions["swpt_admission"]
+        reason = self._get_rejection_reason(state, priority)
+        if reason is not None:
+            SHED_REQUESTS.inc(priority=priority, reason=reason)
+            retry_after = current_app.config[
+                "APP_ADMISSION_RETRY_AFTER_SECONDS"
+            ]
+            abort(503, headers={"Retry-After": str(retry_after)})
+
+        g.swpt_counted = not is_waiting_request()
+        if g.swpt_counted:
+            state.enter()
+
+    def _get_rejection_reason(
+        self, state: AdmissionState, priority: str
+    ) -> Optional[str]:
+        config = current_app.config
+        if priority == PRIORITY_LOW:
+            max_requests = config["APP_ADMISSION_LOW_PRIORITY_MAX_REQUESTS"]
+            max_pool_wait = config["APP_ADMISSION_LOW_PRIORITY_MAX_POOL_WAIT"]
+        else:
+            max_requests = config["APP_ADMISSION_MAX_REQUESTS"]
+            max_pool_wait = config["APP_ADMISSION_MAX_POOL_WAIT"]
+
+        if 0 < max_requests <= state.in_flight_requests:
+            return "in_flight"
+
+        if 0.0 < max_pool_wait < state.pool_wait.get():
+            return "pool_wait"
+
+        return None
+
+    def _release_request(self, exc):
+        counted = g.pop("swpt_counted", None)
+        if counted is None:
+            return
+
+        state = current_app.extensions["swpt_admission"]
+        if counted:
+            state.leave()
+
+        stats = get_request_stats()
+        if stats is not None and stats.statements > 0:
+            state.pool_wait.observe(stats.pool_wait_seconds)
@@ -0,0 +1,707 @@
+"""An optional ASGI application, serving the read endpoints asynchronously.
+
+The read-heavy endpoints (debtor, debtor's config, transfers list,
+transfer, document, and the public info document redirect) are served
+by coroutines, which use a shared pool of asynchronous psycopg 3
+connections. While a request waits for the database, for a slow
+client, or for the finalization of a transfer, no thread is held. All
+other requests (including all requests that modify data) are passed
+to the ordinary WSGI application, which runs in a thread pool, and
+uses the synchronous `procedures`. The streams of debtor's change
+events are generated by coroutines too, and are sent chunk by chunk.
+An open stream holds no thread and no database connection.
+
+The coroutines run within a normal Flask request context, so that
+the same `before_request` hooks (authorization), error handlers,
+`after_request` hooks (CORS), serializers, and schemas are used, as
+in the WSGI application. The hooks are synchronous, and therefore
+they are executed in the thread pool, not in the event loop. Note
+that the asynchronous endpoints always read from the primary
+database. Request bodies larger than `MAX_CONTENT_LENGTH` are
+rejected, before they are read in the memory.
+
+An ASGI server (uvicorn, for example) must be installed separately.
+
+"""
+
+import io
+import sys
+import time
+import asyncio
+import contextvars
+from functools import partial
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+)
+from flask import Flask, Response, request, request_started
+from flask_smorest import abort
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
+from marshmallow import EXCLUDE, ValidationError
+from werkzeug.middleware.proxy_fix import ProxyFix
+from sqlalchemy.sql.expression import Select
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
+from swpt_debtors import create_app, PROXY_FIX_OPTIONS
+from swpt_debtors import procedures
+from swpt_debtors.models import (
+    Debtor,
+    RunningTransfer,
+    calc_debtor_etag,
+    is_valid_debtor_id,
+)
+from swpt_debtors.schemas import (
+    TransfersList,
+    TransfersListSchema,
+    TransferParamsSchema,
+)
+from swpt_debtors.serializers import (
+    serialize_debtor,
+    serialize_debtor_config,
+    serialize_transfer,
+)
+from swpt_debtors.extensions import (
+    debtor_info_cache,
+    document_cache,
+    change_listener,
+)
+from swpt_debtors.notifications import (
+    AsyncSubscription,
+    TooManySubscriptions,
+)
+from swpt_debtors.instrumentation import TimedAsyncQueuePool
+from swpt_debtors.routes import (
+    context,
+    make_json_response,
+    make_not_modified_response,
+    make_debtor_headers,
+    calc_transfer_wait_seconds,
+    is_transfer_wait_over,
+    may_finalize_transfer,
+    get_debtor_info,
+    make_debtor_info_redirect,
+    make_cached_document,
+    can_defer_document_content,
+    make_document_metadata_response,
+    make_document_response,
+    DebtorEventStream,
+    DEBTOR_EVENTS_MIMETYPE,
+    DEBTOR_EVENTS_HEADERS,
+)
+
+ASYNC_METHODS = frozenset(["GET", "HEAD"])
+
+AsgiHeaders = List[Tuple[bytes, bytes]]
+
+
+class AsyncReadsApp:
+    """An ASGI application which wraps a Flask application."""
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self._engine: Optional[AsyncEngine] = None
+        self._handlers: Dict[str, Callable[..., Awaitable[Any]]] = {
+            "debtors.DebtorEndpoint": self.get_debtor,
+            "debtors.DebtorConfigEndpoint": self.get_debtor_config,
+            "debtors.DebtorEventsEndpoint": self.get_debtor_events,
+            "transfers.TransfersListEndpoint": self.get_transfers_list,
+            "transfers.TransferEndpoint": self.get_transfer,
+            "documents.DocumentEndpoint": self.get_document,
+            "documents.RedirectToDebtorsInfoEndpoint": (
+                self.redirect_to_debtors_info
+            ),
+        }
+
+        # Obtains the WSGI environment, as modified by the `ProxyFix`
+        # middleware which the WSGI application uses.
+        self._fix_environ = ProxyFix(
+            lambda environ, start_response: environ, **PROXY_FIX_OPTIONS
+        )
+
+    @property
+    def engine(self) -> AsyncEngine:
+        if self._engine is None:
+            config = self.app.config
+            self._engine = create_async_engine(
+                config["SQLALCHEMY_DATABASE_URI"],
+                poolclass=TimedAsyncQueuePool,
+                pool_size=config["APP_ASYNC_DB_POOL_SIZE"],
+                max_overflow=0,
+            )
+        return self._engine
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "lifespan":
+            await self._serve_lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._serve_http(scope, receive, send)
+        else:  # pragma: no cover
+            raise RuntimeError(f'Unsupported scope type: {scope["type"]}')
+
+    async def _serve_lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self._engine is not None:
+                    await self._engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _serve_http(self, scope, receive, send) -> None:
+        max_length = self.app.config["MAX_CONTENT_LENGTH"]
+        content_length = _get_content_length(scope)
+        body = bytearray()
+        more_body = True
+        while more_body and not _exceeds(content_length, max_length):
+            message = await receive()
+            body.extend(message.get("body", b""))
+            more_body = message.get("more_body", False)
+            content_length = max(content_length or 0, len(body))
+
+        environ = _make_environ(scope, bytes(body))
+        if _exceeds(content_length, max_length):
+            endpoint = None
+            handler = _raise_request_entity_too_large
+            view_args: dict = {}
+        else:
+            endpoint, view_args = self._match_endpoint(environ)
+            handler = self._get_handler(environ, endpoint)
+
+        if handler is None:
+            status, headers, content = await asyncio.to_thread(
+                _call_wsgi_app, self.app, environ
+            )
+            await _send_response(send, status, headers, content)
+            return
+
+        status, headers, content, streamed_body = await self._call_handler(
+            handler, self._fix_environ(environ, None), view_args
+        )
+        if streamed_body is None:
+            await _send_response(send, status, headers, content)
+        else:
+            await _send_streamed_response(
+                receive, send, status, headers, streamed_body
+            )
+
+    def _get_handler(self, environ, endpoint):
+        if environ["REQUEST_METHOD"] not in ASYNC_METHODS:
+            return None
+
+        return self._handlers.get(endpoint)
+
+    def _match_endpoint(self, environ):
+        adapter = self.app.url_map.bind_to_environ(environ)
+        try:
+            return adapter.match()
+        except HTTPException:
+            return None, None
+
+    async def _call_handler(
+        self, handler, environ, view_args
+    ) -> Tuple[int, AsgiHeaders, bytes, Optional["_StreamedBody"]]:
+        app = self.app
+        loop = asyncio.get_running_loop()
+
+        # NOTE: The synchronous parts of the request processing (the
+        # hooks, for example) may block, and therefore they are
+        # executed in the thread pool. All parts are executed in the
+        # same context, so that the context variables which the hooks
+        # set are visible to the handler and to the other hooks.
+        ctx = contextvars.copy_context()
+
+        def run_sync(func, *args, **kwargs) -> Awaitable[Any]:
+            return loop.run_in_executor(
+                None, partial(ctx.run, func, *args, **kwargs)
+            )
+
+        request_context = app.request_context(environ)
+        ctx.run(request_context.push)
+        streamed_body = None
+        try:
+            # NOTE: This is `Flask.full_dispatch_request`, except that
+            # the view function is replaced with the handler coroutine.
+            try:
+                try:
+                    await run_sync(
+                        request_started.send,
+                        app,
+                        _async_wrapper=app.ensure_sync,
+                    )
+                    rv = await run_sync(app.preprocess_request)
+                    if rv is None:
+                        rv = await ctx.run(
+                            asyncio.ensure_future, handler(**view_args)
+                        )
+                except Exception as e:
+                    rv = await run_sync(app.handle_user_exception, e)
+                response = await run_sync(app.finalize_request, rv)
+            except Exception as e:
+                response = await run_sync(app.handle_exception, e)
+
+            status, headers, content, response = await run_sync(
+                _encode_response, response, environ
+            )
+            if response is not None:
+                # NOTE: Like with `flask.stream_with_context`, the
+                # request context is popped only after the streamed
+                # body has been generated.
+                streamed_body = _StreamedBody(
+                    response, ctx, partial(run_sync, request_context.pop)
+                )
+            return status, headers, content, streamed_body
+        finally:
+            if streamed_body is None:
+                await run_sync(request_context.pop)
+
+    def _session(self) -> AsyncSession:
+        return AsyncSession(self.engine)
+
+    async def _execute_one(self, stmt: Select, scalar: bool = True):
+        # Executes a statement built by one of the `procedures.select_*`
+        # functions, and returns the one resulting row, or `None`.
+        async with self._session() as session:
+            result = await session.execute(stmt)
+            return (result.scalars() if scalar else result).one_or_none()
+
+    async def _get_active_debtor(
+        self, debtor_id: int, defer_toasted: bool = False
+    ) -> Optional[Debtor]:
+        return await self._execute_one(
+            procedures.select_debtor(
+                debtor_id, active=True, defer_toasted=defer_toasted
+            )
+        )
+
+    async def _get_debtor(
+        self,
+        debtor_id: int,
+        error_code: int,
+        serialize: Callable[[Debtor, dict], dict],
+    ):
+        # The asynchronous counterpart of
+        # `routes.get_active_debtor_or_not_modified`.
+        environ = request.environ
+        if environ.get("HTTP_IF_NONE_MATCH"):
+            row = await self._execute_one(
+                procedures.select_active_debtor_version(debtor_id),
+                scalar=False,
+            )
+            if row is None:
+                abort(error_code)
+
+            response = make_not_modified_response(
+                environ, calc_debtor_etag(row)
+            )
+            if response is not None:
+                return response
+
+        debtor = await self._get_active_debtor(debtor_id) or abort(error_code)
+        return make_json_response(
+            serialize(debtor, context), make_debtor_headers(debtor)
+        )
+
+    async def get_debtor(self, debtorId: int):
+        return await self._get_debtor(debtorId, 403, serialize_debtor)
+
+    async def get_debtor_config(self, debtorId: int):
+        return await self._get_debtor(debtorId, 404, serialize_debtor_config)
+
+    async def get_debtor_events(self, debtorId: int):
+        debtor = await self._get_active_debtor(debtorId, defer_toasted=True)
+        if debtor is None:
+            abort(403)
+
+        try:
+            subscription = await change_listener.subscribe_async(debtorId)
+        except TooManySubscriptions:
+            abort(503)
+
+        response = _StreamedResponse(
+            _generate_debtor_events(
+                subscription, DebtorEventStream(debtorId, self.app.config)
+            ),
+            mimetype=DEBTOR_EVENTS_MIMETYPE,
+            headers=DEBTOR_EVENTS_HEADERS,
+        )
+        response.call_on_close(subscription.close)
+        return response
+
+    async def get_transfers_list(self, debtorId: int):
+        # The asynchronous counterpart of
+        # `procedures.get_debtor_transfer_uuids`.
+        async with self._session() as session:
+            debtor = (
+                await session.execute(
+                    procedures.select_debtor(
+                        debtorId, active=True, defer_toasted=True
+                    )
+                )
+            ).scalars().one_or_none() or abort(404)
+
+            transfer_uuids = (
+                await session.execute(
+                    procedures.select_debtor_transfer_uuids(debtor.debtor_id)
+                )
+            ).scalars().all()
+
+        data = TransfersListSchema(context=context).dump(
+            TransfersList(debtor_id=debtorId, items=transfer_uuids)
+        )
+        return make_json_response(data)
+
+    async def get_transfer(self, debtorId: int, transferUuid):
+        try:
+            params = TransferParamsSchema().load(
+                request.args, unknown=EXCLUDE
+            )
+        except ValidationError as e:
+            abort(422, errors={"query": e.messages})
+
+        if params.get("wait_for") == "finalization":
+            timeout = calc_transfer_wait_seconds(
+                params["timeout"], self.app.config, blocking=False
+            )
+            transfer = await self._wait_for_transfer_finalization(
+                debtorId, transferUuid, timeout
+            ) or abort(404)
+        else:
+            transfer = await self._get_running_transfer(
+                debtorId, transferUuid
+            ) or abort(404)
+
+        return make_json_response(serialize_transfer(transfer, context))
+
+    async def _get_running_transfer(
+        self, debtor_id: int, transfer_uuid
+    ) -> Optional[RunningTransfer]:
+        return await self._execute_one(
+            procedures.select_running_transfer(debtor_id, transfer_uuid)
+        )
+
+    async def _wait_for_transfer_finalization(
+        self, debtor_id: int, transfer_uuid, timeout: float
+    ) -> Optional[RunningTransfer]:
+        # The asynchronous counterpart of
+        # `routes.wait_for_transfer_finalization`. No database
+        # connection and no thread is held while waiting.
+        deadline = time.monotonic() + timeout
+        try:
+            subscription = await change_listener.subscribe_async(debtor_id)
+        except TooManySubscriptions:
+            return await self._get_running_transfer(debtor_id, transfer_uuid)
+
+        try:
+            while True:
+                transfer = await self._get_running_transfer(
+                    debtor_id, transfer_uuid
+                )
+                if is_transfer_wait_over(transfer):
+                    return transfer
+
+                while True:
+                    change = await subscription.get_async(
+                        deadline - time.monotonic()
+                    )
+                    if change is None:
+                        return transfer
+                    if may_finalize_transfer(change, transfer_uuid):
+                        break
+        finally:
+            subscription.close()
+
+    async def get_document(self, debtorId: int, documentId: int):
+        if not is_valid_debtor_id(debtorId):  # pragma: no cover
+            abort(404)
+
+        environ = request.environ
+        cached_document = document_cache.get(debtorId, documentId)
+        if cached_document is not None:
+            return make_document_response(environ, cached_document)
+
+        defer_content = can_defer_document_content(environ)
+        document = await self._execute_one(
+            procedures.select_document(
+                debtorId, documentId, defer_toasted=defer_content
+            )
+        ) or abort(404)
+        if defer_content:
+            response = make_document_metadata_response(environ, document)
+            if response is not None:
+                return response
+
+            document = await self._execute_one(
+                procedures.select_document(debtorId, documentId)
+            ) or abort(404)
+
+        cached_document = make_cached_document(document)
+        document_cache.set(debtorId, documentId, cached_document)
+        return make_document_response(environ, cached_document)
+
+    async def redirect_to_debtors_info(self, debtorId: int):
+        if not is_valid_debtor_id(debtorId):  # pragma: no cover
+            abort(404)
+
+        info = debtor_info_cache.get(debtorId)
+        if info is None:
+            token = debtor_info_cache.get_token()
+            debtor = await self._get_active_debtor(
+                debtorId, defer_toasted=True
+            )
+            info = get_debtor_info(debtor)
+            debtor_info_cache.set(debtorId, info, token)
+
+        return make_debtor_info_redirect(info)
+
+
+async def _raise_request_entity_too_large():
+    raise RequestEntityTooLarge()
+
+
+class _StreamedResponse(Response):
+    """A response whose body is generated by an asynchronous iterator."""
+
+    automatically_set_content_length = False
+
+    def __init__(self, async_body: AsyncIterator[str], **kwargs):
+        super().__init__(**kwargs)
+        self.async_body = async_body
+
+
+class _StreamedBody:
+    """Generates the body of a streamed response, in the request context.
+
+    `aclose` must always be called, even when no chunks have been
+    generated. It closes the response, and calls `finish`.
+    """
+
+    def __init__(
+        self,
+        response: _StreamedResponse,
+        ctx: contextvars.Context,
+        finish: Callable[[], Awaitable[Any]],
+    ):
+        self.response = response
+        self.ctx = ctx
+        self.finish = finish
+        self.closed = False
+
+    async def next_chunk(self) -> Optional[bytes]:
+        """Return the next chunk, or `None` if there are no more chunks."""
+
+        try:
+            chunk = await self.ctx.run(
+                asyncio.ensure_future, self.response.async_body.__anext__()
+            )
+        except StopAsyncIteration:
+            return None
+
+        return chunk.encode("utf8") if isinstance(chunk, str) else chunk
+
+    async def aclose(self) -> None:
+        if self.closed:
+            return
+
+        self.closed = True
+        try:
+            await self.ctx.run(
+                asyncio.ensure_future, self.response.async_body.aclose()
+            )
+            self.ctx.run(self.response.close)
+        finally:
+            await self.finish()
+
+
+async def _generate_debtor_events(
+    subscription: AsyncSubscription, stream: DebtorEventStream
+) -> AsyncIterator[str]:
+    yield stream.get_reset_event()
+    while (wait_seconds := stream.get_wait_seconds()) is not None:
+        change = await subscription.get_async(wait_seconds)
+        event = stream.format_change(change)
+        if event is not None:
+            yield event
+
+
+def _encode_response(
+    response: Response, environ
+) -> Tuple[int, AsgiHeaders, bytes, Optional[_StreamedResponse]]:
+    # Streamed responses are returned unclosed, along with an empty
+    # content. All other responses (and HEAD responses) are closed.
+    if (
+        isinstance(response, _StreamedResponse)
+        and environ["REQUEST_METHOD"] != "HEAD"
+    ):
+        headers = response.get_wsgi_headers(environ)
+        return (
+            response.status_code,
+            _encode_headers(headers.items()),
+            b"",
+            response,
+        )
+
+    try:
+        headers = response.get_wsgi_headers(environ)
+        content = b"".join(response.get_app_iter(environ))
+    finally:
+        response.close()
+
+    return (
+        response.status_code,
+        _encode_headers(headers.items()),
+        content,
+        None,
+    )
+
+
+async def _send_response(
+    send, status: int, headers: AsgiHeaders, content: bytes
+) -> None:
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": headers,
+        }
+    )
+    await send({"type": "http.response.body", "body": content})
+
+
+def _get_content_length(scope) -> Optional[int]:
+    for name, value in scope["headers"]:
+        if name.lower() == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+def _exceeds(length: Optional[int], max_length: Optional[int]) -> bool:
+    return length is not None and max_length is not None and (
+        length > max_length
+    )
+
+
+def _encode_headers(headers: Iterable[Tuple[str, str]]) -> AsgiHeaders:
+    return [
+        (k.lower().encode("latin1"), v.encode("latin1")) for k, v in headers
+    ]
+
+
+def _make_environ(scope, body: bytes) -> dict:
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf8").decode(
+            "latin1"
+        ),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin1"),
+        "QUERY_STRING": scope["query_string"].decode("latin1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f'HTTP/{scope.get("http_version", "1.1")}',
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    client = scope.get("client")
+    if client:
+        environ["REMOTE_ADDR"] = client[0]
+
+    for name, value in scope["headers"]:
+        name = name.decode("latin1").upper().replace("-", "_")
+        value = value.decode("latin1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            if key in environ:
+                value = f"{environ[key]},{value}"
+            environ[key] = value
+
+    return environ
+
+
+def _call_wsgi_app(wsgi_app, environ) -> Tuple[int, AsgiHeaders, bytes]:
+    response_start: list = []
+
+    def start_response(status, headers, exc_info=None):
+        response_start[:] = [status, headers]
+
+    app_iter = wsgi_app(environ, start_response)
+    try:
+        content = b"".join(app_iter)
+    finally:
+        if hasattr(app_iter, "close"):
+            app_iter.close()
+
+    status, headers = response_start
+    return int(status.split(" ", 1)[0]), _encode_headers(headers), content
+
+
+async def _send_streamed_response(
+    receive,
+    send,
+    status: int,
+    headers: AsgiHeaders,
+    body: _StreamedBody,
+) -> None:
+    # Each chunk of the response body is sent as soon as it has been
+    # generated. The generation stops when the client disconnects.
+    async def send_body() -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": headers,
+            }
+        )
+        while (chunk := await body.next_chunk()) is not None:
+            await send(
+                {
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": True,
+                }
+            )
+        await send({"type": "http.response.body", "body": b""})
+
+    async def wait_for_disconnect() -> None:
+        while (await receive())["type"] != "http.disconnect":
+            pass  # pragma: no cover
+
+    sending = asyncio.ensure_future(send_body())
+    waiting = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        await asyncio.wait(
+            [sending, waiting], return_when=asyncio.FIRST_COMPLETED
+        )
+        if sending.done():
+            sending.result()
+    finally:
+        sending.cancel()
+        waiting.cancel()
+        await asyncio.gather(sending, waiting, return_exceptions=True)
+        await body.aclose()
+
+
+def create_asgi_app(config_dict={}) -> AsyncReadsApp:
+    return AsyncReadsApp(create_app(config_dict))
@@ -0,0 +1,258 @@
+"""In-process caches, shared by the threads of a web server process.
+
+Mutable data is cached for a limited time, and the cached entries are
+also invalidated by the change notifications that the database sends
+(see `notifications`). Immutable data (saved documents) is cached
+until evicted. The lookups are counted in the
+`swpt_debtors_cache_lookups_total` metric, so that the hit rates can
+be monitored.
+
+"""
+
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable, NamedTuple, Optional, Tuple
+from flask import Flask, current_app
+from swpt_debtors import metrics
+from swpt_debtors.notifications import (
+    Change,
+    ChangeListener,
+    CHANGE_DEBTOR_INFO_CHANGED,
+)
+
+CACHE_LOOKUPS = metrics.Counter(
+    "swpt_debtors_cache_lookups_total",
+    "The number of in-process cache lookups, by cache and result.",
+)
+CACHE_INVALIDATIONS = metrics.Counter(
+    "swpt_debtors_cache_invalidations_total",
+    "The number of invalidated in-process cache entries, by cache.",
+)
+DOCUMENT_CACHE_BYTES = metrics.Gauge(
+    "swpt_debtors_document_cache_bytes",
+    "The total size of the documents in the in-process document cache.",
+)
+
+# The value of a cached debtor info redirect: a status code (302, 404,
+# or 410), and the redirect location (for 302).
+DebtorInfo = Tuple[int, Optional[str]]
+
+
+class TtlLruCache:
+    """A bounded, thread-safe LRU cache, whose entries expire.
+
+    A value that has been read before an invalidation must not be
+    cached after it. Therefore, callers obtain a token (see
+    `get_token`) before reading the value, and pass it to `set`.
+    """
+
+    def __init__(self, name: str, max_entries: int):
+        self.name = name
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+        self._invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                else:
+                    del self._entries[key]
+                    entry = None
+
+        if entry is None:
+            CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+            return default
+
+        CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+        return value
+
+    def get_token(self) -> int:
+        return self._invalidations
+
+    def set(
+        self, key: Hashable, value: Any, ttl_seconds: float, token: int
+    ) -> None:
+        expires_at = time.monotonic() + ttl_seconds
+        with self._lock:
+            if token != self._invalidations:
+                return
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._invalidations += 1
+            self._entries.pop(key, None)
+
+        CACHE_INVALIDATIONS.inc(cache=self.name)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+
+        CACHE_INVALIDATIONS.inc(cache=self.name)
+
+
+class ByteBudgetLruCache:
+    """A thread-safe LRU cache, bounded by the total size of the values.
+
+    Values bigger than `max_bytes` are not cached. The total size of
+    the cached values is tracked in `size_gauge` (if given).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int,
+        size_gauge: Optional[metrics.Gauge] = None,
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.size_gauge = size_gauge
+        self.total_bytes = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        if entry is None:
+            CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+            return default
+
+        CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any, size: int) -> None:
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            bytes_delta = size
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                bytes_delta -= old_entry[0]
+            self._entries[key] = (size, value)
+            while self.total_bytes + bytes_delta > self.max_bytes:
+                evicted_size, _ = self._entries.popitem(last=False)[1]
+                bytes_delta -= evicted_size
+            self.total_bytes += bytes_delta
+
+        if self.size_gauge is not None:
+            self.size_gauge.inc(bytes_delta)
+
+
+class CachedDocument(NamedTuple):
+    content_type: str
+    content: bytes
+    etag: str
+    inserted_at: datetime
+    content_encoding: Optional[str] = None
+
+
+class DocumentCache:
+    """Cache the contents of saved documents.
+
+    Saved documents never change, so the cached documents never need
+    to be invalidated. (Only the documents of deleted debtors may
+    continue to be served, until evicted from the cache.) Compressed
+    documents are cached compressed. Unless the document has to be
+    decompressed for the client, the cached content is the very
+    `bytes` object that is passed to the web server, so serving a
+    cached document does not copy it.
+
+    Note that the contents are deliberately cached as `bytes`, not as
+    `memoryview` objects. Since `bytes` objects are immutable, sharing
+    them between requests is already zero-copy. Also, WSGI requires
+    the response body to consist of `bytes`, so a `memoryview` would
+    have to be copied back into `bytes` on every response.
+    """
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["swpt_document_cache"] = ByteBudgetLruCache(
+            "document",
+            app.config["APP_DOCUMENT_CACHE_MAX_BYTES"],
+            DOCUMENT_CACHE_BYTES,
+        )
+
+    def get(
+        self, debtor_id: int, document_id: int
+    ) -> Optional[CachedDocument]:
+        return self._get_cache().get((debtor_id, document_id))
+
+    def set(
+        self, debtor_id: int, document_id: int, document: CachedDocument
+    ) -> None:
+        self._get_cache().set(
+            (debtor_id, document_id), document, len(document.content)
+        )
+
+    def _get_cache(self) -> ByteBudgetLruCache:
+        return current_app.extensions["swpt_document_cache"]
+
+
+class DebtorInfoCache:
+    """Cache the redirects to debtors' public info documents.
+
+    The entries are invalidated when the debtor's info IRI changes.
+    Negative entries (not active debtors, and debtors without an info
+    IRI) are cached for a shorter time.
+    """
+
+    def __init__(self, change_listener: ChangeListener):
+        self.change_listener = change_listener
+
+    def init_app(self, app: Flask) -> None:
+        cache = TtlLruCache(
+            "debtor_info", app.config["APP_DEBTOR_INFO_CACHE_MAX_ENTRIES"]
+        )
+        app.extensions["swpt_debtor_info_cache"] = cache
+
+        def handle_change(change: Optional[Change]) -> None:
+            if change is None:
+                cache.clear()
+            elif change.change_type == CHANGE_DEBTOR_INFO_CHANGED:
+                cache.invalidate(change.debtor_id)
+
+        self.change_listener.add_callback(app, handle_change)
+
+    def get(self, debtor_id: int) -> Optional[DebtorInfo]:
+        return self._get_cache().get(debtor_id)
+
+    def get_token(self) -> int:
+        # The cache can not be trusted, unless we are listening for
+        # invalidations.
+        self.change_listener.start()
+        return self._get_cache().get_token()
+
+    def set(self, debtor_id: int, info: DebtorInfo, token: int) -> None:
+        config = current_app.config
+        ttl_seconds = (
+            config["APP_DEBTOR_INFO_CACHE_TTL_SECONDS"]
+            if info[0] == 302
+            else config["APP_DEBTOR_INFO_CACHE_NEGATIVE_TTL_SECONDS"]
+        )
+        self._get_cache().set(debtor_id, info, ttl_seconds, token)
+
+    def _get_cache(self) -> TtlLruCache:
+        return current_app.extensions["swpt_debtor_info_cache"]
@@ -6,15 +6,16 @@ import signal
 import random
 import pika
 import click
-from typing import Optional, Any
+from typing import Optional, Any, List
 from datetime import timedelta
 from sqlalchemy import select
 from flask import current_app
 from flask.cli import with_appcontext
 from flask_sqlalchemy.model import Model
-from swpt_pythonlib.utils import ShardingRealm
+from swpt_pythonlib.utils import ShardingRealm, u64_to_i64
 from swpt_debtors.extensions import db
-from swpt_debtors.table_scanners import DebtorScanner
+from swpt_debtors.table_scanners import DebtorScanner, DocumentBlobScanner
+from swpt_debtors.metrics import start_metrics_server
 from swpt_pythonlib.multiproc_utils import (
     spawn_worker_processes,
     try_unblock_signals,
@@ -282,28 +283,214 @@ def verify_shard_content():
 @swpt_debtors.command("scan_debtors")
 @with_appcontext
 @click.option("-d", "--days", type=float, help="The number of days.")
+@click.option(
+    "-m",
+    "--metrics-port",
+    type=int,
+    help="The local port on which to expose scanner's metrics.",
+)
 @click.option(
     "--quit-early",
     is_flag=True,
     default=False,
     help="Exit after some time (mainly useful during testing).",
 )
-def scan_debtors(days, quit_early):
+def scan_debtors(days, metrics_port, quit_early):
     """Start a process that garbage-collects inactive debtors.
 
     The specified number of days determines the intended duration of a
     single pass through the debtors table. If the number of days is
     not specified, the default is 7 days.
+
+    If a metrics port is specified (or the APP_DEBTORS_SCAN_METRICS_PORT
+    environment variable is set), scanner's metrics will be exposed in
+    Prometheus text format on http://127.0.0.1:<metrics-port>/metrics.
     """
 
     logger = logging.getLogger(__name__)
     logger.info("Started debtors scanner.")
     days = days or current_app.config["APP_DEBTORS_SCAN_DAYS"]
     assert days > 0.0
+    metrics_port = (
+        metrics_port or current_app.config["APP_DEBTORS_SCAN_METRICS_PORT"]
+    )
+    if metrics_port:  # pragma: no cover
+        start_metrics_server(metrics_port)
+        logger.info("Exposing scanner metrics on port %i.", metrics_port)
+
     scanner = DebtorScanner()
     scanner.run(db.engine, timedelta(days=days), quit_early=quit_early)
 
 
+@swpt_debtors.command("scan_document_blobs")
+@with_appcontext
+@click.option("-d", "--days", type=float, help="The number of days.")
+@click.option(
+    "--quit-early",
+    is_flag=True,
+    default=False,
+    help="Exit after some time (mainly useful during testing).",
+)
+def scan_document_blobs(days, quit_early):
+    """Start a process that garbage-collects unreferenced document blobs.
+
+    The specified number of days determines the intended duration of a
+    single pass through the document blobs table. If the number of
+    days is not specified, the default is 7 days.
+    """
+
+    logger = logging.getLogger(__name__)
+    logger.info("Started document blobs scanner.")
+    days = days or current_app.config["APP_DOCUMENT_BLOBS_SCAN_DAYS"]
+    assert days > 0.0
+    scanner = DocumentBlobScanner()
+    scanner.run(db.engine, timedelta(days=days), quit_early=quit_early)
+
+
+def _read_debtor_ids(debtor_ids, file) -> List[int]:
+    from swpt_debtors.models import is_valid_debtor_id, MAX_UINT64
+
+    logger = logging.getLogger(__name__)
+    lines = list(debtor_ids)
+    if file is not None:
+        lines.extend(line.strip() for line in file)
+
+    result = []
+    for line in lines:
+        if not line:
+            continue
+        try:
+            n = int(line)
+            if not 0 <= n <= MAX_UINT64:
+                raise ValueError
+            debtor_id = u64_to_i64(n)
+            if not is_valid_debtor_id(debtor_id):
+                raise ValueError
+        except ValueError:
+            logger.warning('Skipped invalid debtor ID "%s".', line)
+            continue
+        result.append(debtor_id)
+
+    return result
+
+
+def _process_debtors_in_chunks(procedure, debtor_ids, chunk_size, *args):
+    logger = logging.getLogger(__name__)
+    total_count = len(debtor_ids)
+    processed_count = 0
+    for i in range(0, total_count, chunk_size):
+        chunk = debtor_ids[i:i + chunk_size]
+        processed_count += len(procedure(chunk, *args))
+        logger.info(
+            "Processed %i of %i debtors (%i successfully).",
+            min(i + chunk_size, total_count),
+            total_count,
+            processed_count,
+        )
+
+    return processed_count
+
+
+_debtor_ids_argument = click.argument("debtor_ids", nargs=-1)
+_file_option = click.option(
+    "-f",
+    "--file",
+    type=click.File("r"),
+    help="Read debtor IDs from a file (one ID per line, or '-' for stdin).",
+)
+_chunk_size_option = click.option(
+    "-c",
+    "--chunk-size",
+    type=int,
+    help="The number of debtors to process in a single transaction.",
+)
+
+
+@swpt_debtors.command("activate_debtors")
+@with_appcontext
+@_file_option
+@_chunk_size_option
+@_debtor_ids_argument
+def activate_debtors(file, chunk_size, debtor_ids):
+    """Create and activate many new debtors at once.
+
+    Debtor IDs can be passed as arguments, and/or read from a file.
+    Debtor IDs which are already taken will be skipped. If the chunk
+    size is not specified, the value of the APP_DEBTORS_BULK_CHUNK_SIZE
+    environment variable will be used (default 500).
+    """
+
+    from swpt_debtors import procedures
+
+    _process_debtors_in_chunks(
+        procedures.activate_debtors,
+        _read_debtor_ids(debtor_ids, file),
+        chunk_size or current_app.config["APP_DEBTORS_BULK_CHUNK_SIZE"],
+    )
+
+
+@swpt_debtors.command("deactivate_debtors")
+@with_appcontext
+@_file_option
+@_chunk_size_option
+@_debtor_ids_argument
+def deactivate_debtors(file, chunk_size, debtor_ids):
+    """Deactivate many debtors at once.
+
+    Debtor IDs can be passed as arguments, and/or read from a file.
+    Debtors that do not exist, or are not active, will be skipped. If
+    the chunk size is not specified, the value of the
+    APP_DEBTORS_BULK_CHUNK_SIZE environment variable will be used
+    (default 500).
+    """
+
+    from swpt_debtors import procedures
+
+    _process_debtors_in_chunks(
+        procedures.deactivate_debtors,
+        _read_debtor_ids(debtor_ids, file),
+        chunk_size or current_app.config["APP_DEBTORS_BULK_CHUNK_SIZE"],
+    )
+
+
+@swpt_debtors.command("restrict_debtors")
+@with_appcontext
+@click.option(
+    "-b",
+    "--min-balance",
+    type=int,
+    required=True,
+    help="The minimal allowed balance (a negative number or zero).",
+)
+@_file_option
+@_chunk_size_option
+@_debtor_ids_argument
+def restrict_debtors(min_balance, file, chunk_size, debtor_ids):
+    """Restrict the maximum amounts that many debtors are allowed to issue.
+
+    Debtor IDs can be passed as arguments, and/or read from a file.
+    Debtors that do not exist, or are not active, will be skipped. If
+    the chunk size is not specified, the value of the
+    APP_DEBTORS_BULK_CHUNK_SIZE environment variable will be used
+    (default 500).
+    """
+
+    from swpt_debtors.models import MIN_INT64
+    from swpt_debtors import procedures
+
+    if not MIN_INT64 <= min_balance <= 0:
+        raise click.BadParameter(
+            "must be a negative number or zero.", param_hint="--min-balance"
+        )
+
+    _process_debtors_in_chunks(
+        procedures.restrict_debtors,
+        _read_debtor_ids(debtor_ids, file),
+        chunk_size or current_app.config["APP_DEBTORS_BULK_CHUNK_SIZE"],
+        min_balance,
+    )
+
+
 @swpt_debtors.command("consume_messages")
 @with_appcontext
 @click.option("-u", "--url", type=str, help="The RabbitMQ connection URL.")
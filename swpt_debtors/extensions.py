@@ -2,7 +2,9 @@ import warnings
 from sqlalchemy import event
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SAWarning
+from sqlalchemy.sql.expression import Select
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
 from flask_migrate import Migrate
 from swpt_pythonlib.flask_signalbus import (
     SignalBusMixin,
@@ -10,6 +12,11 @@ from swpt_pythonlib.flask_signalbus import (
 )
 from swpt_pythonlib import rabbitmq
 from flask_smorest import Api
+from .uri_builder import UriBuilder
+from .instrumentation import RequestInstrumentation
+from .admission import AdmissionControl
+from .notifications import ChangeListener
+from .caches import DebtorInfoCache, DocumentCache
 
 TO_COORDINATORS_EXCHANGE = "to_coordinators"
 TO_DEBTORS_EXCHANGE = "to_debtors"
@@ -19,6 +26,7 @@ CREDITORS_OUT_EXCHANGE = "creditors_out"
 CREDITORS_IN_EXCHANGE = "creditors_in"
 DEBTORS_OUT_EXCHANGE = "debtors_out"
 DEBTORS_IN_EXCHANGE = "debtors_in"
+REPLICA_BIND_KEY = "replica"
 
 warnings.filterwarnings(
     "ignore",
@@ -27,6 +35,32 @@ warnings.filterwarnings(
 )
 
 
+class RoutingSession(Session):
+    """A session which can send plain SELECT statements to a replica.
+
+    When `session.info["use_replica"]` is true, and a replica database
+    has been configured (see the `SQLALCHEMY_REPLICA_DATABASE_URI`
+    configuration setting), statements that only read data will be
+    executed on the replica. Everything else (flushes, locking
+    SELECTs, textual statements) still goes to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and self.info.get("use_replica")
+            and isinstance(clause, Select)
+            and clause._for_update_arg is None
+        ):
+            replica_engine = self._db.engines.get(REPLICA_BIND_KEY)
+            if replica_engine is not None:
+                return replica_engine
+
+        return super().get_bind(
+            mapper=mapper, clause=clause, bind=bind, **kwargs
+        )
+
+
 class CustomAlchemy(AtomicProceduresMixin, SignalBusMixin, SQLAlchemy):
     pass
 
@@ -39,7 +73,13 @@ def set_postgres_parametes(dbapi_connection, connection_record):
     dbapi_connection.commit()
 
 
-db = CustomAlchemy()
+db = CustomAlchemy(session_options={"class_": RoutingSession})
 migrate = Migrate()
 publisher = rabbitmq.Publisher(url_config_key="PROTOCOL_BROKER_URL")
 api = Api()
+uri_builder = UriBuilder()
+instrumentation = RequestInstrumentation()
+admission_control = AdmissionControl()
+change_listener = ChangeListener()
+debtor_info_cache = DebtorInfoCache(change_listener)
+document_cache = DocumentCache()
@@ -0,0 +1,209 @@
+"""Per-request database and serialization instrumentation.
+
+For every request, the following is measured: the number of executed
+SQL statements, the total time spent executing them, the time spent
+waiting for a connection from the pool, the time spent executing
+row-locking statements (`SELECT ... FOR UPDATE` and the like, which
+is where waiting for row locks happens), and the time spent
+serializing the response.
+
+The results are added to the response, in an "X-Logging-Context"
+header (which gets logged by gunicorn, and then removed by the API
+gateway), and optionally, in a "Server-Timing" header.
+
+"""
+
+import re
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+from flask import Flask, current_app
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+
+LOGGING_CONTEXT_HEADER = "X-Logging-Context"
+SERVER_TIMING_HEADER = "Server-Timing"
+
+_LOCKING_STATEMENT_REGEX = re.compile(
+    r"\bFOR\s+(?:NO\s+KEY\s+)?UPDATE\b|\bFOR\s+(?:KEY\s+)?SHARE\b"
+)
+
+
+class RequestStats:
+    __slots__ = (
+        "statements",
+        "db_seconds",
+        "pool_wait_seconds",
+        "lock_wait_seconds",
+        "serialization_seconds",
+        "serialization_depth",
+    )
+
+    def __init__(self):
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.lock_wait_seconds = 0.0
+        self.serialization_seconds = 0.0
+        self.serialization_depth = 0
+
+    def get_logging_context(self) -> str:
+        return (
+            f"sql={self.statements}"
+            f" db={1000 * self.db_seconds:.1f}ms"
+            f" pool={1000 * self.pool_wait_seconds:.1f}ms"
+            f" lock={1000 * self.lock_wait_seconds:.1f}ms"
+            f" ser={1000 * self.serialization_seconds:.1f}ms"
+        )
+
+    def get_server_timing(self) -> str:
+        metrics = [
+            ("db", f"SQL statements: {self.statements}", self.db_seconds),
+            ("pool", "Pool wait", self.pool_wait_seconds),
+            ("lock", "Locking statements", self.lock_wait_seconds),
+            ("ser", "Serialization", self.serialization_seconds),
+        ]
+        return ", ".join(
+            f'{name};desc="{description}";dur={1000 * seconds:.3f}'
+            for name, description, seconds in metrics
+        )
+
+
+_current_stats: ContextVar[Optional[RequestStats]] = ContextVar(
+    "swpt_debtors_request_stats", default=None
+)
+
+
+def get_request_stats() -> Optional[RequestStats]:
+    """Return the statistics for the current request, if any."""
+
+    return _current_stats.get()
+
+
+@contextmanager
+def measure_serialization():
+    """Add the time spent in the block to the serialization time.
+
+    Can be nested, and can be used as a function decorator.
+    """
+
+    stats = _current_stats.get()
+    if stats is None:
+        yield
+        return
+
+    stats.serialization_depth += 1
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialization_depth -= 1
+        if stats.serialization_depth == 0:
+            stats.serialization_seconds += time.perf_counter() - started_at
+
+
+class _TimedPoolMixin:
+    def _do_get(self):
+        stats = _current_stats.get()
+        if stats is None:
+            return super()._do_get()
+
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            stats.pool_wait_seconds += time.perf_counter() - started_at
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    """A `QueuePool` which measures the time spent waiting for connections."""
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    """Like `TimedQueuePool`, but for asynchronous engines.
+
+    SQLAlchemy runs the pool's code in a greenlet which shares the
+    context of the awaiting task, so the request's statistics are
+    available here as well.
+    """
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """A JSON provider which measures the time spent in encoding JSON."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        with measure_serialization():
+            return super().dumps(obj, **kwargs)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    if _current_stats.get() is not None:
+        conn.info.setdefault("swpt_started_at", []).append(
+            time.perf_counter()
+        )
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(
+    conn, cursor, statement, parameters, context, executemany
+):
+    stats = _current_stats.get()
+    started_at_stack = conn.info.get("swpt_started_at")
+    if stats is not None and started_at_stack:
+        seconds = time.perf_counter() - started_at_stack.pop()
+        stats.statements += 1
+        stats.db_seconds += seconds
+        if _LOCKING_STATEMENT_REGEX.search(statement):
+            stats.lock_wait_seconds += seconds
+
+
+class RequestInstrumentation:
+    """Collect and report per-request statistics.
+
+    `init_app` must be called before the database extension is
+    initialized, so that the connection pool can be instrumented.
+    """
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        if app.config["SQLALCHEMY_DATABASE_URI"].startswith("postgresql"):
+            app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+                "poolclass": TimedQueuePool,
+                **app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {}),
+            }
+
+        app.json = TimedJSONProvider(app)
+        app.before_request(self._start_request_stats)
+        app.after_request(self._report_request_stats)
+        app.teardown_request(self._stop_request_stats)
+
+    def _start_request_stats(self):
+        _current_stats.set(RequestStats())
+
+    def _report_request_stats(self, response):
+        stats = _current_stats.get()
+        if stats is not None:
+            logging_context = stats.get_logging_context()
+            previous_context = response.headers.get(LOGGING_CONTEXT_HEADER)
+            if previous_context:
+                logging_context = f"{previous_context} {logging_context}"
+            response.headers[LOGGING_CONTEXT_HEADER] = logging_context
+
+            if current_app.config["APP_ENABLE_SERVER_TIMING"]:
+                response.headers.add(
+                    SERVER_TIMING_HEADER, stats.get_server_timing()
+                )
+
+        return response
+
+    def _stop_request_stats(self, exc):
+        _current_stats.set(None)
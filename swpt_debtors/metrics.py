@@ -0,0 +1,231 @@
+"""Minimal in-process metrics, exposed in the Prometheus text format.
+
+Every process has its own metrics registry. The collected metrics can
+be exposed on a local HTTP endpoint (see `start_metrics_server`), so
+that they can be scraped by a monitoring system.
+
+"""
+
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(
+        '{}="{}"'.format(
+            k, str(v).replace("\\", r"\\").replace('"', r"\"")
+        )
+        for k, v in labels
+    )
+    return "{" + pairs + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, "Metric"] = {}
+
+    def register(self, metric: "Metric") -> None:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicated metric name: {metric.name}")
+            self._metrics[metric.name] = metric
+
+    def get(self, name: str) -> Optional["Metric"]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.collect())
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        registry: Optional[Registry] = REGISTRY,
+    ):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def collect(self) -> List[str]:  # pragma: no cover
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A monotonically increasing value, optionally split by labels."""
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        assert amount >= 0.0
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items()) or [((), 0.0)]
+
+        return [
+            f"{self.name}{_format_labels(k)} {_format_value(v)}"
+            for k, v in values
+        ]
+
+
+class Gauge(Metric):
+    """A value that can go up and down.
+
+    When `function` is given, the value will be obtained by calling
+    it, every time the metric is collected.
+    """
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        *args,
+        function: Optional[Callable[[], float]] = None,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._value = 0.0
+        self._function = function
+
+    def set(self, value: float) -> None:
+        self._value = float(value)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def get(self) -> float:
+        if self._function is not None:
+            return float(self._function())
+        return self._value
+
+    def collect(self) -> List[str]:
+        return [f"{self.name} {_format_value(self.get())}"]
+
+
+class Histogram(Metric):
+    """Counts observed values in configurable buckets."""
+
+    type = "histogram"
+    DEFAULT_BUCKETS = (
+        0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5,
+        5.0, 10.0,
+    )
+
+    def __init__(
+        self,
+        *args,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._upper_bounds = sorted(buckets) + [math.inf]
+        self._bucket_counts = [0] * len(self._upper_bounds)
+        self._sum = 0.0
+        self._count = 0
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self._sum += value
+            self._count += 1
+            for i, upper_bound in enumerate(self._upper_bounds):
+                if value <= upper_bound:
+                    self._bucket_counts[i] += 1
+                    break
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            bucket_counts = list(self._bucket_counts)
+            total_sum = self._sum
+            total_count = self._count
+
+        lines = []
+        cumulative_count = 0
+        for upper_bound, n in zip(self._upper_bounds, bucket_counts):
+            cumulative_count += n
+            labels = _format_labels([("le", _format_value(upper_bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative_count}")
+        lines.append(f"{self.name}_sum {_format_value(total_sum)}")
+        lines.append(f"{self.name}_count {total_count}")
+
+        return lines
+
+
+def start_metrics_server(
+    port: int,
+    host: str = "127.0.0.1",
+    registry: Registry = REGISTRY,
+) -> ThreadingHTTPServer:
+    """Serve the metrics from a daemon thread, and return the server."""
+
+    class MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = registry.render().encode("utf8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    return server
@@ -1,12 +1,15 @@
 from __future__ import annotations
 import json
+import gzip
+import hashlib
 from datetime import datetime, timezone
+from typing import Optional, Tuple
 from flask import current_app
 from marshmallow import Schema, fields
 from sqlalchemy import text
 from sqlalchemy.inspection import inspect
 from sqlalchemy.dialects import postgresql as pg
-from sqlalchemy.sql.expression import null, or_
+from sqlalchemy.sql.expression import null, or_, func, select, case
 from swpt_debtors.extensions import db, publisher, DEBTORS_OUT_EXCHANGE
 from swpt_pythonlib import rabbitmq
 
@@ -32,6 +35,16 @@ DISCARD_PLANS = text("DISCARD PLANS")
 
 CT_ISSUING = "issuing"
 
+DOCUMENT_COMPRESSION_MIN_BYTES = 64
+COMPRESSIBLE_CONTENT_TYPES = frozenset(
+    [
+        "application/json",
+        "application/xml",
+        "application/javascript",
+        "application/xhtml+xml",
+    ]
+)
+
 SC_OK = "OK"
 SC_UNEXPECTED_ERROR = "UNEXPECTED_ERROR"
 SC_INSUFFICIENT_AVAILABLE_AMOUNT = "INSUFFICIENT_AVAILABLE_AMOUNT"
@@ -189,15 +202,6 @@ class Debtor(db.Model, ChooseRowsMixin):
     balance = db.Column(db.BigInteger, nullable=False, default=0)
     min_balance = db.Column(db.BigInteger, nullable=False, default=MIN_INT64)
     transfer_note_max_bytes = db.Column(db.Integer, nullable=False, default=0)
-    running_transfers_count = db.Column(db.Integer, nullable=False, default=0)
-    actions_count = db.Column(db.Integer, nullable=False, default=0)
-    actions_count_reset_date = db.Column(
-        db.DATE, nullable=False, default=get_now_utc
-    )
-    documents_count = db.Column(db.Integer, nullable=False, default=0)
-    documents_count_reset_date = db.Column(
-        db.DATE, nullable=False, default=get_now_utc
-    )
     has_server_account = db.Column(db.BOOLEAN, nullable=False, default=False)
     account_creation_date = db.Column(db.DATE, nullable=False, default=DATE0)
     account_last_change_ts = db.Column(
@@ -242,7 +246,6 @@ class Debtor(db.Model, ChooseRowsMixin):
                 status_flags.op("&")(STATUS_IS_DEACTIVATED_FLAG) != 0,
             )
         ),
-        db.CheckConstraint(actions_count >= 0),
         db.CheckConstraint(min_balance <= 0),
     )
 
@@ -269,6 +272,96 @@ class Debtor(db.Model, ChooseRowsMixin):
         self.debtor_info_iri = None
 
 
+# NOTE: Every change in the debtor's state that is visible to the
+# client, is accompanied by a change in at least one of these
+# columns. Therefore, they can be used to calculate an entity tag for
+# the debtor, without reading the debtor's (possibly TOASTed) config.
+DEBTOR_VERSION_COLUMNS = [
+    Debtor.created_at,
+    Debtor.config_latest_update_id,
+    Debtor.last_config_ts,
+    Debtor.last_config_seqnum,
+    Debtor.has_server_account,
+    Debtor.account_creation_date,
+    Debtor.account_last_change_ts,
+    Debtor.account_last_change_seqnum,
+    Debtor.config_error,
+]
+
+
+def calc_debtor_etag(debtor) -> str:
+    """Return a strong entity tag for the current state of a debtor.
+
+    The passed `debtor` can be either a `Debtor` instance, or a row
+    containing the `DEBTOR_VERSION_COLUMNS`.
+    """
+
+    def version_repr(value) -> str:
+        # NOTE: Timestamps are represented relative to the epoch, so
+        # that the time zone of the database connection does not
+        # affect the result.
+        if isinstance(value, datetime):
+            value = value - TS0
+        return repr(value)
+
+    version = "/".join(
+        version_repr(getattr(debtor, column.key))
+        for column in DEBTOR_VERSION_COLUMNS
+    )
+    return hashlib.blake2b(version.encode("utf8"), digest_size=16).hexdigest()
+
+
+class DebtorTombstone(db.Model):
+    debtor_id = db.Column(db.BigInteger, primary_key=True)
+    __table_args__ = (
+        {
+            "comment": (
+                "Represents a debtor which has been deactivated a long time"
+                " ago. The row in the `debtor` table is deleted, so as to"
+                " keep the table small, but the debtor ID must never be"
+                " used again."
+            ),
+        },
+    )
+
+
+class DebtorQuota(db.Model):
+    debtor_id = db.Column(db.BigInteger, primary_key=True)
+    running_transfers_count = db.Column(db.Integer, nullable=False, default=0)
+    actions_count = db.Column(db.Integer, nullable=False, default=0)
+    actions_count_reset_date = db.Column(
+        db.DATE, nullable=False, default=get_now_utc
+    )
+    documents_count = db.Column(db.Integer, nullable=False, default=0)
+    documents_count_reset_date = db.Column(
+        db.DATE, nullable=False, default=get_now_utc
+    )
+    is_closed = db.Column(
+        db.BOOLEAN,
+        nullable=False,
+        default=False,
+        comment=(
+            "Whether the debtor has been deactivated. Closed quotas do not"
+            " allow any actions."
+        ),
+    )
+    __table_args__ = (
+        db.ForeignKeyConstraint(
+            ["debtor_id"], ["debtor.debtor_id"], ondelete="CASCADE"
+        ),
+        db.CheckConstraint(actions_count >= 0),
+        {
+            "comment": (
+                "Contains the counters which limit the number of actions"
+                " that a debtor can perform. The counters are not stored in"
+                " the `debtor` table, so that debtors' actions do not"
+                " contend with the (frequent) updates of debtors' accounts."
+                " A missing row is equivalent to a row with zero counters."
+            ),
+        },
+    )
+
+
 class RunningTransfer(db.Model):
     _cr_seq = db.Sequence(
         "coordinator_request_id_seq", metadata=db.Model.metadata
@@ -324,20 +417,158 @@ class RunningTransfer(db.Model):
         return bool(self.finalized_at)
 
 
+def is_compressible_content_type(content_type: str) -> bool:
+    mimetype = content_type.split(";", 1)[0].strip().lower()
+    return (
+        mimetype.startswith("text/")
+        or mimetype.endswith(("+json", "+xml"))
+        or mimetype in COMPRESSIBLE_CONTENT_TYPES
+    )
+
+
+def encode_document_content(
+    content_type: str, content: bytes
+) -> Tuple[bytes, Optional[str]]:
+    """Return the representation in which a document should be stored.
+
+    Returns the stored bytes, and their content coding (`None` means
+    that the content is stored as is). Only textual documents are
+    compressed, and only when this actually makes them smaller.
+    """
+
+    if len(content) >= DOCUMENT_COMPRESSION_MIN_BYTES and (
+        is_compressible_content_type(content_type)
+    ):
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) < len(content):
+            return compressed, "gzip"
+
+    return content, None
+
+
+def decode_document_content(
+    content: bytes, content_encoding: Optional[str]
+) -> bytes:
+    if content_encoding is None:
+        return content
+    if content_encoding == "gzip":
+        return gzip.decompress(content)
+
+    raise ValueError(f"unknown content encoding: {content_encoding}")
+
+
+class DocumentBlob(db.Model, ChooseRowsMixin):
+    content_hash = db.Column(
+        db.LargeBinary,
+        primary_key=True,
+        comment="The SHA-256 hash of the content.",
+    )
+    content = db.Column(
+        db.LargeBinary,
+        nullable=False,
+        comment="The content, encoded with the specified content coding.",
+    )
+    content_encoding = db.Column(
+        db.String,
+        comment=(
+            "The content coding (only `gzip` is supported) that has been"
+            " applied to the content. A `NULL` value means that the"
+            " content is stored as is."
+        ),
+    )
+    saved_at = db.Column(
+        db.TIMESTAMP(timezone=True),
+        nullable=False,
+        default=get_now_utc,
+        comment=(
+            "The moment at which a document with this content has been"
+            " saved for the last time."
+        ),
+    )
+
+    __table_args__ = (
+        {
+            "comment": (
+                "Represents the content of one or more saved documents."
+                " Documents that have identical contents share the same"
+                " row in this table. Rows that are not referenced by any"
+                " document get deleted eventually."
+            ),
+        },
+    )
+
+
 class Document(db.Model):
     debtor_id = db.Column(db.BigInteger, primary_key=True)
     document_id = db.Column(
         db.BigInteger, primary_key=True, autoincrement=True
     )
     content_type = db.Column(db.String, nullable=False)
-    content = db.Column(db.LargeBinary, nullable=False)
+    inline_content = db.Column(
+        "content",
+        db.LargeBinary,
+        comment=(
+            "The document's content, for documents that have been saved"
+            " before the `document_blob` table was introduced. A `NULL`"
+            " value means that the content is stored in the"
+            " `document_blob` row with the same content hash."
+        ),
+    )
     inserted_at = db.Column(
         db.TIMESTAMP(timezone=True), nullable=False, default=get_now_utc
     )
+    content_hash = db.Column(
+        db.LargeBinary,
+        comment=(
+            "The SHA-256 hash of the document's content. A `NULL` value"
+            " means that the document has been saved before content hashes"
+            " were introduced."
+        ),
+    )
+
+    # NOTE: The content is read-only, and is encoded with the content
+    # coding given by `content_encoding`. New documents must have their
+    # content inserted in the `document_blob` table instead.
+    content = db.column_property(
+        func.coalesce(
+            inline_content,
+            select(DocumentBlob.content)
+            .where(DocumentBlob.content_hash == content_hash)
+            .scalar_subquery(),
+        )
+    )
+
+    # NOTE: Legacy (inline) contents are never encoded.
+    content_encoding = db.column_property(
+        case(
+            (
+                inline_content.is_(None),
+                select(DocumentBlob.content_encoding)
+                .where(DocumentBlob.content_hash == content_hash)
+                .scalar_subquery(),
+            ),
+            else_=null(),
+        )
+    )
+
+    # NOTE: Obtaining the length of a `bytea` value does not require
+    # the value to be de-TOASTed. Note that this is the length of the
+    # stored (possibly encoded) content.
+    content_length = db.column_property(
+        func.coalesce(
+            func.octet_length(inline_content),
+            select(func.octet_length(DocumentBlob.content))
+            .where(DocumentBlob.content_hash == content_hash)
+            .scalar_subquery(),
+        ),
+        deferred=True,
+    )
+
     __table_args__ = (
         db.ForeignKeyConstraint(
             ["debtor_id"], ["debtor.debtor_id"], ondelete="CASCADE"
         ),
+        db.Index("idx_document_content_hash", content_hash),
         {
             "comment": (
                 "Represents a document saved by the debtor, which should"
@@ -347,6 +578,16 @@ class Document(db.Model):
         },
     )
 
+    @property
+    def etag(self) -> str:
+        # NOTE: Documents are immutable. Therefore, documents that do
+        # not have a content hash can use their primary key instead.
+        content_hash = self.content_hash
+        if content_hash is None:
+            return f"{self.debtor_id}-{self.document_id}"
+
+        return content_hash.hex()
+
 
 class ConfigureAccountSignal(Signal):
     exchange_name = DEBTORS_OUT_EXCHANGE
@@ -0,0 +1,324 @@
+"""Deliver change notifications to waiting requests.
+
+When a change is committed to the database (for example, a transfer
+gets finalized), a notification is sent to the `CHANGES_CHANNEL`
+PostgreSQL channel (see `procedures._notify_change`). Each web server
+process runs a single background thread which listens on this
+channel, using its own database connection, and wakes up the
+requests that have subscribed for changes to the given debtor.
+Therefore, the waiting requests do not hold database connections.
+Coroutines which run in an asyncio event loop can subscribe too (see
+`AsyncSubscription`), in which case they do not hold threads either.
+The same thread invalidates the in-process caches (see `caches`).
+
+"""
+
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional, Set
+from flask import Flask, current_app
+from sqlalchemy.engine import make_url
+
+CHANGES_CHANNEL = "swpt_debtors_changes"
+CHANGE_TRANSFER_FINALIZED = "TransferFinalized"
+CHANGE_BALANCE_CHANGED = "BalanceChanged"
+CHANGE_CONFIG_EFFECTUAL = "ConfigEffectual"
+CHANGE_CONFIG_ERROR = "ConfigError"
+CHANGE_DEBTOR_INFO_CHANGED = "DebtorInfoChanged"
+
+# A fake change, which signals that some of the changes could have been
+# missed (because the listening connection has been lost, or too many
+# changes have been queued). When received, subscribers should re-read
+# the state that they are interested in.
+CHANGE_RESET = "Reset"
+
+
+class TooManySubscriptions(Exception):
+    """The maximum number of subscriptions has been reached."""
+
+
+class Change(NamedTuple):
+    debtor_id: int
+    change_type: str
+    object_id: str = ""
+
+    def to_payload(self) -> str:
+        return f"{self.debtor_id} {self.change_type} {self.object_id}"
+
+    @classmethod
+    def from_payload(cls, payload: str) -> Optional["Change"]:
+        try:
+            debtor_id, change_type, object_id = payload.split(" ", 2)
+            return cls(int(debtor_id), change_type, object_id)
+        except ValueError:
+            return None
+
+
+class Subscription:
+    """Receives the changes to a given debtor.
+
+    At most `max_queued` changes are queued. When more changes arrive,
+    the queue is cleared, and a `CHANGE_RESET` change is queued instead.
+    """
+
+    def __init__(self, debtor_id: int, max_queued: int):
+        self.debtor_id = debtor_id
+        self.max_queued = max_queued
+        self._changes: Deque[Change] = deque()
+        self._condition = threading.Condition()
+        self._listener: Optional["_Listener"] = None
+
+    def close(self) -> None:
+        """Stop receiving changes. Can be called more than once."""
+
+        if self._listener is not None:
+            self._listener.unsubscribe(self)
+
+    def put(self, change: Change) -> None:
+        with self._condition:
+            if len(self._changes) >= self.max_queued:
+                self._changes.clear()
+                change = Change(self.debtor_id, CHANGE_RESET)
+            self._changes.append(change)
+            self._condition.notify()
+
+    def get(self, timeout: float) -> Optional[Change]:
+        """Return the next change, or `None` if the timeout expires."""
+
+        with self._condition:
+            if not self._condition.wait_for(
+                lambda: self._changes, max(timeout, 0.0)
+            ):
+                return None
+            return self._changes.popleft()
+
+
+class AsyncSubscription(Subscription):
+    """Receives the changes to a given debtor, in an asyncio event loop.
+
+    Must be created by a coroutine, running in the event loop which
+    will receive the changes.
+    """
+
+    def __init__(self, debtor_id: int, max_queued: int):
+        super().__init__(debtor_id, max_queued)
+        self._loop = asyncio.get_running_loop()
+        self._queued = asyncio.Event()
+
+    def put(self, change: Change) -> None:
+        # NOTE: This is called from the listening thread.
+        try:
+            self._loop.call_soon_threadsafe(self._put, change)
+        except RuntimeError:  # pragma: no cover
+            # The event loop has been closed.
+            pass
+
+    def _put(self, change: Change) -> None:
+        super().put(change)
+        self._queued.set()
+
+    async def get_async(self, timeout: float) -> Optional[Change]:
+        """Return the next change, or `None` if the timeout expires."""
+
+        if not self._queued.is_set():
+            try:
+                await asyncio.wait_for(
+                    self._queued.wait(), max(timeout, 0.0)
+                )
+            except asyncio.TimeoutError:
+                return None
+
+        with self._condition:
+            change = self._changes.popleft()
+            if not self._changes:
+                self._queued.clear()
+            return change
+
+
+class _Listener:
+    def __init__(
+        self,
+        database_uri: str,
+        connect_timeout: float,
+        max_subscriptions: int,
+        keepalive_seconds: float = 30.0,
+    ):
+        self.database_uri = database_uri
+        self.connect_timeout = connect_timeout
+        self.keepalive_seconds = keepalive_seconds
+        self.max_subscriptions = max_subscriptions
+        self.subscriptions_count = 0
+        self.lock = threading.Lock()
+        self.subscriptions: Dict[int, Set[Subscription]] = {}
+        self.callbacks: List[Callable[[Optional[Change]], None]] = []
+        self.listening = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.thread is None:
+            with self.lock:
+                self._start()
+
+    def _start(self) -> None:
+        # Must be called with `self.lock` acquired.
+        if self.thread is None:
+            self.thread = threading.Thread(
+                target=self._run,
+                name="swpt-changes-listener",
+                daemon=True,
+            )
+            self.thread.start()
+
+    def subscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            if self.subscriptions_count >= self.max_subscriptions:
+                raise TooManySubscriptions()
+            self._start()
+            self.subscriptions.setdefault(
+                subscription.debtor_id, set()
+            ).add(subscription)
+            self.subscriptions_count += 1
+            subscription._listener = self
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.debtor_id)
+            if subscriptions is not None and subscription in subscriptions:
+                subscriptions.remove(subscription)
+                self.subscriptions_count -= 1
+                if not subscriptions:
+                    del self.subscriptions[subscription.debtor_id]
+
+    def dispatch(self, change: Change) -> None:
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(change.debtor_id, ()))
+
+        for subscription in subscriptions:
+            subscription.put(change)
+
+        for callback in self.callbacks:
+            callback(change)
+
+    def reset_all(self) -> None:
+        with self.lock:
+            subscriptions = [
+                s for group in self.subscriptions.values() for s in group
+            ]
+
+        for subscription in subscriptions:
+            subscription.put(Change(subscription.debtor_id, CHANGE_RESET))
+
+        for callback in self.callbacks:
+            callback(None)
+
+    def _run(self) -> None:  # pragma: no cover
+        import psycopg
+        from psycopg.conninfo import make_conninfo
+
+        # NOTE: The listening connection is idle most of the time. TCP
+        # keepalives, and a periodic query, make sure that a silently
+        # dropped connection (by a firewall, for example) is detected,
+        # so that the subscribers do not miss changes unknowingly.
+        url = make_url(self.database_uri).set(drivername="postgresql")
+        keepalive_seconds = max(1, round(self.keepalive_seconds))
+        conninfo = make_conninfo(
+            url.render_as_string(hide_password=False),
+            keepalives=1,
+            keepalives_idle=keepalive_seconds,
+            keepalives_interval=keepalive_seconds,
+            keepalives_count=3,
+        )
+        while True:
+            try:
+                with psycopg.connect(conninfo, autocommit=True) as conn:
+                    conn.execute(f"LISTEN {CHANGES_CHANNEL}")
+                    self.listening.set()
+                    while True:
+                        for notify in conn.notifies(
+                            timeout=self.keepalive_seconds
+                        ):
+                            change = Change.from_payload(notify.payload)
+                            if change is not None:
+                                self.dispatch(change)
+                        conn.execute("SELECT 1")
+            except Exception:
+                logging.getLogger(__name__).exception(
+                    "Lost the connection for change notifications."
+                )
+
+            self.listening.clear()
+            self.reset_all()
+            time.sleep(self.connect_timeout)
+
+
+class ChangeListener:
+    """Let requests wait for changes without holding DB connections."""
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        app.extensions["swpt_change_listener"] = _Listener(
+            app.config["SQLALCHEMY_DATABASE_URI"],
+            app.config["APP_CHANGE_LISTENER_CONNECT_TIMEOUT"],
+            app.config["APP_MAX_CHANGE_SUBSCRIPTIONS"],
+            app.config["APP_CHANGE_LISTENER_KEEPALIVE_SECONDS"],
+        )
+
+    def add_callback(
+        self, app: Flask, callback: Callable[[Optional[Change]], None]
+    ) -> None:
+        """Call `callback` from the listening thread, for every change.
+
+        When some of the changes could have been missed, `callback`
+        will be called with `None`. Note that the listening thread is
+        started only after `start` or `subscribe` has been called.
+        """
+
+        app.extensions["swpt_change_listener"].callbacks.append(callback)
+
+    def start(self) -> None:
+        """Start listening for changes, if not started already."""
+
+        current_app.extensions["swpt_change_listener"].start()
+
+    def subscribe(self, debtor_id: int, max_queued: int = 100):
+        """Return a new subscription for changes to the given debtor.
+
+        The returned subscription must be closed when it is no longer
+        needed. Raises `TooManySubscriptions` when the
+        `APP_MAX_CHANGE_SUBSCRIPTIONS` limit has been reached.
+        """
+
+        subscription = Subscription(debtor_id, max_queued)
+        listener: _Listener = current_app.extensions["swpt_change_listener"]
+        listener.subscribe(subscription)
+
+        # Changes committed before we have started listening would be
+        # missed. Note that if the database is not available, the
+        # subscribers will simply wait until their timeouts expire.
+        listener.listening.wait(listener.connect_timeout)
+        return subscription
+
+    async def subscribe_async(
+        self, debtor_id: int, max_queued: int = 100
+    ) -> AsyncSubscription:
+        """Like `subscribe`, but for coroutines running in an event loop."""
+
+        subscription = AsyncSubscription(debtor_id, max_queued)
+        listener: _Listener = current_app.extensions["swpt_change_listener"]
+        listener.subscribe(subscription)
+        try:
+            if not listener.listening.is_set():
+                await asyncio.to_thread(
+                    listener.listening.wait, listener.connect_timeout
+                )
+        except BaseException:
+            subscription.close()
+            raise
+
+        return subscription
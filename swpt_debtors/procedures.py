@@ -1,27 +1,55 @@
 import json
+import hashlib
 from datetime import datetime, date, timedelta, timezone
 from uuid import UUID
-from typing import TypeVar, Optional, Callable, List, Tuple, Dict, Any
-from sqlalchemy import select
-from sqlalchemy.orm import load_only, defer
+from typing import (
+    TypeVar,
+    Optional,
+    Callable,
+    List,
+    Dict,
+    Any,
+    Container,
+    Tuple,
+)
+from sqlalchemy import select, delete, text
+from sqlalchemy.dialects import postgresql as pg
+from sqlalchemy.orm import load_only, defer, undefer
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.sql.expression import func
+from sqlalchemy.sql.expression import func, null, literal, true, Select
 from swpt_pythonlib.utils import Seqnum, increment_seqnum
-from swpt_debtors.extensions import db
+from swpt_debtors.extensions import db, REPLICA_BIND_KEY
+from swpt_debtors.notifications import (
+    Change,
+    CHANGES_CHANNEL,
+    CHANGE_TRANSFER_FINALIZED,
+    CHANGE_BALANCE_CHANGED,
+    CHANGE_CONFIG_EFFECTUAL,
+    CHANGE_CONFIG_ERROR,
+    CHANGE_DEBTOR_INFO_CHANGED,
+)
 from swpt_debtors.models import (
     Debtor,
+    DebtorTombstone,
+    DebtorQuota,
     FinalizeTransferSignal,
     RunningTransfer,
     ConfigureAccountSignal,
     PrepareTransferSignal,
     Document,
+    DocumentBlob,
     MAX_INT32,
+    MIN_INT64,
+    MAX_INT64,
     ROOT_CREDITOR_ID,
     DEFAULT_CONFIG_FLAGS,
     HUGE_NEGLIGIBLE_AMOUNT,
     SC_UNEXPECTED_ERROR,
     SC_CANCELED_BY_THE_SENDER,
     SC_OK,
+    DEBTOR_VERSION_COLUMNS,
+    calc_debtor_etag,
+    encode_document_content,
 )
 
 T = TypeVar("T")
@@ -29,12 +57,97 @@ atomic: Callable[[T], T] = db.atomic
 
 DEFER_DEBTOR_TOASTED_COLUMNS = [defer(Debtor.config_data)]
 DEFER_RUNNING_TRANSFER_TOASTED_COLUMNS = [defer(RunningTransfer.transfer_note)]
+DEFER_DOCUMENT_TOASTED_COLUMNS = [
+    defer(Document.content),
+    undefer(Document.content_length),
+]
 STATUS_FLAGS_MASK = (
     Debtor.STATUS_IS_ACTIVATED_FLAG | Debtor.STATUS_IS_DEACTIVATED_FLAG
 )
 TD_SECOND = timedelta(seconds=1)
 EPS = 1e-5
 
+TRANSFER_CREATED = "created"
+TRANSFER_EXISTS = "exists"
+TRANSFER_CONFLICT = "conflict"
+
+# Initiates a new running transfer in a single round-trip to the
+# database: checks for an existing transfer with the same UUID,
+# updates the debtor's quota (see `_throttle_debtor_actions`), and
+# inserts the new transfer together with its `PrepareTransfer` signal.
+# Always returns exactly one row. Note that the quota row is the only
+# row that gets locked. When the debtor is being deactivated, waiting
+# for the quota row lock ends up with a closed quota, which does not
+# get updated.
+INITIATE_RUNNING_TRANSFER = text("""
+WITH existing_transfer AS (
+  SELECT amount, recipient_uri, recipient, transfer_note_format, transfer_note
+  FROM running_transfer
+  WHERE debtor_id = :debtor_id AND transfer_uuid = :transfer_uuid
+),
+active_debtor AS (
+  SELECT debtor_id
+  FROM debtor
+  WHERE debtor_id = :debtor_id AND status_flags & :mask = :activated_flag
+),
+updated_quota AS (
+  INSERT INTO debtor_quota AS q (
+    debtor_id, running_transfers_count,
+    actions_count, actions_count_reset_date,
+    documents_count, documents_count_reset_date,
+    is_closed
+  )
+  SELECT debtor_id, 1, 1, :current_date, 0, :current_date, false
+  FROM active_debtor
+  WHERE NOT EXISTS (SELECT 1 FROM existing_transfer)
+  ON CONFLICT (debtor_id) DO UPDATE
+  SET
+    running_transfers_count = q.running_transfers_count + 1,
+    actions_count = CASE
+      WHEN q.actions_count_reset_date < :min_reset_date THEN 1
+      ELSE q.actions_count + 1
+    END,
+    actions_count_reset_date = CASE
+      WHEN q.actions_count_reset_date < :min_reset_date THEN :current_date
+      ELSE q.actions_count_reset_date
+    END
+  WHERE NOT q.is_closed
+  RETURNING q.running_transfers_count, q.actions_count
+),
+new_transfer AS (
+  INSERT INTO running_transfer (
+    debtor_id, transfer_uuid, amount, recipient_uri, recipient,
+    transfer_note_format, transfer_note, initiated_at
+  )
+  SELECT
+    :debtor_id, :transfer_uuid, :amount, :recipient_uri, :recipient,
+    :transfer_note_format, :transfer_note, :current_ts
+  FROM updated_quota
+  WHERE
+    running_transfers_count <= :max_actions
+    AND actions_count <= :max_actions
+  ON CONFLICT DO NOTHING
+  RETURNING coordinator_request_id
+),
+new_signal AS (
+  INSERT INTO prepare_transfer_signal (
+    debtor_id, coordinator_request_id, amount, recipient, inserted_at
+  )
+  SELECT :debtor_id, coordinator_request_id, :amount, :recipient, :current_ts
+  FROM new_transfer
+)
+SELECT
+  (SELECT running_transfers_count FROM updated_quota),
+  (SELECT actions_count FROM updated_quota),
+  (SELECT coordinator_request_id FROM new_transfer),
+  e.amount,
+  e.recipient_uri,
+  e.recipient,
+  e.transfer_note_format,
+  e.transfer_note
+FROM (VALUES (1)) AS dummy LEFT JOIN existing_transfer e ON true
+""")
+
 
 class UpdateConflict(Exception):
     """A conflict occurred while trying to update a resource."""
@@ -44,6 +157,10 @@ class AlreadyUpToDate(Exception):
     """Trying to update a resource which is already up-to-date."""
 
 
+class VersionMismatch(Exception):
+    """The resource has been modified since the client last saw it."""
+
+
 class MisconfiguredNode(Exception):
     """The node is misconfigured."""
 
@@ -88,31 +205,60 @@ class TooManySavedDocuments(Exception):
     """Too many saved documents per year by a debtor."""
 
 
+def get_replica_lag_seconds() -> float:
+    """Return the replication lag of the replica database, in seconds.
+
+    Returns zero when the replica has replayed everything it has
+    received from the primary, and infinity when the lag can not be
+    determined. Note that a replica which does not receive WAL from
+    the primary (because the WAL receiver has been disconnected, for
+    example) can be arbitrarily stale, and therefore its lag is
+    infinite. The status of the WAL receiver is visible only to roles
+    which have the privileges of `pg_read_all_stats`, and for all
+    other roles, the lag is always infinite.
+    """
+
+    with db.engines[REPLICA_BIND_KEY].connect() as conn:
+        return conn.execute(
+            text(
+                "SELECT CASE"
+                " WHEN NOT pg_is_in_recovery() THEN 0.0::float8"
+                " WHEN NOT EXISTS ("
+                "SELECT 1 FROM pg_stat_wal_receiver"
+                " WHERE status = 'streaming'"
+                ") THEN 'Infinity'::float8"
+                " WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()"
+                " THEN 0.0::float8"
+                " ELSE COALESCE("
+                "EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())"
+                "::float8, 'Infinity'::float8)"
+                " END"
+            )
+        ).scalar_one()
+
+
 @atomic
 def get_debtor_ids(
-    start_from: int, count: int = 1
-) -> Tuple[List[int], Optional[int]]:
+    start_from: int,
+    count: int,
+    *,
+    min_debtor_id: int = MIN_INT64,
+    max_debtor_id: int = MAX_INT64,
+) -> List[int]:
+    """Return the IDs of activated debtors, in ascending order."""
+
     assert count >= 1
-    debtor_ids = (
-        db.session.execute(
-            select(Debtor.debtor_id)
-            .where(
-                Debtor.debtor_id >= start_from,
-                Debtor.status_flags.op("&")(STATUS_FLAGS_MASK)
-                == Debtor.STATUS_IS_ACTIVATED_FLAG
-            )
-            .order_by(Debtor.debtor_id)
-            .limit(count + 1)
+    return db.session.execute(
+        select(Debtor.debtor_id)
+        .where(
+            Debtor.debtor_id >= max(start_from, min_debtor_id),
+            Debtor.debtor_id <= max_debtor_id,
+            Debtor.status_flags.op("&")(STATUS_FLAGS_MASK)
+            == Debtor.STATUS_IS_ACTIVATED_FLAG
         )
-        .scalars()
-        .all()
-    )
-    if len(debtor_ids) > count:
-        next_debtor_id = debtor_ids.pop()
-    else:
-        next_debtor_id = None
-
-    return debtor_ids, next_debtor_id
+        .order_by(Debtor.debtor_id)
+        .limit(count)
+    ).scalars().all()
 
 
 @atomic
@@ -124,9 +270,45 @@ def reserve_debtor(debtor_id) -> Debtor:
     except IntegrityError:
         raise DebtorExists() from None
 
+    # NOTE: The tombstone must be checked *after* the new row has been
+    # inserted. Otherwise, we may miss a tombstone that has been
+    # committed while our insert was waiting for the deletion of the
+    # corresponding debtor row.
+    if _is_tombstoned(debtor_id):
+        raise DebtorExists()
+
     return debtor
 
 
+@atomic
+def reserve_random_debtor(candidate_debtor_ids: List[int]) -> Debtor:
+    """Reserve the first available debtor ID from the passed candidates.
+
+    Raises `DebtorExists` if none of the candidates is available.
+    """
+
+    for debtor_id in candidate_debtor_ids:
+        debtor = db.session.execute(
+            pg.insert(Debtor)
+            .values(debtor_id=debtor_id)
+            .on_conflict_do_nothing()
+            .returning(Debtor)
+        ).scalar_one_or_none()
+        if debtor is None:
+            continue
+
+        # NOTE: The tombstone must be checked *after* the new row has
+        # been inserted (see `reserve_debtor`).
+        if _is_tombstoned(debtor_id):
+            db.session.delete(debtor)
+            db.session.flush()
+            continue
+
+        return debtor
+
+    raise DebtorExists()
+
+
 @atomic
 def activate_debtor(debtor_id: int, reservation_id: str) -> Debtor:
     debtor = get_debtor(debtor_id, lock=True)
@@ -137,6 +319,7 @@ def activate_debtor(debtor_id: int, reservation_id: str) -> Debtor:
         if not debtor.is_activated:
             debtor.activate()
             _insert_configure_account_signal(debtor)
+            _notify_change(Change(debtor_id, CHANGE_DEBTOR_INFO_CHANGED))
     elif debtor.is_activated:
         raise DebtorExists()  # pragma: no cover
     else:
@@ -147,11 +330,129 @@ def activate_debtor(debtor_id: int, reservation_id: str) -> Debtor:
 
 @atomic
 def deactivate_debtor(debtor_id: int, deleted_account: bool = False) -> None:
+    _close_debtor_quotas([debtor_id])
     debtor = get_active_debtor(debtor_id, lock=True, defer_toasted=True)
     if debtor:
         debtor.deactivate()
         _insert_configure_account_signal(debtor)
         _delete_debtor_transfers(debtor)
+        _notify_change(Change(debtor_id, CHANGE_DEBTOR_INFO_CHANGED))
+
+
+@atomic
+def activate_debtors(debtor_ids: List[int]) -> List[int]:
+    """Create and activate new debtors, skipping the existing ones.
+
+    Returns the IDs of the activated debtors. This is equivalent to,
+    but much more efficient than, reserving and activating each one
+    of the debtors separately.
+    """
+
+    current_ts = datetime.now(tz=timezone.utc)
+    config_seqnum = increment_seqnum(0)
+    debtor_ids = sorted(set(debtor_ids))
+    if not debtor_ids:
+        return []
+
+    activated_debtor_ids = (
+        db.session.execute(
+            pg.insert(Debtor)
+            .values(
+                [
+                    {
+                        "debtor_id": debtor_id,
+                        "status_flags": Debtor.STATUS_IS_ACTIVATED_FLAG,
+                        "last_config_ts": current_ts,
+                        "last_config_seqnum": config_seqnum,
+                    }
+                    for debtor_id in debtor_ids
+                ]
+            )
+            .on_conflict_do_nothing()
+            .returning(Debtor.debtor_id)
+        )
+        .scalars()
+        .all()
+    )
+
+    # NOTE: The tombstones must be checked *after* the new rows have
+    # been inserted (see the comment in `reserve_debtor`).
+    tombstoned_debtor_ids = set(
+        db.session.execute(
+            select(DebtorTombstone.debtor_id)
+            .where(DebtorTombstone.debtor_id.in_(activated_debtor_ids))
+        )
+        .scalars()
+        .all()
+    )
+    if tombstoned_debtor_ids:
+        db.session.execute(
+            delete(Debtor)
+            .where(Debtor.debtor_id.in_(tombstoned_debtor_ids))
+        )
+        activated_debtor_ids = [
+            debtor_id
+            for debtor_id in activated_debtor_ids
+            if debtor_id not in tombstoned_debtor_ids
+        ]
+
+    db.session.add_all(
+        [
+            ConfigureAccountSignal(
+                debtor_id=debtor_id,
+                ts=current_ts,
+                seqnum=config_seqnum,
+                config_data="",
+                config_flags=DEFAULT_CONFIG_FLAGS,
+                negligible_amount=-float(MIN_INT64),
+            )
+            for debtor_id in activated_debtor_ids
+        ]
+    )
+    for debtor_id in activated_debtor_ids:
+        _notify_change(Change(debtor_id, CHANGE_DEBTOR_INFO_CHANGED))
+
+    return sorted(activated_debtor_ids)
+
+
+@atomic
+def deactivate_debtors(debtor_ids: List[int]) -> List[int]:
+    """Deactivate many debtors at once.
+
+    Returns the IDs of the deactivated debtors. Debtors that do not
+    exist, or are not active, are skipped.
+    """
+
+    _close_debtor_quotas(debtor_ids)
+    debtors = _lock_active_debtors(debtor_ids, defer_toasted=True)
+    deactivated_debtor_ids = [debtor.debtor_id for debtor in debtors]
+    for debtor in debtors:
+        debtor.deactivate()
+        _insert_configure_account_signal(debtor)
+        _notify_change(Change(debtor.debtor_id, CHANGE_DEBTOR_INFO_CHANGED))
+
+    if deactivated_debtor_ids:
+        RunningTransfer.query.filter(
+            RunningTransfer.debtor_id.in_(deactivated_debtor_ids)
+        ).delete(synchronize_session=False)
+
+    return deactivated_debtor_ids
+
+
+@atomic
+def restrict_debtors(debtor_ids: List[int], min_balance: int) -> List[int]:
+    """Restrict the maximum amount that many debtors are allowed to issue.
+
+    Returns the IDs of the restricted debtors. Debtors that do not
+    exist, or are not active, are skipped.
+    """
+
+    debtors = _lock_active_debtors(debtor_ids)
+    for debtor in debtors:
+        debtor.min_balance = min_balance
+        _insert_configure_account_signal(debtor)
+
+    return [debtor.debtor_id for debtor in debtors]
 
 
 @atomic
@@ -166,6 +467,70 @@ def restrict_debtor(debtor_id: int, min_balance: int) -> Debtor:
     return debtor
 
 
+# NOTE: The `select_*` functions build the statements which the
+# read-only procedures execute. The asynchronous endpoints (see the
+# `asgi` module) execute the same statements on their own connections.
+
+
+def select_debtor(
+    debtor_id: int, *, active: bool = False, defer_toasted: bool = False
+) -> Select:
+    stmt = select(Debtor).where(Debtor.debtor_id == debtor_id)
+    if active:
+        stmt = stmt.where(
+            Debtor.status_flags.op("&")(STATUS_FLAGS_MASK)
+            == Debtor.STATUS_IS_ACTIVATED_FLAG
+        )
+    if defer_toasted:
+        stmt = stmt.options(*DEFER_DEBTOR_TOASTED_COLUMNS)
+
+    return stmt
+
+
+def select_active_debtor_version(debtor_id: int) -> Select:
+    return (
+        select(*DEBTOR_VERSION_COLUMNS)
+        .where(
+            Debtor.debtor_id == debtor_id,
+            Debtor.status_flags.op("&")(STATUS_FLAGS_MASK)
+            == Debtor.STATUS_IS_ACTIVATED_FLAG,
+        )
+    )
+
+
+def select_debtor_transfer_uuids(debtor_id: int) -> Select:
+    return (
+        select(RunningTransfer.transfer_uuid)
+        .where(RunningTransfer.debtor_id == debtor_id)
+    )
+
+
+def select_running_transfer(debtor_id: int, transfer_uuid: UUID) -> Select:
+    return (
+        select(RunningTransfer)
+        .where(
+            RunningTransfer.debtor_id == debtor_id,
+            RunningTransfer.transfer_uuid == transfer_uuid,
+        )
+    )
+
+
+def select_document(
+    debtor_id: int, document_id: int, *, defer_toasted: bool = False
+) -> Select:
+    stmt = (
+        select(Document)
+        .where(
+            Document.debtor_id == debtor_id,
+            Document.document_id == document_id,
+        )
+    )
+    if defer_toasted:
+        stmt = stmt.options(*DEFER_DOCUMENT_TOASTED_COLUMNS)
+
+    return stmt
+
+
 @atomic
 def get_debtor(
     debtor_id: int,
@@ -174,18 +539,13 @@ def get_debtor(
     active: bool = False,
     defer_toasted: bool = False,
 ) -> Optional[Debtor]:
-    query = Debtor.query.filter_by(debtor_id=debtor_id)
-    if active:
-        query = query.filter(
-            Debtor.status_flags.op("&")(STATUS_FLAGS_MASK)
-            == Debtor.STATUS_IS_ACTIVATED_FLAG
-        )
-    if defer_toasted:
-        query = query.options(*DEFER_DEBTOR_TOASTED_COLUMNS)
+    stmt = select_debtor(
+        debtor_id, active=active, defer_toasted=defer_toasted
+    )
     if lock:
-        query = query.with_for_update(key_share=True)
+        stmt = stmt.with_for_update(key_share=True)
 
-    return query.one_or_none()
+    return db.session.execute(stmt).scalars().one_or_none()
 
 
 @atomic
@@ -199,18 +559,38 @@ def get_active_debtor(
     )
 
 
+@atomic
+def get_debtor_quota(debtor_id: int) -> Optional[DebtorQuota]:
+    return DebtorQuota.query.filter_by(debtor_id=debtor_id).one_or_none()
+
+
+@atomic
+def get_active_debtor_etag(debtor_id: int) -> Optional[str]:
+    row = db.session.execute(
+        select_active_debtor_version(debtor_id)
+    ).one_or_none()
+
+    return None if row is None else calc_debtor_etag(row)
+
+
 @atomic
 def update_debtor_config(
     debtor_id: int,
     *,
     config_data: str,
     latest_update_id: int,
-    max_actions_per_month: int = MAX_INT32
+    max_actions_per_month: int = MAX_INT32,
+    if_match: Optional[Container[str]] = None
 ) -> Debtor:
     current_ts = datetime.now(tz=timezone.utc)
-    debtor = _throttle_debtor_actions(
-        debtor_id, max_actions_per_month, current_ts
-    )
+    _throttle_debtor_actions(debtor_id, max_actions_per_month, current_ts)
+    debtor = get_active_debtor(debtor_id, lock=True)
+    if debtor is None:  # pragma: no cover
+        raise DebtorDoesNotExist()
+
+    if if_match is not None and calc_debtor_etag(debtor) not in if_match:
+        raise VersionMismatch()
+
     try:
         perform_update = _allow_update(
             debtor,
@@ -236,27 +616,57 @@ def get_debtor_transfer_uuids(debtor_id: int) -> List[UUID]:
         raise DebtorDoesNotExist()
 
     return (
-        db.session.execute(
-            select(RunningTransfer.transfer_uuid)
-            .where(RunningTransfer.debtor_id == debtor_id)
-        )
+        db.session.execute(select_debtor_transfer_uuids(debtor_id))
         .scalars()
         .all()
     )
 
 
+@atomic
+def get_debtor_transfers(
+    debtor_id: int,
+    *,
+    finalized: Optional[bool] = None,
+    prev: Optional[UUID] = None,
+    count: int = 1
+) -> List[RunningTransfer]:
+    assert count >= 1
+    query = RunningTransfer.query.filter(
+        RunningTransfer.debtor_id == debtor_id
+    )
+    if finalized is not None:
+        query = query.filter(
+            RunningTransfer.finalized_at != null()
+            if finalized
+            else RunningTransfer.finalized_at == null()
+        )
+    if prev is not None:
+        query = query.filter(RunningTransfer.transfer_uuid > prev)
+
+    transfers = (
+        query.order_by(RunningTransfer.transfer_uuid).limit(count).all()
+    )
+
+    # NOTE: The debtor's existence is checked only when no transfers
+    # have been found, to avoid making an additional query.
+    if (
+        not transfers
+        and get_active_debtor(debtor_id, defer_toasted=True) is None
+    ):
+        raise DebtorDoesNotExist()
+
+    return transfers
+
+
 @atomic
 def get_running_transfer(
     debtor_id: int, transfer_uuid: UUID, lock=False
 ) -> Optional[RunningTransfer]:
-    query = RunningTransfer.query.filter_by(
-        debtor_id=debtor_id,
-        transfer_uuid=transfer_uuid,
-    )
+    stmt = select_running_transfer(debtor_id, transfer_uuid)
     if lock:
-        query = query.with_for_update(key_share=True)
+        stmt = stmt.with_for_update(key_share=True)
 
-    return query.one_or_none()
+    return db.session.execute(stmt).scalars().one_or_none()
 
 
 @atomic
@@ -284,12 +694,48 @@ def delete_running_transfer(debtor_id: int, transfer_uuid: UUID) -> None:
         raise TransferDoesNotExist()
 
     assert number_of_deleted_rows == 1
-    Debtor.query.filter_by(debtor_id=debtor_id).update(
-        {Debtor.running_transfers_count: Debtor.running_transfers_count - 1},
+    DebtorQuota.query.filter_by(debtor_id=debtor_id).update(
+        {
+            DebtorQuota.running_transfers_count: (
+                DebtorQuota.running_transfers_count - 1
+            )
+        },
         synchronize_session=False,
     )
 
 
+@atomic
+def delete_running_transfers(
+    debtor_id: int,
+    *,
+    transfer_uuids: Optional[List[UUID]] = None,
+    finalized_before: Optional[datetime] = None
+) -> int:
+    assert transfer_uuids is not None or finalized_before is not None
+    query = RunningTransfer.query.filter(
+        RunningTransfer.debtor_id == debtor_id
+    )
+    if transfer_uuids is not None:
+        query = query.filter(RunningTransfer.transfer_uuid.in_(transfer_uuids))
+    if finalized_before is not None:
+        query = query.filter(RunningTransfer.finalized_at < finalized_before)
+
+    number_of_deleted_rows = query.delete(synchronize_session=False)
+
+    if number_of_deleted_rows > 0:
+        DebtorQuota.query.filter_by(debtor_id=debtor_id).update(
+            {
+                DebtorQuota.running_transfers_count: (
+                    DebtorQuota.running_transfers_count
+                    - number_of_deleted_rows
+                )
+            },
+            synchronize_session=False,
+        )
+
+    return number_of_deleted_rows
+
+
 @atomic
 def initiate_running_transfer(
     debtor_id: int,
@@ -310,39 +756,137 @@ def initiate_running_transfer(
         "transfer_note": transfer_note,
     }
 
-    rt = get_running_transfer(debtor_id, transfer_uuid)
-    if rt:
-        if any(
-            getattr(rt, attr) != value for attr, value in transfer_data.items()
-        ):
-            raise TransfersConflict()
-        raise TransferExists()
-
-    debtor = _throttle_debtor_actions(
-        debtor_id, max_actions_per_month, current_ts, True
-    )
-    debtor.running_transfers_count += 1
-    if debtor.running_transfers_count > max_actions_per_month:
+    current_date = current_ts.date()
+    row = db.session.execute(
+        INITIATE_RUNNING_TRANSFER,
+        {
+            "debtor_id": debtor_id,
+            "transfer_uuid": transfer_uuid,
+            "mask": STATUS_FLAGS_MASK,
+            "activated_flag": Debtor.STATUS_IS_ACTIVATED_FLAG,
+            "current_date": current_date,
+            "min_reset_date": current_date - timedelta(days=30),
+            "current_ts": current_ts,
+            "max_actions": max_actions_per_month,
+            **transfer_data,
+        },
+    ).one()
+    (
+        running_transfers_count,
+        actions_count,
+        coordinator_request_id,
+        *existing_transfer_data,
+    ) = row
+
+    if existing_transfer_data[0] is not None:
+        _check_existing_transfer(
+            dict(zip(transfer_data, existing_transfer_data)), transfer_data
+        )
+    if actions_count is None:
+        raise DebtorDoesNotExist()
+    if actions_count > max_actions_per_month:
+        raise TooManyManagementActions()
+    if running_transfers_count > max_actions_per_month:
         raise TooManyRunningTransfers()
+    if coordinator_request_id is None:
+        # The same transfer has been inserted by a concurrent
+        # transaction, after our snapshot had been taken. Note that
+        # raising an exception rolls back the update of the quota.
+        rt = get_running_transfer(debtor_id, transfer_uuid)
+        if rt is None:  # pragma: no cover
+            raise TransfersConflict()
+        _check_existing_transfer(
+            {attr: getattr(rt, attr) for attr in transfer_data},
+            transfer_data,
+        )
 
-    new_running_transfer = RunningTransfer(
+    # NOTE: The new transfer is not added to the session, but it has
+    # all the attributes of the inserted row.
+    return RunningTransfer(
         debtor_id=debtor_id,
         transfer_uuid=transfer_uuid,
+        initiated_at=current_ts,
+        coordinator_request_id=coordinator_request_id,
         **transfer_data,
     )
-    with db.retry_on_integrity_error():
-        db.session.add(new_running_transfer)
 
-    db.session.add(
-        PrepareTransferSignal(
-            debtor_id=debtor_id,
-            coordinator_request_id=new_running_transfer.coordinator_request_id,
-            amount=amount,
-            recipient=recipient,
+
+@atomic
+def initiate_running_transfers(
+    debtor_id: int,
+    transfers: List[Dict[str, Any]],
+    max_actions_per_month: int = MAX_INT32,
+) -> List[Tuple[str, UUID]]:
+    """Initiate many transfers at once.
+
+    Each one of the passed `transfers` must be a dictionary with the
+    following keys: "transfer_uuid", "recipient_uri", "recipient",
+    "amount", "transfer_note_format", "transfer_note". Returns a list
+    of `(status, transfer_uuid)` tuples, one for each passed transfer.
+    """
+
+    current_ts = datetime.now(tz=timezone.utc)
+    running_transfers = {
+        rt.transfer_uuid: rt
+        for rt in RunningTransfer.query.filter(
+            RunningTransfer.debtor_id == debtor_id,
+            RunningTransfer.transfer_uuid.in_(
+                [t["transfer_uuid"] for t in transfers]
+            ),
+        ).all()
+    }
+    new_running_transfers = []
+    results = []
+
+    for transfer in transfers:
+        transfer_data = dict(transfer)
+        transfer_uuid = transfer_data.pop("transfer_uuid")
+        rt = running_transfers.get(transfer_uuid)
+        if rt is None:
+            rt = running_transfers[transfer_uuid] = RunningTransfer(
+                debtor_id=debtor_id,
+                transfer_uuid=transfer_uuid,
+                **transfer_data,
+            )
+            new_running_transfers.append(rt)
+            status = TRANSFER_CREATED
+        elif any(
+            getattr(rt, attr) != value for attr, value in transfer_data.items()
+        ):
+            status = TRANSFER_CONFLICT
+        else:
+            status = TRANSFER_EXISTS
+
+        results.append((status, transfer_uuid))
+
+    number_of_new_transfers = len(new_running_transfers)
+    if number_of_new_transfers > 0:
+        quota = _throttle_debtor_actions(
+            debtor_id,
+            max_actions_per_month,
+            current_ts,
+            number_of_new_transfers,
         )
-    )
+        quota.running_transfers_count += number_of_new_transfers
+        if quota.running_transfers_count > max_actions_per_month:
+            raise TooManyRunningTransfers()
 
-    return new_running_transfer
+        with db.retry_on_integrity_error():
+            db.session.add_all(new_running_transfers)
+
+        db.session.add_all(
+            [
+                PrepareTransferSignal(
+                    debtor_id=debtor_id,
+                    coordinator_request_id=rt.coordinator_request_id,
+                    amount=rt.amount,
+                    recipient=rt.recipient,
+                )
+                for rt in new_running_transfers
+            ]
+        )
+
+    return results
 
 
 @atomic
@@ -381,6 +925,7 @@ def process_rejected_config_signal(
 
     if debtor:
         debtor.config_error = rejection_code
+        _notify_change(Change(debtor_id, CHANGE_CONFIG_ERROR))
 
 
 @atomic
@@ -550,7 +1095,8 @@ def process_account_update_signal(
     account_id: str,
     transfer_note_max_bytes: int,
     ts: datetime,
-    ttl: int
+    ttl: int,
+    publish_balance_changes: bool = False
 ) -> None:
     if creditor_id != ROOT_CREDITOR_ID:  # pragma: no cover
         return
@@ -590,6 +1136,14 @@ def process_account_update_signal(
         <= EPS * negligible_amount
     )
 
+    if is_config_effectual and not debtor.is_config_effectual:
+        _notify_change(Change(debtor_id, CHANGE_CONFIG_EFFECTUAL))
+    if publish_balance_changes and principal != debtor.balance:
+        # NOTE: Most account updates change the balance, and only the
+        # streams of debtor's change events need to know about it.
+        # Therefore, by default, the notification is not sent.
+        _notify_change(Change(debtor_id, CHANGE_BALANCE_CHANGED))
+
     debtor.is_config_effectual = is_config_effectual
     debtor.config_error = None if is_config_effectual else debtor.config_error
     debtor.has_server_account = True
@@ -600,9 +1154,10 @@ def process_account_update_signal(
     debtor.balance = principal
     debtor.transfer_note_max_bytes = transfer_note_max_bytes
     if is_config_effectual:
-        debtor.debtor_info_iri = _get_debtor_info_iri_from_config_data(
-            config_data
-        )
+        debtor_info_iri = _get_debtor_info_iri_from_config_data(config_data)
+        if debtor_info_iri != debtor.debtor_info_iri:
+            _notify_change(Change(debtor_id, CHANGE_DEBTOR_INFO_CHANGED))
+        debtor.debtor_info_iri = debtor_info_iri
 
 
 @atomic
@@ -616,14 +1171,35 @@ def save_document(
     assert content_type is not None
     assert content is not None
 
-    _throttle_document_saves(
-        debtor_id, max_saves_per_year, datetime.now(tz=timezone.utc)
+    current_ts = datetime.now(tz=timezone.utc)
+    _throttle_document_saves(debtor_id, max_saves_per_year, current_ts)
+
+    # NOTE: Documents are stored by content hash, so that identical
+    # documents (which are common) share the same blob. Existing blobs
+    # are not overwritten, but are locked and get their `saved_at`
+    # updated, so that the blob will not be garbage-collected (see
+    # `DocumentBlobScanner`) before the new document has been saved.
+    content_hash = hashlib.sha256(content).digest()
+    stored_content, content_encoding = encode_document_content(
+        content_type, content
+    )
+    db.session.execute(
+        pg.insert(DocumentBlob)
+        .values(
+            content_hash=content_hash,
+            content=stored_content,
+            content_encoding=content_encoding,
+            saved_at=current_ts,
+        )
+        .on_conflict_do_update(
+            index_elements=[DocumentBlob.content_hash],
+            set_={"saved_at": current_ts},
+        )
     )
-
     document = Document(
         debtor_id=debtor_id,
         content_type=content_type,
-        content=content,
+        content_hash=content_hash,
     )
     with db.retry_on_integrity_error():
         db.session.add(document)
@@ -632,10 +1208,46 @@ def save_document(
 
 
 @atomic
-def get_document(debtor_id: int, document_id: int) -> Optional[Document]:
-    return Document.query.filter_by(
-        debtor_id=debtor_id, document_id=document_id
-    ).one_or_none()
+def get_document(
+    debtor_id: int,
+    document_id: int,
+    defer_toasted: bool = False,
+) -> Optional[Document]:
+    stmt = select_document(
+        debtor_id, document_id, defer_toasted=defer_toasted
+    )
+    return db.session.execute(stmt).scalars().one_or_none()
+
+
+def _lock_active_debtors(
+    debtor_ids: List[int], defer_toasted: bool = False
+) -> List[Debtor]:
+    # NOTE: The rows are locked in the order of their primary keys, to
+    # avoid deadlocks between concurrent bulk operations.
+    query = (
+        Debtor.query
+        .filter(
+            Debtor.debtor_id.in_(debtor_ids),
+            Debtor.status_flags.op("&")(STATUS_FLAGS_MASK)
+            == Debtor.STATUS_IS_ACTIVATED_FLAG,
+        )
+        .order_by(Debtor.debtor_id)
+        .with_for_update(key_share=True)
+    )
+    if defer_toasted:
+        query = query.options(*DEFER_DEBTOR_TOASTED_COLUMNS)
+
+    return query.all()
+
+
+def _is_tombstoned(debtor_id: int) -> bool:
+    return (
+        db.session.execute(
+            select(DebtorTombstone.debtor_id)
+            .where(DebtorTombstone.debtor_id == debtor_id)
+        ).one_or_none()
+        is not None
+    )
 
 
 def _get_debtor_info_iri_from_config_data(config_data: str) -> Optional[str]:
@@ -655,53 +1267,131 @@ def _get_debtor_info_iri_from_config_data(config_data: str) -> Optional[str]:
     return debtor_info_iri if isinstance(debtor_info_iri, str) else None
 
 
+def _lock_debtor_quota(debtor_id: int, current_ts: datetime) -> DebtorQuota:
+    # NOTE: The quota row is locked *before* the debtor's status is
+    # checked. This guarantees that the debtor will not get
+    # deactivated in the meantime (see `_close_debtor_quotas`). Note
+    # that the debtor row is not locked, so that the debtor's actions
+    # do not contend with the updates of debtor's account.
+    quota = (
+        DebtorQuota.query
+        .filter_by(debtor_id=debtor_id)
+        .with_for_update(key_share=True)
+        .one_or_none()
+    )
+    if quota is not None and quota.is_closed:
+        raise DebtorDoesNotExist()
+
+    if get_active_debtor(debtor_id, defer_toasted=True) is None:
+        raise DebtorDoesNotExist()
+
+    if quota is None:
+        current_date = current_ts.date()
+        quota = DebtorQuota(
+            debtor_id=debtor_id,
+            actions_count_reset_date=current_date,
+            documents_count_reset_date=current_date,
+        )
+        with db.retry_on_integrity_error():
+            db.session.add(quota)
+
+    return quota
+
+
+def _close_debtor_quotas(debtor_ids: List[int]) -> None:
+    # NOTE: This must be called before the debtors get deactivated. The
+    # missing quota rows are inserted too. This way, a concurrent first
+    # action of the debtor will have to wait for us (see
+    # `_lock_debtor_quota` and `INITIATE_RUNNING_TRANSFER`).
+    debtor_ids = sorted(set(debtor_ids))
+    if not debtor_ids:
+        return
+
+    db.session.execute(
+        pg.insert(DebtorQuota)
+        .from_select(
+            [
+                DebtorQuota.debtor_id,
+                DebtorQuota.running_transfers_count,
+                DebtorQuota.actions_count,
+                DebtorQuota.actions_count_reset_date,
+                DebtorQuota.documents_count,
+                DebtorQuota.documents_count_reset_date,
+                DebtorQuota.is_closed,
+            ],
+            select(
+                Debtor.debtor_id,
+                literal(0),
+                literal(0),
+                func.current_date(),
+                literal(0),
+                func.current_date(),
+                true(),
+            )
+            .where(
+                Debtor.debtor_id.in_(debtor_ids),
+                Debtor.status_flags.op("&")(STATUS_FLAGS_MASK)
+                == Debtor.STATUS_IS_ACTIVATED_FLAG,
+            )
+            .order_by(Debtor.debtor_id),
+        )
+        .on_conflict_do_update(
+            index_elements=[DebtorQuota.debtor_id],
+            set_={
+                DebtorQuota.running_transfers_count: 0,
+                DebtorQuota.is_closed: True,
+            },
+        )
+    )
+
+
 def _throttle_debtor_actions(
     debtor_id: int,
     max_actions_per_month: int,
     current_ts: datetime,
-    defer_toasted: bool = False,
-) -> Debtor:
-    debtor = get_active_debtor(
-        debtor_id, lock=True, defer_toasted=defer_toasted
-    )
-    if debtor is None:
-        raise DebtorDoesNotExist()
-
+    number_of_actions: int = 1,
+) -> DebtorQuota:
+    quota = _lock_debtor_quota(debtor_id, current_ts)
     current_date = current_ts.date()
     number_of_elapsed_days = (
-        current_date - debtor.actions_count_reset_date
+        current_date - quota.actions_count_reset_date
     ).days
     if number_of_elapsed_days > 30:  # pragma: no cover
-        debtor.actions_count = 0
-        debtor.actions_count_reset_date = current_date
+        quota.actions_count = 0
+        quota.actions_count_reset_date = current_date
 
-    if debtor.actions_count >= max_actions_per_month:
+    if quota.actions_count + number_of_actions > max_actions_per_month:
         raise TooManyManagementActions()
 
-    debtor.actions_count += 1
-    return debtor
+    quota.actions_count += number_of_actions
+    return quota
 
 
 def _throttle_document_saves(
     debtor_id: int, max_saves_per_year: int, current_ts: datetime
-) -> Debtor:
-    debtor = get_active_debtor(debtor_id, lock=True, defer_toasted=True)
-    if debtor is None:
-        raise DebtorDoesNotExist()
-
+) -> DebtorQuota:
+    quota = _lock_debtor_quota(debtor_id, current_ts)
     current_date = current_ts.date()
     number_of_elapsed_days = (
-        current_date - debtor.documents_count_reset_date
+        current_date - quota.documents_count_reset_date
     ).days
     if number_of_elapsed_days > 365:  # pragma: no cover
-        debtor.documents_count = 0
-        debtor.documents_count_reset_date = current_date
+        quota.documents_count = 0
+        quota.documents_count_reset_date = current_date
 
-    if debtor.documents_count >= max_saves_per_year:
+    if quota.documents_count >= max_saves_per_year:
         raise TooManySavedDocuments()
 
-    debtor.documents_count += 1
-    return debtor
+    quota.documents_count += 1
+    return quota
+
+
+def _check_existing_transfer(
+    existing_transfer_data: Dict[str, Any], transfer_data: Dict[str, Any]
+) -> None:
+    if existing_transfer_data != transfer_data:
+        raise TransfersConflict()
+    raise TransferExists()
 
 
 def _find_running_transfer(
@@ -737,8 +1427,6 @@ def _insert_configure_account_signal(debtor: Debtor) -> None:
 
 
 def _delete_debtor_transfers(debtor: Debtor) -> None:
-    debtor.running_transfers_count = 0
-
     RunningTransfer.query.filter_by(debtor_id=debtor.debtor_id).delete(
         synchronize_session=False
     )
@@ -753,6 +1441,19 @@ def _finalize_running_transfer(
         rt.finalized_at = datetime.now(tz=timezone.utc)
         rt.error_code = error_code
         rt.total_locked_amount = total_locked_amount
+        _notify_change(
+            Change(
+                rt.debtor_id, CHANGE_TRANSFER_FINALIZED, str(rt.transfer_uuid)
+            )
+        )
+
+
+def _notify_change(change: Change) -> None:
+    # The notification will be delivered when the transaction commits.
+    db.session.execute(
+        text("SELECT pg_notify(:channel, :payload)"),
+        {"channel": CHANGES_CHANNEL, "payload": change.to_payload()},
+    )
 
 
 def _allow_update(
@@ -0,0 +1,226 @@
+"""An opt-in WSGI middleware that profiles a sample of the requests.
+
+The profiles are aggregated per endpoint, and periodically written to
+a directory (one file per endpoint and process), in the format used by
+the standard `pstats` module. For example:
+
+    $ python -m pstats /tmp/profiles/debtors.DebtorEndpoint.1234.prof
+
+Besides the randomly sampled requests, profiling can be triggered on
+demand: 1) for a single request, by sending a secret token in the
+"X-Swpt-Profile" header; 2) for the next several requests to a given
+endpoint, by sending the SIGURG signal to a web server process. (Note
+that gunicorn uses most of the other signals, and that by default,
+SIGURG is ignored.)
+
+The responses of profiled requests are not buffered, and the profiler
+is enabled only while the response is being generated. Requests to
+endpoints which stream their responses for a long time (like streams
+of events) are never profiled.
+
+"""
+
+import os
+import time
+import atexit
+import random
+import signal
+import logging
+import threading
+import cProfile
+import pstats
+from typing import Dict, Iterable, Optional
+from werkzeug.exceptions import HTTPException
+from werkzeug.routing import Map
+
+PROFILE_TRIGGER_HEADER = "HTTP_X_SWPT_PROFILE"
+UNKNOWN_ENDPOINT = "unknown"
+
+
+class SamplingProfilerMiddleware:
+    """Profile a fraction of the requests with `cProfile`.
+
+    Only one request is profiled at a time (the Python interpreter
+    allows only one active profiler). When a sampled request arrives
+    while another request is being profiled, it will not be profiled.
+    """
+
+    def __init__(
+        self,
+        app,
+        url_map: Map,
+        *,
+        profile_dir: str,
+        sample_rate: float = 0.0,
+        trigger_token: str = "",
+        signal_endpoint: str = "",
+        signal_requests: int = 100,
+        dump_seconds: float = 60.0,
+        excluded_endpoints: Iterable[str] = (),
+    ):
+        self.app = app
+        self.url_map = url_map
+        self.profile_dir = profile_dir
+        self.sample_rate = sample_rate
+        self.trigger_token = trigger_token
+        self.signal_endpoint = signal_endpoint
+        self.signal_requests = signal_requests
+        self.dump_seconds = dump_seconds
+        self.excluded_endpoints = frozenset(excluded_endpoints)
+        self._profiling_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats: Dict[str, pstats.Stats] = {}
+        self._dirty_endpoints = set()
+        self._last_dump_at = time.monotonic()
+        self._triggered_requests = 0
+
+        os.makedirs(profile_dir, exist_ok=True)
+        atexit.register(self.dump_stats)
+
+    def install_signal_handler(self) -> None:
+        """Profile the next requests to the endpoint on SIGURG."""
+
+        def trigger(signum, frame):  # pragma: no cover
+            self._triggered_requests = self.signal_requests
+
+        try:
+            signal.signal(signal.SIGURG, trigger)
+        except ValueError:  # pragma: no cover
+            # Signal handlers can be installed only from the main thread.
+            logging.getLogger(__name__).warning(
+                "Can not install a SIGURG handler for the profiler."
+            )
+
+    def __call__(self, environ, start_response):
+        endpoint = self._choose_endpoint(environ)
+        if endpoint is None or not self._profiling_lock.acquire(False):
+            return self.app(environ, start_response)
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                app_iter = self.app(environ, start_response)
+            finally:
+                profile.disable()
+        except BaseException:
+            self._profiling_lock.release()
+            raise
+
+        # NOTE: The response can be streamed, so its body is generated
+        # while it is being iterated over. The profiling ends when the
+        # response gets closed.
+        return _ProfiledResponse(self, endpoint, profile, app_iter)
+
+    def dump_stats(self) -> None:
+        with self._stats_lock:
+            endpoints = self._dirty_endpoints
+            self._dirty_endpoints = set()
+            self._last_dump_at = time.monotonic()
+
+            for endpoint in endpoints:
+                filename = os.path.join(
+                    self.profile_dir, f"{endpoint}.{os.getpid()}.prof"
+                )
+                tmp_filename = f"{filename}.tmp"
+                self._stats[endpoint].dump_stats(tmp_filename)
+                os.replace(tmp_filename, filename)
+
+    def _choose_endpoint(self, environ) -> Optional[str]:
+        # Returns the request's endpoint if the request should be
+        # profiled, or `None` otherwise.
+        if (
+            self.trigger_token
+            and environ.get(PROFILE_TRIGGER_HEADER) == self.trigger_token
+        ):
+            return self._check_endpoint(self._get_endpoint(environ))
+
+        if self._triggered_requests > 0:
+            endpoint = self._get_endpoint(environ)
+            if (
+                self.signal_endpoint in ("", endpoint)
+                and self._check_endpoint(endpoint) is not None
+            ):
+                with self._stats_lock:
+                    if self._triggered_requests > 0:
+                        self._triggered_requests -= 1
+                        return endpoint
+
+        if random.random() < self.sample_rate:
+            return self._check_endpoint(self._get_endpoint(environ))
+
+        return None
+
+    def _check_endpoint(self, endpoint: str) -> Optional[str]:
+        return None if endpoint in self.excluded_endpoints else endpoint
+
+    def _get_endpoint(self, environ) -> str:
+        try:
+            endpoint, _ = self.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return UNKNOWN_ENDPOINT
+
+        return endpoint
+
+    def _finish_profiling(
+        self, endpoint: str, profile: cProfile.Profile
+    ) -> None:
+        self._profiling_lock.release()
+        self._add_profile(endpoint, profile)
+
+    def _add_profile(self, endpoint: str, profile: cProfile.Profile) -> None:
+        with self._stats_lock:
+            stats = self._stats.get(endpoint)
+            if stats is None:
+                self._stats[endpoint] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            self._dirty_endpoints.add(endpoint)
+            must_dump = (
+                time.monotonic() - self._last_dump_at >= self.dump_seconds
+            )
+
+        if must_dump:
+            self.dump_stats()
+
+
+class _ProfiledResponse:
+    def __init__(
+        self,
+        middleware: SamplingProfilerMiddleware,
+        endpoint: str,
+        profile: cProfile.Profile,
+        app_iter,
+    ):
+        self.middleware = middleware
+        self.endpoint = endpoint
+        self.profile = profile
+        self.app_iter = app_iter
+        self.closed = False
+
+    def __iter__(self):
+        iterator = iter(self.app_iter)
+        while True:
+            self.profile.enable()
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.profile.disable()
+            yield chunk
+
+    def close(self) -> None:
+        if self.closed:
+            return
+
+        self.closed = True
+        try:
+            if hasattr(self.app_iter, "close"):
+                self.profile.enable()
+                try:
+                    self.app_iter.close()
+                finally:
+                    self.profile.disable()
+        finally:
+            self.middleware._finish_profiling(self.endpoint, self.profile)
@@ -1,12 +1,34 @@
 import re
+import json
+import math
+import time
+import logging
+import threading
+from urllib.parse import urlencode
 from random import randint
+from uuid import UUID
 from enum import IntEnum
-from typing import Tuple, Optional
+from typing import Tuple, Optional, List, Callable
 from datetime import datetime, timedelta, timezone
-from flask import redirect, url_for, request, current_app, g, make_response
+from flask import (
+    Flask,
+    redirect,
+    url_for,
+    request,
+    current_app,
+    g,
+    make_response,
+    stream_with_context,
+)
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
-from swpt_pythonlib.utils import u64_to_i64
+from werkzeug.http import (
+    quote_etag,
+    parse_etags,
+    parse_accept_header,
+    is_resource_modified,
+)
+from swpt_pythonlib.utils import u64_to_i64, i64_to_u64
 from swpt_pythonlib.swpt_uris import parse_account_uri
 from swpt_debtors.schemas import (
     DebtorSchema,
@@ -14,7 +36,15 @@ from swpt_debtors.schemas import (
     TransfersListSchema,
     TransferCreationRequestSchema,
     TransfersList,
+    TransfersPageParamsSchema,
+    TransfersPageSchema,
+    TransfersBulkCreationRequestSchema,
+    TransfersBulkCreationResultSchema,
+    TransfersBulkCreationResult,
+    TransfersBulkDeletionRequestSchema,
+    TransfersBulkDeletionResultSchema,
     TransferCancelationRequestSchema,
+    TransferParamsSchema,
     DebtorReservationRequestSchema,
     DebtorReservationSchema,
     DebtorsListSchema,
@@ -23,12 +53,57 @@ from swpt_debtors.schemas import (
     DebtorDeactivationRequestSchema,
     DebtorRestrictionRequestSchema,
     DebtorConfigSchema,
+    DebtorsBulkActivationRequestSchema,
+    DebtorsBulkDeactivationRequestSchema,
+    DebtorsBulkRestrictionRequestSchema,
+    DebtorsBulkOperationResultSchema,
+)
+from swpt_debtors.serializers import (
+    serialize_debtor,
+    serialize_debtor_config,
+    serialize_transfer,
+)
+from swpt_debtors.models import (
+    MIN_INT64,
+    MAX_INT64,
+    MAX_UINT64,
+    Debtor,
+    Document,
+    RunningTransfer,
+    is_valid_debtor_id,
+    calc_debtor_etag,
+    decode_document_content,
+)
+from swpt_debtors.extensions import (
+    db,
+    change_listener,
+    debtor_info_cache,
+    document_cache,
+    uri_builder,
+)
+from swpt_debtors.caches import DebtorInfo, CachedDocument
+from swpt_debtors.notifications import (
+    Change,
+    Subscription,
+    TooManySubscriptions,
+    CHANGE_RESET,
+    CHANGE_TRANSFER_FINALIZED,
+    CHANGE_BALANCE_CHANGED,
+    CHANGE_CONFIG_EFFECTUAL,
+    CHANGE_CONFIG_ERROR,
 )
-from swpt_debtors.models import MIN_INT64, is_valid_debtor_id
 from swpt_debtors import specs
 from swpt_debtors import procedures
+from swpt_debtors import metrics
 
 READ_ONLY_METHODS = ["GET", "HEAD", "OPTIONS"]
+READ_YOUR_WRITES_COOKIE = "swpt_debtors_primary_until"
+DEBTOR_ID_CANDIDATES_COUNT = 10
+DEBTOR_ID_MAX_DRAWS = 100000
+
+# The responses from these endpoints are streamed for a long time, and
+# must not be buffered.
+STREAMING_ENDPOINTS = frozenset(["debtors.DebtorEventsEndpoint"])
 
 
 class UserType(IntEnum):
@@ -75,6 +150,139 @@ class UserIdPatternMatcher:
 user_id_pattern_matcher = UserIdPatternMatcher()
 
 
+class ReplicaLagMonitor:
+    """Keeps track of the replication lag of the replica database.
+
+    The lag is measured by a background thread, every
+    `APP_REPLICA_LAG_CHECK_SECONDS`, so that requests never wait for
+    the replica to respond. When the lag has not been measured
+    recently (because the replica does not respond, for example), it
+    is considered infinite.
+    """
+
+    def __init__(self, app: Flask):
+        self.app = app
+        self.check_interval = app.config["APP_REPLICA_LAG_CHECK_SECONDS"]
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._measured_at = -math.inf
+        self._lag_seconds = math.inf
+
+    def get_lag_seconds(self) -> float:
+        if self._thread is None:
+            self._start()
+
+        measurement_age = time.monotonic() - self._measured_at
+        if measurement_age > 3 * self.check_interval:
+            return math.inf
+
+        return self._lag_seconds
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name="swpt-replica-lag-monitor",
+                    daemon=True,
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                with self.app.app_context():
+                    lag_seconds = procedures.get_replica_lag_seconds()
+            except Exception:
+                logging.getLogger(__name__).exception(
+                    "Caught error while checking the replica lag."
+                )
+                lag_seconds = math.inf
+
+            self._lag_seconds = lag_seconds
+            self._measured_at = time.monotonic()
+            self._stopped.wait(self.check_interval)
+
+
+def get_replica_lag_monitor() -> ReplicaLagMonitor:
+    return current_app.extensions["swpt_replica_lag_monitor"]
+
+
+def has_recent_writes() -> bool:
+    try:
+        primary_until = float(request.cookies[READ_YOUR_WRITES_COOKIE])
+    except (KeyError, ValueError):
+        return False
+
+    return time.time() < primary_until
+
+
+def route_reads_to_replica():
+    """Execute the queries of read-only requests on the replica.
+
+    This is done only if the replica is fresh enough, and the client
+    has not modified any data recently (see `set_read_your_writes_cookie`).
+    Otherwise, the primary database will be used.
+    """
+
+    db.session.info["use_replica"] = (
+        request.method in READ_ONLY_METHODS
+        and bool(current_app.config["SQLALCHEMY_REPLICA_DATABASE_URI"])
+        and not has_recent_writes()
+        and (
+            get_replica_lag_monitor().get_lag_seconds()
+            <= current_app.config["APP_REPLICA_MAX_LAG_SECONDS"]
+        )
+    )
+
+
+def set_read_your_writes_cookie(response):
+    """After a successful modification, stick the client to the primary.
+
+    For `APP_READ_YOUR_WRITES_SECONDS` seconds, the client's read-only
+    requests will be served by the primary database, so that the
+    client will always see its own changes.
+    """
+
+    if (
+        request.method not in READ_ONLY_METHODS
+        and response.status_code < 400
+        and current_app.config["SQLALCHEMY_REPLICA_DATABASE_URI"]
+    ):
+        seconds = current_app.config["APP_READ_YOUR_WRITES_SECONDS"]
+        response.set_cookie(
+            READ_YOUR_WRITES_COOKIE,
+            str(math.ceil(time.time() + seconds)),
+            max_age=math.ceil(seconds),
+            secure=request.is_secure,
+            httponly=True,
+            samesite="Strict",
+        )
+
+    return response
+
+
+def stop_routing_reads_to_replica(exc):
+    db.session.info.pop("use_replica", None)
+
+
+def _init_replica_lag_monitor(state) -> None:
+    state.app.extensions.setdefault(
+        "swpt_replica_lag_monitor", ReplicaLagMonitor(state.app)
+    )
+
+
+def enable_replica_routing(blueprint: Blueprint) -> None:
+    blueprint.record_once(_init_replica_lag_monitor)
+    blueprint.before_request(route_reads_to_replica)
+    blueprint.after_request(set_read_your_writes_cookie)
+    blueprint.teardown_request(stop_routing_reads_to_replica)
+
+
 def parse_swpt_user_id_header() -> Tuple[UserType, Optional[int]]:
     user_id = request.headers.get("X-Swpt-User-Id")
     if user_id is None:
@@ -119,6 +327,65 @@ def ensure_debtor_permissions():
     g.debtor_id = debtor_id
 
 
+def parse_recipient_uri(debtor_id: int, recipient_uri: str) -> str:
+    """Return the recipient, or raise `ValueError` with an error message."""
+
+    try:
+        recipient_debtor_id, recipient = parse_account_uri(recipient_uri)
+    except ValueError:
+        raise ValueError("The URI can not be recognized.") from None
+
+    if recipient_debtor_id != debtor_id:
+        raise ValueError("Invalid recipient account.")
+
+    return recipient
+
+
+def parse_bulk_debtor_ids(debtor_ids: List[str]) -> List[int]:
+    """Return the valid debtor IDs, or abort with "422" error code."""
+
+    max_count = current_app.config["APP_MAX_DEBTORS_PER_BULK_REQUEST"]
+    if len(debtor_ids) > max_count:
+        abort(
+            422,
+            errors={
+                "json": {
+                    "debtorIds": [
+                        f"Can not process more than {max_count} debtors at"
+                        " once."
+                    ]
+                }
+            },
+        )
+
+    parsed_debtor_ids = []
+    errors = {}
+    for i, debtor_id in enumerate(debtor_ids):
+        n = int(debtor_id)
+        if n <= MAX_UINT64 and is_valid_debtor_id(u64_to_i64(n)):
+            parsed_debtor_ids.append(u64_to_i64(n))
+        else:
+            errors[i] = ["Invalid debtor ID."]
+    if errors:
+        abort(422, errors={"json": {"debtorIds": errors}})
+
+    return parsed_debtor_ids
+
+
+def process_debtors_in_chunks(
+    procedure: Callable[..., List[int]], debtor_ids: List[int], *args
+) -> List[int]:
+    """Call the procedure for each chunk, and return processed IDs."""
+
+    chunk_size = current_app.config["APP_DEBTORS_BULK_CHUNK_SIZE"]
+    processed_debtor_ids = []
+    for i in range(0, len(debtor_ids), chunk_size):
+        chunk = debtor_ids[i:i + chunk_size]
+        processed_debtor_ids.extend(procedure(chunk, *args))
+
+    return processed_debtor_ids
+
+
 def calc_reservation_deadline(created_at: datetime) -> datetime:
     return created_at + timedelta(
         days=current_app.config["APP_INACTIVE_DEBTOR_RETENTION_DAYS"]
@@ -134,6 +401,287 @@ def calc_checkup_datetime(debtor_id: int, initiated_at: datetime) -> datetime:
     return current_ts + max(current_delay, average_delay)
 
 
+def make_json_response(data: dict, headers: Optional[dict] = None):
+    """Return a JSON response, bypassing the response schema.
+
+    This is used together with the specialized serializers (see the
+    `serializers` module), which produce exactly the same data as the
+    endpoint's response schema would.
+    """
+
+    response = current_app.json.response(data)
+    if headers:
+        response.headers.update(headers)
+    return response
+
+
+def make_not_modified_response(environ, etag: str):
+    """Return a "304 Not Modified" response, or `None`.
+
+    `None` is returned when the entity tag does not match the request's
+    `If-None-Match` header.
+    """
+
+    if not parse_etags(environ.get("HTTP_IF_NONE_MATCH")).contains_weak(etag):
+        return None
+
+    response = make_response("", 304)
+    response.set_etag(etag)
+    return response
+
+
+def make_debtor_headers(debtor: Debtor) -> dict:
+    return {"ETag": quote_etag(calc_debtor_etag(debtor))}
+
+
+def get_active_debtor_or_not_modified(
+    debtor_id: int,
+    error_code: int,
+    serialize: Optional[Callable[[Debtor, dict], dict]] = None,
+):
+    """Return the debtor, or a "304 Not Modified" response.
+
+    When the request contains an `If-None-Match` header, the debtor's
+    entity tag is calculated by a narrow query, so that unchanged
+    debtors will not be read and serialized. When `serialize` is
+    given, the debtor will be serialized with it, and a JSON response
+    will be returned.
+    """
+
+    environ = request.environ
+    if environ.get("HTTP_IF_NONE_MATCH"):
+        etag = (
+            procedures.get_active_debtor_etag(debtor_id) or abort(error_code)
+        )
+        response = make_not_modified_response(environ, etag)
+        if response is not None:
+            return response
+
+    debtor = procedures.get_active_debtor(debtor_id) or abort(error_code)
+    headers = make_debtor_headers(debtor)
+    if serialize is not None:
+        return make_json_response(serialize(debtor, context), headers)
+
+    return debtor, headers
+
+
+def calc_transfer_wait_seconds(
+    requested_seconds: float, config, blocking: bool
+) -> float:
+    """Return for how long to wait for a transfer to get finalized.
+
+    Requests that hold a thread while waiting (`blocking`) are limited
+    further.
+    """
+
+    seconds = min(requested_seconds, config["APP_TRANSFERS_MAX_WAIT_SECONDS"])
+    if blocking:
+        seconds = min(
+            seconds, config["APP_TRANSFERS_MAX_BLOCKING_WAIT_SECONDS"]
+        )
+
+    return seconds
+
+
+def is_transfer_wait_over(transfer: Optional[RunningTransfer]) -> bool:
+    return transfer is None or transfer.is_finalized
+
+
+def may_finalize_transfer(change: Change, transfer_uuid: UUID) -> bool:
+    """Return whether the transfer may have been finalized by the change."""
+
+    return change.change_type == CHANGE_RESET or (
+        change.change_type == CHANGE_TRANSFER_FINALIZED
+        and change.object_id == str(transfer_uuid)
+    )
+
+
+def wait_for_transfer_finalization(
+    debtor_id: int, transfer_uuid: UUID, timeout: float
+) -> Optional[RunningTransfer]:
+    """Return the transfer, once it has been finalized.
+
+    If the transfer has not been finalized before the timeout expires,
+    the not finalized transfer will be returned. The database
+    connection is released while waiting.
+    """
+
+    # The change notifications come from the primary database, so a
+    # replica could be lagging behind them.
+    db.session.info["use_replica"] = False
+
+    deadline = time.monotonic() + timeout
+    try:
+        subscription = change_listener.subscribe(debtor_id)
+    except TooManySubscriptions:
+        return procedures.get_running_transfer(debtor_id, transfer_uuid)
+
+    try:
+        while True:
+            transfer = procedures.get_running_transfer(
+                debtor_id, transfer_uuid
+            )
+            if is_transfer_wait_over(transfer):
+                return transfer
+
+            db.session.close()
+            while True:
+                change = subscription.get(deadline - time.monotonic())
+                if change is None:
+                    return transfer
+                if may_finalize_transfer(change, transfer_uuid):
+                    break
+    finally:
+        subscription.close()
+
+
+def get_debtor_info(debtor: Optional[Debtor]) -> DebtorInfo:
+    if debtor is None:
+        return 410, None
+    if not debtor.debtor_info_iri:
+        return 404, None
+    return 302, debtor.debtor_info_iri
+
+
+def make_debtor_info_redirect(info: DebtorInfo):
+    status_code, location = info
+    if status_code != 302:
+        abort(status_code)
+
+    response = redirect(location, code=302)
+    response.headers["Cache-Control"] = "max-age=86400"
+
+    return response
+
+
+def make_cached_document(document: Document) -> CachedDocument:
+    return CachedDocument(
+        content_type=document.content_type,
+        content=document.content,
+        etag=document.etag,
+        inserted_at=document.inserted_at,
+        content_encoding=document.content_encoding,
+    )
+
+
+def is_conditional_request(environ) -> bool:
+    return bool(
+        environ.get("HTTP_IF_NONE_MATCH")
+        or environ.get("HTTP_IF_MODIFIED_SINCE")
+    )
+
+
+def accepts_content_encoding(environ, content_encoding: Optional[str]) -> bool:
+    if content_encoding is None:
+        return True
+
+    accept_encodings = parse_accept_header(
+        environ.get("HTTP_ACCEPT_ENCODING")
+    )
+    return accept_encodings[content_encoding] > 0
+
+
+def make_document_headers(
+    environ, content_type: str, content_encoding: Optional[str]
+) -> dict:
+    headers = {
+        "Content-Type": content_type,
+        "Cache-Control": "max-age=31536000",
+    }
+    if content_encoding is not None:
+        # NOTE: The stored content is sent as is to clients that
+        # accept its encoding, and is decompressed for other clients.
+        headers["Vary"] = "Accept-Encoding"
+        if accepts_content_encoding(environ, content_encoding):
+            headers["Content-Encoding"] = content_encoding
+
+    return headers
+
+
+def make_document_etag(etag: str, headers: dict) -> str:
+    """Return the ETag of the representation that will be sent.
+
+    Representations that are sent with a content coding get their own
+    strong ETags, which differ from the ETag of the decoded content.
+    """
+
+    content_encoding = headers.get("Content-Encoding")
+    if content_encoding is None:
+        return etag
+
+    return f"{etag}-{content_encoding}"
+
+
+def can_defer_document_content(environ) -> bool:
+    """Return whether the response may not need the document's content.
+
+    For `HEAD` and conditional requests, the document's content should
+    not be loaded, unless it is really needed (see
+    `make_document_metadata_response`).
+    """
+
+    return environ["REQUEST_METHOD"] == "HEAD" or is_conditional_request(
+        environ
+    )
+
+
+def make_document_metadata_response(environ, document: Document):
+    """Return a response which does not contain the document's content.
+
+    `None` is returned when the response needs the document's content
+    (see `make_document_response`). The document's content may be
+    deferred.
+    """
+
+    headers = make_document_headers(
+        environ, document.content_type, document.content_encoding
+    )
+    etag = make_document_etag(document.etag, headers)
+    if is_conditional_request(environ) and not is_resource_modified(
+        environ, etag=etag, last_modified=document.inserted_at
+    ):
+        headers.pop("Content-Encoding", None)
+        response = make_response(b"", 304, headers)
+    elif environ["REQUEST_METHOD"] == "HEAD" and accepts_content_encoding(
+        environ, document.content_encoding
+    ):
+        response = make_response(b"", headers)
+        response.content_length = document.content_length
+    else:
+        return None
+
+    response.set_etag(etag)
+    response.last_modified = document.inserted_at
+    return response
+
+
+def make_document_response(environ, document: CachedDocument):
+    headers = make_document_headers(
+        environ, document.content_type, document.content_encoding
+    )
+    etag = make_document_etag(document.etag, headers)
+    if is_conditional_request(environ) and not is_resource_modified(
+        environ, etag=etag, last_modified=document.inserted_at
+    ):
+        headers.pop("Content-Encoding", None)
+        response = make_response(b"", 304, headers)
+    else:
+        content = document.content
+        if "Content-Encoding" not in headers:
+            content = decode_document_content(
+                content, document.content_encoding
+            )
+        if environ["REQUEST_METHOD"] == "HEAD":
+            response = make_response(b"", headers)
+            response.content_length = len(content)
+        else:
+            response = make_response(content, headers)
+
+    response.set_etag(etag)
+    response.last_modified = document.inserted_at
+    return response
+
+
 context = {
     "Debtor": "debtors.DebtorEndpoint",
     "DebtorConfig": "debtors.DebtorConfigEndpoint",
@@ -145,6 +693,116 @@ context = {
     "calc_checkup_datetime": calc_checkup_datetime,
 }
 
+CHANGE_ENDPOINTS = {
+    CHANGE_RESET: context["Debtor"],
+    CHANGE_BALANCE_CHANGED: context["Debtor"],
+    CHANGE_CONFIG_EFFECTUAL: context["DebtorConfig"],
+    CHANGE_CONFIG_ERROR: context["DebtorConfig"],
+    CHANGE_TRANSFER_FINALIZED: context["Transfer"],
+}
+
+
+def format_debtor_event(change: Change) -> str:
+    """Format a change as a Server-Sent Event.
+
+    The event's data contains the URI of the changed resource, so
+    that the client can fetch it. (`Reset` events say that the client
+    should re-fetch all the resources that it is interested in.)
+    """
+
+    endpoint = CHANGE_ENDPOINTS[change.change_type]
+    if endpoint == context["Transfer"]:
+        uri = uri_builder.build(
+            endpoint,
+            debtorId=change.debtor_id,
+            transferUuid=change.object_id,
+        )
+    else:
+        uri = uri_builder.build(endpoint, debtorId=change.debtor_id)
+
+    data = json.dumps({"uri": uri})
+    return f"event: {change.change_type}\ndata: {data}\n\n"
+
+
+DEBTOR_EVENTS_MIMETYPE = "text/event-stream"
+DEBTOR_EVENTS_HEADERS = {
+    "Cache-Control": "no-store",
+    "X-Accel-Buffering": "no",
+}
+
+
+class DebtorEventStream:
+    """Paces and formats a stream of debtor's change events.
+
+    The stream starts with a `Reset` event, contains a keepalive
+    comment whenever there were no changes for a while, and ends after
+    `APP_EVENTS_STREAM_MAX_SECONDS`.
+    """
+
+    def __init__(self, debtor_id: int, config):
+        self.debtor_id = debtor_id
+        self.keepalive_seconds = config["APP_EVENTS_KEEPALIVE_SECONDS"]
+        self.deadline = (
+            time.monotonic() + config["APP_EVENTS_STREAM_MAX_SECONDS"]
+        )
+
+    def get_reset_event(self) -> str:
+        return format_debtor_event(Change(self.debtor_id, CHANGE_RESET))
+
+    def get_wait_seconds(self) -> Optional[float]:
+        """Return for how long to wait for a change, or `None`.
+
+        `None` is returned when the stream should end. The client will
+        reconnect, and will receive a `Reset` event.
+        """
+
+        remaining_seconds = self.deadline - time.monotonic()
+        if remaining_seconds <= 0.0:
+            return None
+
+        return min(self.keepalive_seconds, remaining_seconds)
+
+    def format_change(self, change: Optional[Change]) -> Optional[str]:
+        """Format the received change, or `None` on timeout."""
+
+        if change is None:
+            return ": keepalive\n\n"
+        if change.change_type in CHANGE_ENDPOINTS:
+            return format_debtor_event(change)
+
+        return None
+
+
+def generate_debtor_events(subscription: Subscription):
+    stream = DebtorEventStream(subscription.debtor_id, current_app.config)
+
+    yield stream.get_reset_event()
+    while (wait_seconds := stream.get_wait_seconds()) is not None:
+        event = stream.format_change(subscription.get(wait_seconds))
+        if event is not None:
+            yield event
+
+
+def generate_debtor_id_candidates() -> List[int]:
+    """Return a list of random debtor IDs which are valid for this node.
+
+    Because debtor IDs are assigned to shards by hashing them, this
+    simply draws random IDs, and throws away the IDs that belong to
+    other shards.
+    """
+
+    min_debtor_id = current_app.config["MIN_DEBTOR_ID"]
+    max_debtor_id = current_app.config["MAX_DEBTOR_ID"]
+    candidates = []
+    for _ in range(DEBTOR_ID_MAX_DRAWS):
+        debtor_id = randint(min_debtor_id, max_debtor_id)
+        if is_valid_debtor_id(debtor_id):
+            candidates.append(debtor_id)
+            if len(candidates) >= DEBTOR_ID_CANDIDATES_COUNT:
+                break
+
+    return candidates
+
 
 admin_api = Blueprint(
     "admin",
@@ -159,6 +817,7 @@ admin_api = Blueprint(
     """,
 )
 admin_api.before_request(ensure_admin)
+enable_replica_routing(admin_api)
 
 
 @admin_api.route("/.debtor-reserve")
@@ -178,28 +837,13 @@ class RandomDebtorReserveEndpoint(MethodView):
 
         """
 
-        min_debtor_id = current_app.config["MIN_DEBTOR_ID"]
-        max_debtor_id = current_app.config["MAX_DEBTOR_ID"]
-        for _ in range(100):
-            debtor_id = randint(min_debtor_id, max_debtor_id)
-            if not is_valid_debtor_id(debtor_id):  # pragma: no cover
-                abort(
-                    500,
-                    message=(
-                        "The /.debtor-reserve endpoint does not support"
-                        " shards."
-                    ),
-                )
-            try:
-                debtor = procedures.reserve_debtor(debtor_id)
-                break
-            except procedures.DebtorExists:  # pragma: no cover
-                pass
-        else:  # pragma: no cover
+        try:
+            return procedures.reserve_random_debtor(
+                generate_debtor_id_candidates()
+            )
+        except procedures.DebtorExists:  # pragma: no cover
             abort(500, message="Can not generate a valid debtor ID.")
 
-        return debtor
-
 
 @admin_api.route("/.list")
 class DebtorsListEndpoint(MethodView):
@@ -248,27 +892,162 @@ class DebtorEnumerateEndpoint(MethodView):
         """
 
         n = int(current_app.config["APP_DEBTORS_PER_PAGE"])
-        debtor_ids, next_debtor_id = procedures.get_debtor_ids(
-            start_from=debtorId, count=n
+        match_all_shards = (
+            current_app.config["PROTOCOL_BROKER_QUEUE_ROUTING_KEY"] == "#"
+        )
+        sharding_realm = current_app.config["SHARDING_REALM"]
+        debtor_ids = procedures.get_debtor_ids(
+            start_from=debtorId,
+            count=n + 1,
+            min_debtor_id=current_app.config["MIN_DEBTOR_ID"],
+            max_debtor_id=current_app.config["MAX_DEBTOR_ID"],
         )
-        debtor_uris = [
-            {"uri": url_for("debtors.DebtorEndpoint", debtorId=debtor_id)}
-            for debtor_id in debtor_ids
-            if is_valid_debtor_id(debtor_id)
-        ]
 
-        if next_debtor_id is None:
-            # The last page does not have a 'next' link.
-            return {
-                "uri": request.full_path,
-                "items": debtor_uris,
-            }
+        # NOTE: Calling `url_for` for each one of the (possibly
+        # thousands) listed debtors is slow. Instead, the JSON-encoded
+        # items are generated from precomputed templates.
+        debtor_uri_prefix, debtor_uri_suffix = _split_uri_template(
+            "debtors.DebtorEndpoint"
+        )
+        item_prefix = '{"uri":' + debtor_uri_prefix
+        item_suffix = debtor_uri_suffix + "}"
+        next_uri_prefix, next_uri_suffix = _split_uri_template(
+            "admin.DebtorEnumerateEndpoint"
+        )
+        page_uri = json.dumps(request.full_path)
+
+        def generate_page():
+            # NOTE: The keys must be sorted, just as the keys in the
+            # other JSON responses are.
+            yield '{"items":['
+            items = []
+            separator = ""
+            next_debtor_id = None
+            for count, debtor_id in enumerate(debtor_ids):
+                if count == n:
+                    next_debtor_id = debtor_id
+                    break
+                if match_all_shards or sharding_realm.match(debtor_id):
+                    items.append(
+                        f"{item_prefix}{i64_to_u64(debtor_id)}{item_suffix}"
+                    )
+                    if len(items) >= 1000:
+                        yield separator + ",".join(items)
+                        separator = ","
+                        items.clear()
+
+            if items:
+                yield separator + ",".join(items)
+            yield "],"
+            if next_debtor_id is not None:
+                yield (
+                    f'"next":{next_uri_prefix}'
+                    f"{i64_to_u64(next_debtor_id)}{next_uri_suffix},"
+                )
+            yield f'"type":"ObjectReferencesPage","uri":{page_uri}}}\n'
+
+        # NOTE: The IDs have been fetched before the response starts,
+        # so that the database transaction ends before the first byte
+        # is sent. Otherwise, a slow client would hold a database
+        # connection (and an open transaction), and a database error
+        # would result in a truncated page, with a "200" status code.
+        return current_app.response_class(
+            generate_page(),
+            mimetype=current_app.json.mimetype,
+        )
 
+
+def _split_uri_template(endpoint: str) -> Tuple[str, str]:
+    # Returns the JSON-encoded parts of the endpoint's URI that
+    # precede and follow the debtor ID.
+    sentinel = str(i64_to_u64(MAX_INT64))
+    uri = url_for(endpoint, debtorId=MAX_INT64)
+    prefix, suffix = json.dumps(uri).split(sentinel)
+    return prefix, suffix
+
+
+@admin_api.route("/.bulk-activate")
+class DebtorsBulkActivateEndpoint(MethodView):
+    @admin_api.arguments(DebtorsBulkActivationRequestSchema)
+    @admin_api.response(200, DebtorsBulkOperationResultSchema)
+    @admin_api.doc(
+        operationId="activateDebtors", security=specs.SCOPE_ACTIVATE
+    )
+    def post(self, debtors_bulk_activation_request):
+        """Create and activate many new debtors at once.
+
+        Debtor IDs which are already taken (including reserved debtor
+        IDs) will be skipped. The result contains the IDs of the newly
+        activated debtors.
+
+        """
+
+        debtor_ids = parse_bulk_debtor_ids(
+            debtors_bulk_activation_request["debtor_ids"]
+        )
         return {
-            "uri": request.full_path,
-            "items": debtor_uris,
-            "next": url_for(
-                "admin.DebtorEnumerateEndpoint", debtorId=next_debtor_id
+            "debtor_ids": process_debtors_in_chunks(
+                procedures.activate_debtors, debtor_ids
+            ),
+        }
+
+
+@admin_api.route("/.bulk-deactivate")
+class DebtorsBulkDeactivateEndpoint(MethodView):
+    @admin_api.arguments(DebtorsBulkDeactivationRequestSchema)
+    @admin_api.response(200, DebtorsBulkOperationResultSchema)
+    @admin_api.doc(
+        operationId="deactivateDebtors", security=specs.SCOPE_DEACTIVATE
+    )
+    def post(self, debtors_bulk_deactivation_request):
+        """Deactivate many debtors at once.
+
+        Debtors that do not exist, or are not active, will be
+        skipped. The result contains the IDs of the deactivated
+        debtors.
+
+        """
+
+        if not g.superuser:
+            abort(403)
+
+        debtor_ids = parse_bulk_debtor_ids(
+            debtors_bulk_deactivation_request["debtor_ids"]
+        )
+        return {
+            "debtor_ids": process_debtors_in_chunks(
+                procedures.deactivate_debtors, debtor_ids
+            ),
+        }
+
+
+@admin_api.route("/.bulk-restrict")
+class DebtorsBulkRestrictEndpoint(MethodView):
+    @admin_api.arguments(DebtorsBulkRestrictionRequestSchema)
+    @admin_api.response(200, DebtorsBulkOperationResultSchema)
+    @admin_api.doc(
+        operationId="restrictDebtors", security=specs.SCOPE_RESTRICT
+    )
+    def post(self, debtors_bulk_restriction_request):
+        """Restrict the maximum amounts that many debtors are allowed to issue.
+
+        Debtors that do not exist, or are not active, will be
+        skipped. The result contains the IDs of the restricted
+        debtors.
+
+        """
+
+        if not g.superuser:
+            abort(403)
+
+        debtor_ids = parse_bulk_debtor_ids(
+            debtors_bulk_restriction_request["debtor_ids"]
+        )
+        return {
+            "debtor_ids": process_debtors_in_chunks(
+                procedures.restrict_debtors,
+                debtor_ids,
+                debtors_bulk_restriction_request["min_balance"],
             ),
         }
 
@@ -391,6 +1170,22 @@ debtors_api = Blueprint(
     """,
 )
 debtors_api.before_request(ensure_debtor_permissions)
+enable_replica_routing(debtors_api)
+
+
+def _init_blocking_event_streams(state) -> None:
+    # Under WSGI, every open stream of events holds a server thread.
+    # Therefore, only a few streams are allowed to be open at the same
+    # time. (Under ASGI, the streams are served by `AsyncReadsApp`.)
+    state.app.extensions.setdefault(
+        "swpt_blocking_event_streams",
+        threading.BoundedSemaphore(
+            state.app.config["APP_MAX_BLOCKING_EVENT_STREAMS"]
+        ),
+    )
+
+
+debtors_api.record_once(_init_blocking_event_streams)
 
 
 @debtors_api.route("/.debtor")
@@ -414,37 +1209,118 @@ class RedirectToDebtorEndpoint(MethodView):
 
 @debtors_api.route("/<i64:debtorId>/", parameters=[specs.DEBTOR_ID])
 class DebtorEndpoint(MethodView):
-    @debtors_api.response(200, DebtorSchema(context=context))
+    @debtors_api.response(
+        200, DebtorSchema(context=context), headers=specs.ETAG_HEADER
+    )
     @debtors_api.doc(
-        operationId="getDebtor", security=specs.SCOPE_ACCESS_READONLY
+        operationId="getDebtor",
+        security=specs.SCOPE_ACCESS_READONLY,
+        responses={304: specs.NOT_MODIFIED},
     )
     def get(self, debtorId):
         """Return debtor."""
 
-        return procedures.get_active_debtor(debtorId) or abort(403)
+        return get_active_debtor_or_not_modified(
+            debtorId, 403, serialize_debtor
+        )
+
+
+@debtors_api.route("/<i64:debtorId>/events", parameters=[specs.DEBTOR_ID])
+class DebtorEventsEndpoint(MethodView):
+    @debtors_api.response(200)
+    @debtors_api.doc(
+        operationId="getDebtorEvents",
+        security=specs.SCOPE_ACCESS_READONLY,
+        responses={
+            200: specs.DEBTOR_EVENTS_CONTENT,
+            503: specs.TOO_MANY_SUBSCRIPTIONS,
+        },
+    )
+    def get(self, debtorId):
+        """Return a stream of debtor's change events.
+
+        The response is a `text/event-stream` ([Server-Sent
+        Events](https://html.spec.whatwg.org/multipage/server-sent-events.html)),
+        which can be consumed instead of repeatedly polling the
+        server. The data of each event is a JSON object, whose `uri`
+        field contains the URI of the changed resource. The types of
+        events are: `BalanceChanged` (the debtor), `ConfigEffectual`
+        and `ConfigError` (the debtor's configuration),
+        `TransferFinalized` (a transfer), and `Reset`. A `Reset`
+        event is always sent first, and means that the client should
+        re-fetch all the resources that it is interested in. Note
+        that `BalanceChanged` events are sent only if the server has
+        been configured to publish them.
+
+        The server closes the stream every few minutes. Clients
+        should reconnect when this happens.
+
+        """
+
+        procedures.get_active_debtor(debtorId) or abort(403)
+        streams = current_app.extensions["swpt_blocking_event_streams"]
+        if not streams.acquire(blocking=False):
+            abort(503)
+
+        try:
+            subscription = change_listener.subscribe(debtorId)
+        except TooManySubscriptions:
+            streams.release()
+            abort(503)
+
+        # Do not hold a database connection while streaming.
+        db.session.close()
+
+        response = current_app.response_class(
+            stream_with_context(generate_debtor_events(subscription)),
+            mimetype=DEBTOR_EVENTS_MIMETYPE,
+            headers=DEBTOR_EVENTS_HEADERS,
+        )
+        response.call_on_close(subscription.close)
+        response.call_on_close(streams.release)
+        return response
 
 
 @debtors_api.route("/<i64:debtorId>/config", parameters=[specs.DEBTOR_ID])
 class DebtorConfigEndpoint(MethodView):
-    @debtors_api.response(200, DebtorConfigSchema(context=context))
+    @debtors_api.response(
+        200, DebtorConfigSchema(context=context), headers=specs.ETAG_HEADER
+    )
     @debtors_api.doc(
-        operationId="getDebtorConfig", security=specs.SCOPE_ACCESS_READONLY
+        operationId="getDebtorConfig",
+        security=specs.SCOPE_ACCESS_READONLY,
+        responses={304: specs.NOT_MODIFIED},
     )
     def get(self, debtorId):
         """Return debtors's configuration."""
 
-        return procedures.get_active_debtor(debtorId) or abort(404)
+        return get_active_debtor_or_not_modified(
+            debtorId, 404, serialize_debtor_config
+        )
 
     @debtors_api.arguments(DebtorConfigSchema)
-    @debtors_api.response(200, DebtorConfigSchema(context=context))
+    @debtors_api.response(
+        200, DebtorConfigSchema(context=context), headers=specs.ETAG_HEADER
+    )
     @debtors_api.doc(
         operationId="updateDebtorConfig",
         security=specs.SCOPE_ACCESS_MODIFY,
-        responses={403: specs.FORBIDDEN_OPERATION, 409: specs.UPDATE_CONFLICT},
+        responses={
+            403: specs.FORBIDDEN_OPERATION,
+            409: specs.UPDATE_CONFLICT,
+            412: specs.PRECONDITION_FAILED,
+        },
     )
     def patch(self, debtor_config, debtorId):
-        """Update debtor's configuration."""
+        """Update debtor's configuration.
+
+        **Note:** When the request contains an `If-Match` header, the
+        configuration will be updated only if the debtor's current
+        entity tag is one of the listed entity tags.
 
+        """
+
+        if_match = request.if_match
         try:
             config = procedures.update_debtor_config(
                 debtor_id=debtorId,
@@ -453,6 +1329,9 @@ class DebtorConfigEndpoint(MethodView):
                 max_actions_per_month=current_app.config[
                     "APP_MAX_TRANSFERS_PER_MONTH"
                 ],
+                if_match=(
+                    if_match if if_match and not if_match.star_tag else None
+                ),
             )
         except procedures.TooManyManagementActions:
             abort(403)
@@ -462,8 +1341,10 @@ class DebtorConfigEndpoint(MethodView):
             abort(
                 409, errors={"json": {"latestUpdateId": ["Incorrect value."]}}
             )
+        except procedures.VersionMismatch:
+            abort(412)
 
-        return config
+        return config, make_debtor_headers(config)
 
 
 transfers_api = Blueprint(
@@ -481,6 +1362,7 @@ transfers_api = Blueprint(
     """,
 )
 transfers_api.before_request(ensure_debtor_permissions)
+enable_replica_routing(transfers_api)
 
 
 @transfers_api.route(
@@ -520,27 +1402,9 @@ class TransfersListEndpoint(MethodView):
         # Verify the recipient.
         recipient_uri = transfer_creation_request["recipient_identity"]["uri"]
         try:
-            recipient_debtor_id, recipient = parse_account_uri(recipient_uri)
-        except ValueError:
-            abort(
-                422,
-                errors={
-                    "json": {
-                        "recipient": {
-                            "uri": ["The URI can not be recognized."]
-                        }
-                    }
-                },
-            )
-        if recipient_debtor_id != debtorId:
-            abort(
-                422,
-                errors={
-                    "json": {
-                        "recipient": {"uri": ["Invalid recipient account."]}
-                    }
-                },
-            )
+            recipient = parse_recipient_uri(debtorId, recipient_uri)
+        except ValueError as e:
+            abort(422, errors={"json": {"recipient": {"uri": [str(e)]}}})
 
         uuid = transfer_creation_request["transfer_uuid"]
         location = url_for(
@@ -579,21 +1443,238 @@ class TransfersListEndpoint(MethodView):
         return transfer, {"Location": location}
 
 
+@transfers_api.route(
+    "/<i64:debtorId>/transfers/.page", parameters=[specs.DEBTOR_ID]
+)
+class TransfersPageEndpoint(MethodView):
+    @transfers_api.arguments(TransfersPageParamsSchema, location="query")
+    @transfers_api.response(200, TransfersPageSchema(context=context))
+    @transfers_api.doc(
+        operationId="getTransfersPage", security=specs.SCOPE_ACCESS_READONLY
+    )
+    def get(self, params, debtorId):
+        """Return a page of debtor's transfers.
+
+        The returned object will be a fragment (a page) of a paginated
+        list. Unlike the debtor's `TransfersList`, which contains only
+        links to the transfers, the returned fragment contains the
+        transfers themselves. Optionally, only finalized, or only not
+        finalized transfers can be requested.
+
+        """
+
+        n = int(current_app.config["APP_TRANSFERS_PER_PAGE"])
+        finalized = params.get("finalized")
+        try:
+            transfers = procedures.get_debtor_transfers(
+                debtorId,
+                finalized=finalized,
+                prev=params.get("prev"),
+                count=n,
+            )
+        except procedures.DebtorDoesNotExist:
+            abort(404)
+
+        page = {
+            "uri": request.full_path,
+            "items": transfers,
+        }
+        if len(transfers) == n:
+            next_params = {"prev": str(transfers[-1].transfer_uuid)}
+            if finalized is not None:
+                next_params["finalized"] = "true" if finalized else "false"
+            page["next"] = "?" + urlencode(next_params)
+
+        return page
+
+
+@transfers_api.route(
+    "/<i64:debtorId>/transfers/.bulk-create", parameters=[specs.DEBTOR_ID]
+)
+class TransfersBulkCreateEndpoint(MethodView):
+    @transfers_api.arguments(TransfersBulkCreationRequestSchema)
+    @transfers_api.response(
+        200, TransfersBulkCreationResultSchema(context=context)
+    )
+    @transfers_api.doc(
+        operationId="createTransfers",
+        security=specs.SCOPE_ACCESS_MODIFY,
+        responses={403: specs.FORBIDDEN_OPERATION},
+    )
+    def post(self, transfers_bulk_creation_request, debtorId):
+        """Initiate many credit-issuing transfers at once.
+
+        The result contains one item for each transfer in the request.
+        The status of each item will be `created` when a new transfer
+        has been initiated, `exists` when the same transfer has been
+        initiated before, and `conflict` when a different transfer
+        with the same UUID already exists. This is an idempotent
+        operation.
+
+        ---
+        Will fail if the number of the new transfers exceeds some
+        limit. In this case, none of the transfers will be initiated.
+
+        """
+
+        transfer_creation_requests = transfers_bulk_creation_request[
+            "transfers"
+        ]
+        max_count = current_app.config["APP_MAX_TRANSFERS_PER_BULK_REQUEST"]
+        if len(transfer_creation_requests) > max_count:
+            abort(
+                422,
+                errors={
+                    "json": {
+                        "transfers": [
+                            f"Can not initiate more than {max_count}"
+                            " transfers at once."
+                        ]
+                    }
+                },
+            )
+
+        # Verify the recipients.
+        transfers = []
+        errors = {}
+        for i, transfer_creation_request in enumerate(
+            transfer_creation_requests
+        ):
+            recipient_uri = transfer_creation_request["recipient_identity"][
+                "uri"
+            ]
+            try:
+                recipient = parse_recipient_uri(debtorId, recipient_uri)
+            except ValueError as e:
+                errors[i] = {"recipient": {"uri": [str(e)]}}
+                continue
+
+            transfers.append(
+                {
+                    "transfer_uuid": transfer_creation_request[
+                        "transfer_uuid"
+                    ],
+                    "amount": transfer_creation_request["amount"],
+                    "recipient_uri": recipient_uri,
+                    "recipient": recipient,
+                    "transfer_note_format": transfer_creation_request[
+                        "transfer_note_format"
+                    ],
+                    "transfer_note": transfer_creation_request[
+                        "transfer_note"
+                    ],
+                }
+            )
+        if errors:
+            abort(422, errors={"json": {"transfers": errors}})
+
+        try:
+            results = procedures.initiate_running_transfers(
+                debtor_id=debtorId,
+                transfers=transfers,
+                max_actions_per_month=current_app.config[
+                    "APP_MAX_TRANSFERS_PER_MONTH"
+                ],
+            )
+        except (
+            procedures.TooManyManagementActions,
+            procedures.TooManyRunningTransfers,
+        ):
+            abort(403)
+        except procedures.DebtorDoesNotExist:
+            abort(404)
+
+        return TransfersBulkCreationResult(debtor_id=debtorId, items=results)
+
+
+@transfers_api.route(
+    "/<i64:debtorId>/transfers/.bulk-delete", parameters=[specs.DEBTOR_ID]
+)
+class TransfersBulkDeleteEndpoint(MethodView):
+    @transfers_api.arguments(TransfersBulkDeletionRequestSchema)
+    @transfers_api.response(200, TransfersBulkDeletionResultSchema)
+    @transfers_api.doc(
+        operationId="deleteTransfers", security=specs.SCOPE_ACCESS_MODIFY
+    )
+    def post(self, transfers_bulk_deletion_request, debtorId):
+        """Delete many transfers at once.
+
+        Deletes all debtor's transfers that match the specified
+        criteria. When both `transferUuids` and `finalizedBefore` are
+        specified, only transfers that match both criteria will be
+        deleted. Transfers that do not exist are ignored.
+
+        **Note:** The same considerations apply as when deleting a
+        single transfer. In particular, deleting a running (not
+        finalized) transfer does not cancel it.
+
+        """
+
+        transfer_uuids = transfers_bulk_deletion_request.get(
+            "optional_transfer_uuids"
+        )
+        max_count = current_app.config["APP_MAX_TRANSFERS_PER_BULK_REQUEST"]
+        if transfer_uuids is not None and len(transfer_uuids) > max_count:
+            abort(
+                422,
+                errors={
+                    "json": {
+                        "transferUuids": [
+                            f"Can not delete more than {max_count}"
+                            " transfers at once."
+                        ]
+                    }
+                },
+            )
+
+        deleted_count = procedures.delete_running_transfers(
+            debtorId,
+            transfer_uuids=transfer_uuids,
+            finalized_before=transfers_bulk_deletion_request.get(
+                "optional_finalized_before"
+            ),
+        )
+
+        return {"deleted_count": deleted_count}
+
+
 @transfers_api.route(
     "/<i64:debtorId>/transfers/<uuid:transferUuid>",
     parameters=[specs.DEBTOR_ID, specs.TRANSFER_UUID],
 )
 class TransferEndpoint(MethodView):
+    @transfers_api.arguments(TransferParamsSchema, location="query")
     @transfers_api.response(200, TransferSchema(context=context))
     @transfers_api.doc(
         operationId="getTransfer", security=specs.SCOPE_ACCESS_READONLY
     )
-    def get(self, debtorId, transferUuid):
-        """Return a transfer."""
+    def get(self, params, debtorId, transferUuid):
+        """Return a transfer.
 
-        return procedures.get_running_transfer(
-            debtorId, transferUuid
-        ) or abort(404)
+        When the `waitFor=finalization` query parameter is passed, the
+        response will be delayed until the transfer gets finalized (or
+        the timeout expires). This allows clients to wait for the
+        finalization of the transfer, instead of repeatedly polling
+        the server until `finalizedAt` appears.
+
+        """
+
+        if params.get("wait_for") == "finalization":
+            # NOTE: The waiting request holds a thread here, so the
+            # waiting time is limited further. The ASGI application
+            # (see the `asgi` module) waits without holding a thread.
+            timeout = calc_transfer_wait_seconds(
+                params["timeout"], current_app.config, blocking=True
+            )
+            transfer = wait_for_transfer_finalization(
+                debtorId, transferUuid, timeout
+            ) or abort(404)
+        else:
+            transfer = procedures.get_running_transfer(
+                debtorId, transferUuid
+            ) or abort(404)
+
+        return make_json_response(serialize_transfer(transfer, context))
 
     @transfers_api.arguments(TransferCancelationRequestSchema)
     @transfers_api.response(200, TransferSchema(context=context))
@@ -654,6 +1735,7 @@ documents_api = Blueprint(
     describes the debtor's currency (a public info document).
     """,
 )
+enable_replica_routing(documents_api)
 
 
 @documents_api.route("/<i64:debtorId>/public", parameters=[specs.DEBTOR_ID])
@@ -675,15 +1757,21 @@ class RedirectToDebtorsInfoEndpoint(MethodView):
         if not is_valid_debtor_id(debtorId):  # pragma: no cover
             abort(404)
 
-        debtor = (
-            procedures.get_active_debtor(debtorId, defer_toasted=True)
-            or abort(410)
-        )
-        location = debtor.debtor_info_iri or abort(404)
-        response = redirect(location, code=302)
-        response.headers["Cache-Control"] = "max-age=86400"
+        info = debtor_info_cache.get(debtorId)
+        if info is None:
+            # NOTE: The cache is invalidated by the change notifications,
+            # which may arrive before the replica has caught up with
+            # the primary. Therefore, the cache is always filled from
+            # the primary, so that a stale info does not get cached.
+            db.session.info["use_replica"] = False
+            token = debtor_info_cache.get_token()
+            debtor = procedures.get_active_debtor(
+                debtorId, defer_toasted=True
+            )
+            info = get_debtor_info(debtor)
+            debtor_info_cache.set(debtorId, info, token)
 
-        return response
+        return make_debtor_info_redirect(info)
 
 
 @documents_api.route(
@@ -742,6 +1830,10 @@ class SaveDocumentEndpoint(MethodView):
             documentId=document.document_id,
         )
 
+        document_cache.set(
+            debtorId, document.document_id, make_cached_document(document)
+        )
+
         return make_response(
             content, 201, {"Content-Type": content_type, "Location": location}
         )
@@ -754,7 +1846,8 @@ class SaveDocumentEndpoint(MethodView):
 class DocumentEndpoint(MethodView):
     @documents_api.response(200)
     @documents_api.doc(
-        operationId="getDocument", responses={200: specs.DOCUMENT_CONTENT}
+        operationId="getDocument",
+        responses={200: specs.DOCUMENT_CONTENT, 304: specs.NOT_MODIFIED},
     )
     def get(self, debtorId, documentId):
         """Return a saved document.
@@ -768,13 +1861,27 @@ class DocumentEndpoint(MethodView):
         if not is_valid_debtor_id(debtorId):  # pragma: no cover
             abort(404)
 
-        document = procedures.get_document(debtorId, documentId) or abort(404)
-        headers = {
-            "Content-Type": document.content_type,
-            "Cache-Control": "max-age=31536000",
-        }
+        environ = request.environ
+        cached_document = document_cache.get(debtorId, documentId)
+        if cached_document is not None:
+            return make_document_response(environ, cached_document)
+
+        defer_content = can_defer_document_content(environ)
+        document = procedures.get_document(
+            debtorId, documentId, defer_toasted=defer_content
+        ) or abort(404)
+        if defer_content:
+            response = make_document_metadata_response(environ, document)
+            if response is not None:
+                return response
+
+            document = (
+                procedures.get_document(debtorId, documentId) or abort(404)
+            )
 
-        return make_response(document.content, headers)
+        cached_document = make_cached_document(document)
+        document_cache.set(debtorId, documentId, cached_document)
+        return make_document_response(environ, cached_document)
 
 
 health_api = Blueprint(
@@ -805,3 +1912,23 @@ class HealthCheckEndpoint(MethodView):
         }
 
         return make_response(message, headers)
+
+
+@health_api.route("/metrics")
+class MetricsEndpoint(MethodView):
+    @health_api.response(200)
+    @health_api.doc(operationId="getMetrics")
+    def get(self):
+        """Return the metrics of the web server process.
+
+        The metrics (cache hit rates, for example) are returned in the
+        Prometheus text format. Note that every web server process
+        has its own metrics.
+
+        """
+
+        headers = {
+            "Content-Type": metrics.CONTENT_TYPE,
+        }
+
+        return make_response(metrics.REGISTRY.render(), headers)
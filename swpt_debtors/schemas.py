@@ -1,18 +1,20 @@
 from copy import copy
 from marshmallow import (
-    Schema,
+    Schema as BaseSchema,
     fields,
     validate,
     pre_dump,
     post_dump,
     validates,
+    validates_schema,
     missing,
     ValidationError,
     EXCLUDE,
 )
-from flask import url_for
 from swpt_pythonlib.utils import i64_to_u64
 from swpt_pythonlib.swpt_uris import make_account_uri
+from swpt_debtors.extensions import uri_builder
+from swpt_debtors.instrumentation import measure_serialization
 from swpt_debtors.models import (
     MIN_INT64,
     MAX_INT64,
@@ -52,6 +54,12 @@ TRANSFER_NOTE_FORMAT_DESCRIPTION = (
 )
 
 
+class Schema(BaseSchema):
+    @measure_serialization()
+    def dump(self, obj, *, many=None):
+        return super().dump(obj, many=many)
+
+
 class ValidateTypeMixin:
     @validates("type")
     def validate_type(self, value):
@@ -65,6 +73,12 @@ class TransfersList:
         self.items = items
 
 
+class TransfersBulkCreationResult:
+    def __init__(self, debtor_id, items):
+        self.debtor_id = debtor_id
+        self.items = items
+
+
 class MutableResourceSchema(Schema):
     latest_update_id = fields.Integer(
         required=True,
@@ -402,6 +416,102 @@ class DebtorRestrictionRequestSchema(ValidateTypeMixin, Schema):
     )
 
 
+class DebtorsBulkRequestSchema(Schema):
+    debtor_ids = fields.List(
+        fields.String(validate=validate.Regexp("^[0-9]{1,20}$")),
+        required=True,
+        data_key="debtorIds",
+        metadata=dict(
+            description=(
+                "An array of debtor IDs. The maximum number of debtor IDs"
+                " that can be processed with a single request is"
+                " implementation-specific."
+            ),
+            example=["1", "2", "3"],
+        ),
+    )
+
+
+class DebtorsBulkActivationRequestSchema(
+    ValidateTypeMixin, DebtorsBulkRequestSchema
+):
+    type = fields.String(
+        load_default="DebtorsBulkActivationRequest",
+        load_only=True,
+        metadata=dict(
+            description=TYPE_DESCRIPTION,
+            example="DebtorsBulkActivationRequest",
+        ),
+    )
+
+
+class DebtorsBulkDeactivationRequestSchema(
+    ValidateTypeMixin, DebtorsBulkRequestSchema
+):
+    type = fields.String(
+        load_default="DebtorsBulkDeactivationRequest",
+        load_only=True,
+        metadata=dict(
+            description=TYPE_DESCRIPTION,
+            example="DebtorsBulkDeactivationRequest",
+        ),
+    )
+
+
+class DebtorsBulkRestrictionRequestSchema(
+    ValidateTypeMixin, DebtorsBulkRequestSchema
+):
+    type = fields.String(
+        load_default="DebtorsBulkRestrictionRequest",
+        load_only=True,
+        metadata=dict(
+            description=TYPE_DESCRIPTION,
+            example="DebtorsBulkRestrictionRequest",
+        ),
+    )
+    min_balance = fields.Integer(
+        required=True,
+        validate=validate.Range(min=MIN_INT64, max=0),
+        data_key="minBalance",
+        metadata=dict(
+            format="int64",
+            description=(
+                "The maximum amount that the debtors are allowed to issue,"
+                " with a negative sign. Must be a negative number or zero."
+            ),
+            example=-500000,
+        ),
+    )
+
+
+class DebtorsBulkOperationResultSchema(Schema):
+    type = fields.Function(
+        lambda obj: "DebtorsBulkOperationResult",
+        required=True,
+        metadata=dict(
+            type="string",
+            description=TYPE_DESCRIPTION,
+            example="DebtorsBulkOperationResult",
+        ),
+    )
+    debtor_ids = fields.Function(
+        lambda obj: [str(i64_to_u64(x)) for x in obj["debtor_ids"]],
+        required=True,
+        data_key="debtorIds",
+        metadata=dict(
+            type="array",
+            items={"type": "string"},
+            description=(
+                "The IDs of the debtors that have been successfully"
+                " processed. Debtors that did not need to be processed (for"
+                " example, because they were already activated) are not"
+                " included."
+            ),
+            example=["1", "3"],
+        ),
+    )
+
+
 class DebtorConfigSchema(ValidateTypeMixin, MutableResourceSchema):
     uri = fields.String(
         required=True,
@@ -454,14 +564,13 @@ class DebtorConfigSchema(ValidateTypeMixin, MutableResourceSchema):
     def process_debtor_instance(self, obj, many):
         assert isinstance(obj, Debtor)
         obj = copy(obj)
-        obj.uri = url_for(
+        obj.uri = uri_builder.build(
             self.context["DebtorConfig"],
-            _external=False,
             debtorId=obj.debtor_id,
         )
         obj.debtor = {
-            "uri": url_for(
-                self.context["Debtor"], _external=False, debtorId=obj.debtor_id
+            "uri": uri_builder.build(
+                self.context["Debtor"], debtorId=obj.debtor_id
             )
         }
         obj.latest_update_id = obj.config_latest_update_id
@@ -642,30 +751,27 @@ class DebtorSchema(ValidateTypeMixin, Schema):
     def process_debtor_instance(self, obj, many):
         assert isinstance(obj, Debtor)
         obj = copy(obj)
-        obj.uri = url_for(
-            self.context["Debtor"], _external=False, debtorId=obj.debtor_id
+        obj.uri = uri_builder.build(
+            self.context["Debtor"], debtorId=obj.debtor_id
         )
         obj.identity = {"uri": f"swpt:{i64_to_u64(obj.debtor_id)}"}
         obj.config = obj
         obj.transfers_list = {
-            "uri": url_for(
+            "uri": uri_builder.build(
                 self.context["TransfersList"],
-                _external=False,
                 debtorId=obj.debtor_id,
             )
         }
         obj.create_transfer = obj.transfers_list
         obj.save_document = {
-            "uri": url_for(
+            "uri": uri_builder.build(
                 self.context["SaveDocument"],
-                _external=False,
                 debtorId=obj.debtor_id,
             )
         }
         obj.public_info_document = {
-            "uri": url_for(
+            "uri": uri_builder.build(
                 self.context["RedirectToDebtorsInfo"],
-                _external=False,
                 debtorId=obj.debtor_id,
             )
         }
@@ -965,16 +1071,14 @@ class TransferSchema(TransferCreationRequestSchema):
     def process_initiated_transfer_instance(self, obj, many):
         assert isinstance(obj, RunningTransfer)
         obj = copy(obj)
-        obj.uri = url_for(
+        obj.uri = uri_builder.build(
             self.context["Transfer"],
-            _external=False,
             debtorId=obj.debtor_id,
             transferUuid=obj.transfer_uuid,
         )
         obj.transfers_list = {
-            "uri": url_for(
+            "uri": uri_builder.build(
                 self.context["TransfersList"],
-                _external=False,
                 debtorId=obj.debtor_id,
             )
         }
@@ -1091,14 +1195,13 @@ class TransfersListSchema(Schema):
     def process_transfers_collection_instance(self, obj, many):
         assert isinstance(obj, TransfersList)
         obj = copy(obj)
-        obj.uri = url_for(
+        obj.uri = uri_builder.build(
             self.context["TransfersList"],
-            _external=False,
             debtorId=obj.debtor_id,
         )
         obj.debtor = {
-            "uri": url_for(
-                self.context["Debtor"], _external=False, debtorId=obj.debtor_id
+            "uri": uri_builder.build(
+                self.context["Debtor"], debtorId=obj.debtor_id
             )
         }
         obj.items = [{"uri": uri} for uri in obj.items]
@@ -1106,6 +1209,301 @@ class TransfersListSchema(Schema):
         return obj
 
 
+class TransfersPageParamsSchema(Schema):
+    prev = fields.UUID(
+        metadata=dict(
+            description=(
+                "Start the page after the transfer with this UUID. When"
+                " omitted, the page will start with the first transfer."
+            ),
+            example="123e4567-e89b-12d3-a456-426655440000",
+        ),
+    )
+    finalized = fields.Boolean(
+        metadata=dict(
+            description=(
+                "When `true`, only finalized transfers will be returned. When"
+                " `false`, only transfers that have not been finalized yet"
+                " will be returned. When omitted, all transfers will be"
+                " returned."
+            ),
+            example=False,
+        ),
+    )
+
+
+class TransferParamsSchema(Schema):
+    wait_for = fields.String(
+        data_key="waitFor",
+        validate=validate.OneOf(["finalization"]),
+        metadata=dict(
+            description=(
+                "When `finalization`, and the transfer has not been finalized"
+                " yet, the response will be delayed until the transfer gets"
+                " finalized, or the `timeout` expires, whichever comes first."
+                " This allows clients to wait for the finalization of the"
+                " transfer, without polling."
+            ),
+            example="finalization",
+        ),
+    )
+    timeout = fields.Float(
+        load_default=30.0,
+        validate=validate.Range(min=0.0),
+        metadata=dict(
+            description=(
+                "The maximum number of seconds to wait. Only used along with"
+                " the `waitFor` parameter. The server may choose to wait less"
+                " than that."
+            ),
+            example=30.0,
+        ),
+    )
+
+
+class TransfersPageSchema(Schema):
+    uri = fields.String(
+        required=True,
+        dump_only=True,
+        metadata=dict(
+            format="uri-reference",
+            description=URI_DESCRIPTION,
+            example="/debtors/1/transfers/.page?finalized=false",
+        ),
+    )
+    type = fields.Function(
+        lambda obj: "TransfersPage",
+        required=True,
+        metadata=dict(
+            type="string",
+            description=TYPE_DESCRIPTION,
+            example="TransfersPage",
+        ),
+    )
+    items = fields.Nested(
+        TransferSchema(many=True),
+        required=True,
+        dump_only=True,
+        metadata=dict(
+            description=(
+                "An array of `Transfer`s, sorted by transfer UUID. Can be"
+                " empty."
+            ),
+        ),
+    )
+    next = fields.String(
+        dump_only=True,
+        metadata=dict(
+            format="uri-reference",
+            description=PAGE_NEXT_DESCRIPTION.format(type="TransfersPage"),
+            example=(
+                "?prev=123e4567-e89b-12d3-a456-426655440000&finalized=false"
+            ),
+        ),
+    )
+
+    @post_dump
+    def assert_required_fields(self, obj, many):
+        assert "uri" in obj
+        assert "items" in obj
+        return obj
+
+
+class TransfersBulkCreationRequestSchema(ValidateTypeMixin, Schema):
+    type = fields.String(
+        load_default="TransfersBulkCreationRequest",
+        dump_default="TransfersBulkCreationRequest",
+        metadata=dict(
+            description=TYPE_DESCRIPTION,
+            example="TransfersBulkCreationRequest",
+        ),
+    )
+    transfers = fields.List(
+        fields.Nested(TransferCreationRequestSchema),
+        required=True,
+        validate=validate.Length(min=1),
+        metadata=dict(
+            description=(
+                "A non-empty array of `TransferCreationRequest`s. The"
+                " maximum number of transfers that can be initiated with a"
+                " single request is implementation-specific."
+            ),
+        ),
+    )
+
+
+class TransferCreationResultSchema(Schema):
+    type = fields.Function(
+        lambda obj: "TransferCreationResult",
+        required=True,
+        metadata=dict(
+            type="string",
+            description=TYPE_DESCRIPTION,
+            example="TransferCreationResult",
+        ),
+    )
+    transfer_uuid = fields.UUID(
+        required=True,
+        dump_only=True,
+        data_key="transferUuid",
+        metadata=dict(
+            description="The client-generated UUID for the transfer.",
+            example="123e4567-e89b-12d3-a456-426655440000",
+        ),
+    )
+    status = fields.String(
+        required=True,
+        dump_only=True,
+        metadata=dict(
+            description=(
+                "The outcome of the transfer creation request:"
+                " `created` (a new transfer has been initiated), `exists`"
+                " (the same transfer has already been initiated), or"
+                " `conflict` (a different transfer with the same UUID"
+                " already exists)."
+            ),
+            example="created",
+        ),
+    )
+    transfer = fields.Nested(
+        ObjectReferenceSchema,
+        required=True,
+        dump_only=True,
+        metadata=dict(
+            description="The URI of the corresponding `Transfer`.",
+            example={
+                "uri": (
+                    "/debtors/1/transfers/123e4567-e89b-12d3-a456-426655440000"
+                )
+            },
+        ),
+    )
+
+
+class TransfersBulkCreationResultSchema(Schema):
+    type = fields.Function(
+        lambda obj: "TransfersBulkCreationResult",
+        required=True,
+        metadata=dict(
+            type="string",
+            description=TYPE_DESCRIPTION,
+            example="TransfersBulkCreationResult",
+        ),
+    )
+    transfers_list = fields.Nested(
+        ObjectReferenceSchema,
+        required=True,
+        dump_only=True,
+        data_key="transfersList",
+        metadata=dict(
+            description="The URI of the debtor's `TransfersList`.",
+            example={"uri": "/debtors/1/transfers/"},
+        ),
+    )
+    items = fields.Nested(
+        TransferCreationResultSchema(many=True),
+        required=True,
+        dump_only=True,
+        metadata=dict(
+            description=(
+                "An array of `TransferCreationResult`s, one for each"
+                " transfer in the request, in the same order."
+            ),
+        ),
+    )
+
+    @pre_dump
+    def process_transfers_bulk_creation_result_instance(self, obj, many):
+        assert isinstance(obj, TransfersBulkCreationResult)
+        obj = copy(obj)
+        obj.transfers_list = {
+            "uri": uri_builder.build(
+                self.context["TransfersList"],
+                debtorId=obj.debtor_id,
+            )
+        }
+        obj.items = [
+            {
+                "status": status,
+                "transfer_uuid": transfer_uuid,
+                "transfer": {
+                    "uri": uri_builder.build(
+                        self.context["Transfer"],
+                        debtorId=obj.debtor_id,
+                        transferUuid=transfer_uuid,
+                    )
+                },
+            }
+            for status, transfer_uuid in obj.items
+        ]
+
+        return obj
+
+
+class TransfersBulkDeletionRequestSchema(ValidateTypeMixin, Schema):
+    type = fields.String(
+        load_default="TransfersBulkDeletionRequest",
+        dump_default="TransfersBulkDeletionRequest",
+        metadata=dict(
+            description=TYPE_DESCRIPTION,
+            example="TransfersBulkDeletionRequest",
+        ),
+    )
+    optional_transfer_uuids = fields.List(
+        fields.UUID(),
+        data_key="transferUuids",
+        metadata=dict(
+            description=(
+                "When present, only transfers whose UUIDs are included in"
+                " this array will be deleted. The maximum number of UUIDs"
+                " is implementation-specific."
+            ),
+            example=["123e4567-e89b-12d3-a456-426655440000"],
+        ),
+    )
+    optional_finalized_before = fields.DateTime(
+        data_key="finalizedBefore",
+        metadata=dict(
+            description=(
+                "When present, only transfers that have been finalized"
+                " before this moment will be deleted."
+            ),
+        ),
+    )
+
+    @validates_schema
+    def validate_criteria(self, data, **kwargs):
+        if (
+            "optional_transfer_uuids" not in data
+            and "optional_finalized_before" not in data
+        ):
+            raise ValidationError(
+                "Either transferUuids or finalizedBefore must be specified."
+            )
+
+
+class TransfersBulkDeletionResultSchema(Schema):
+    type = fields.Function(
+        lambda obj: "TransfersBulkDeletionResult",
+        required=True,
+        metadata=dict(
+            type="string",
+            description=TYPE_DESCRIPTION,
+            example="TransfersBulkDeletionResult",
+        ),
+    )
+    deleted_count = fields.Integer(
+        required=True,
+        dump_only=True,
+        data_key="deletedCount",
+        metadata=dict(
+            format="int32",
+            description="The number of deleted transfers.",
+            example=10,
+        ),
+    )
+
+
 class ActivateDebtorMessageSchema(Schema):
     """``ActivateDebtor`` message schema."""
 
@@ -0,0 +1,156 @@
+"""Specialized serializers for the most frequently requested objects.
+
+Each function here produces exactly the same result as dumping the
+object with the corresponding marshmallow schema, but reads the ORM
+attributes directly, without copying the object and without dumping
+nested schemas. The schemas stay the source of truth (they are used
+for loading, and for generating the OpenAPI specification), and the
+tests verify that the results are identical.
+
+"""
+
+from typing import Any, Dict
+from swpt_pythonlib.utils import i64_to_u64
+from swpt_pythonlib.swpt_uris import make_account_uri
+from swpt_debtors.extensions import uri_builder
+from swpt_debtors.instrumentation import measure_serialization
+from swpt_debtors.models import (
+    SC_INSUFFICIENT_AVAILABLE_AMOUNT,
+    Debtor,
+    RunningTransfer,
+)
+
+
+@measure_serialization()
+def serialize_debtor_config(
+    debtor: Debtor, context: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Serialize the debtor in the same way as `DebtorConfigSchema`."""
+
+    debtor_id = debtor.debtor_id
+    return {
+        "uri": uri_builder.build(context["DebtorConfig"], debtorId=debtor_id),
+        "type": "DebtorConfig",
+        "debtor": {
+            "uri": uri_builder.build(context["Debtor"], debtorId=debtor_id),
+        },
+        "configData": debtor.config_data,
+        "latestUpdateId": debtor.config_latest_update_id,
+        "latestUpdateAt": debtor.last_config_ts.isoformat(),
+    }
+
+
+@measure_serialization()
+def serialize_debtor(
+    debtor: Debtor, context: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Serialize the debtor in the same way as `DebtorSchema`."""
+
+    debtor_id = debtor.debtor_id
+    debtor_uri = uri_builder.build(context["Debtor"], debtorId=debtor_id)
+    transfers_list_uri = uri_builder.build(
+        context["TransfersList"], debtorId=debtor_id
+    )
+    data = {
+        "uri": debtor_uri,
+        "type": "Debtor",
+        "identity": {
+            "type": "DebtorIdentity",
+            "uri": f"swpt:{i64_to_u64(debtor_id)}",
+        },
+        "config": {
+            "uri": uri_builder.build(
+                context["DebtorConfig"], debtorId=debtor_id
+            ),
+            "type": "DebtorConfig",
+            "debtor": {"uri": debtor_uri},
+            "configData": debtor.config_data,
+            "latestUpdateId": debtor.config_latest_update_id,
+            "latestUpdateAt": debtor.last_config_ts.isoformat(),
+        },
+        "transfersList": {"uri": transfers_list_uri},
+        "createTransfer": {"uri": transfers_list_uri},
+        "saveDocument": {
+            "uri": uri_builder.build(
+                context["SaveDocument"], debtorId=debtor_id
+            ),
+        },
+        "publicInfoDocument": {
+            "uri": uri_builder.build(
+                context["RedirectToDebtorsInfo"], debtorId=debtor_id
+            ),
+        },
+        "createdAt": debtor.created_at.isoformat(),
+        "balance": debtor.balance,
+        "minBalance": debtor.min_balance,
+        "noteMaxBytes": debtor.transfer_note_max_bytes,
+    }
+
+    config_error = debtor.config_error
+    if config_error is not None:
+        data["configError"] = config_error
+
+    try:
+        account_uri = make_account_uri(debtor_id, debtor.account_id)
+    except ValueError:
+        pass
+    else:
+        data["account"] = {"type": "AccountIdentity", "uri": account_uri}
+
+    return data
+
+
+@measure_serialization()
+def serialize_transfer(
+    transfer: RunningTransfer, context: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Serialize the transfer in the same way as `TransferSchema`."""
+
+    debtor_id = transfer.debtor_id
+    data = {
+        "uri": uri_builder.build(
+            context["Transfer"],
+            debtorId=debtor_id,
+            transferUuid=transfer.transfer_uuid,
+        ),
+        "type": "Transfer",
+        "transferUuid": str(transfer.transfer_uuid),
+        "recipient": {
+            "type": "AccountIdentity",
+            "uri": transfer.recipient_uri,
+        },
+        "amount": transfer.amount,
+        "noteFormat": transfer.transfer_note_format,
+        "note": transfer.transfer_note,
+        "transfersList": {
+            "uri": uri_builder.build(
+                context["TransfersList"], debtorId=debtor_id
+            ),
+        },
+        "initiatedAt": transfer.initiated_at.isoformat(),
+    }
+
+    finalized_at = transfer.finalized_at
+    if finalized_at:
+        result = {
+            "type": "TransferResult",
+            "finalizedAt": finalized_at.isoformat(),
+        }
+        error_code = transfer.error_code
+        if error_code is None:
+            result["committedAmount"] = transfer.amount
+        else:
+            error = {"type": "TransferError", "errorCode": error_code}
+            if error_code == SC_INSUFFICIENT_AVAILABLE_AMOUNT:
+                error["totalLockedAmount"] = transfer.total_locked_amount or 0
+            result["committedAmount"] = 0
+            result["error"] = error
+
+        data["result"] = result
+    else:
+        calc_checkup_datetime = context["calc_checkup_datetime"]
+        data["checkupAt"] = calc_checkup_datetime(
+            debtor_id, transfer.initiated_at
+        ).isoformat()
+
+    return data
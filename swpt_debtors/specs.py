@@ -43,6 +43,15 @@ LOCATION_HEADER = {
     },
 }
 
+ETAG_HEADER = {
+    "ETag": {
+        "description": "The entity tag of the returned resource.",
+        "schema": {
+            "type": "string",
+        },
+    },
+}
+
 ERROR_CONTENT = {
     "application/json": {
         "schema": {
@@ -84,6 +93,22 @@ UPDATE_CONFLICT = {
     "content": ERROR_CONTENT,
 }
 
+NOT_MODIFIED = {
+    "description": (
+        "The resource has not been modified since the client received"
+        " the entity tag specified in the `If-None-Match` header."
+    ),
+    "headers": ETAG_HEADER,
+}
+
+PRECONDITION_FAILED = {
+    "description": (
+        "The resource has been modified since the client received the"
+        " entity tag specified in the `If-Match` header."
+    ),
+    "content": ERROR_CONTENT,
+}
+
 CONFLICTING_DEBTOR = {
     "description": "A debtor with the same ID already exists.",
     "content": ERROR_CONTENT,
@@ -125,6 +150,23 @@ DOCUMENT_CONTENT = {
     }
 }
 
+DEBTOR_EVENTS_CONTENT = {
+    "content": {
+        "text/event-stream": {
+            "example": (
+                "event: TransferFinalized\n"
+                'data: {"uri": "/debtors/1/transfers/'
+                '123e4567-e89b-12d3-a456-426655440000"}\n\n'
+            ),
+        },
+    }
+}
+
+TOO_MANY_SUBSCRIPTIONS = {
+    "description": "Too many clients are waiting for changes.",
+    "content": ERROR_CONTENT,
+}
+
 TRANSFER_EXISTS = {
     "description": "The same transfer entry already exists.",
     "headers": LOCATION_HEADER,
@@ -1,18 +1,64 @@
+import logging
+import time
+from collections import Counter
 from datetime import datetime, timedelta, timezone
 from swpt_pythonlib.scan_table import TableScanner
-from sqlalchemy import select, update
+from sqlalchemy import select, update, delete
 from sqlalchemy.orm import load_only
-from sqlalchemy.sql.expression import and_, or_, null, true, false, tuple_
+from sqlalchemy.dialects import postgresql as pg
+from sqlalchemy.sql.expression import (
+    and_,
+    or_,
+    null,
+    true,
+    false,
+    tuple_,
+    exists,
+)
 from flask import current_app
 from swpt_debtors.extensions import db
-from swpt_debtors.models import Debtor, is_valid_debtor_id, DISCARD_PLANS
+from swpt_debtors import metrics
+from swpt_debtors.models import (
+    Debtor,
+    DebtorTombstone,
+    Document,
+    DocumentBlob,
+    is_valid_debtor_id,
+    DISCARD_PLANS,
+)
 
 SECONDS_IN_YEAR = 365.25 * 24 * 60 * 60
 PLANS_DISCARD_INTERVAL = timedelta(seconds=10.0)
 
+DEBTORS_SCAN_ROWS = metrics.Counter(
+    "swpt_debtors_scan_rows_total",
+    "The number of debtor rows processed by the debtors scanner.",
+)
+DEBTORS_SCAN_ACTIONS = metrics.Counter(
+    "swpt_debtors_scan_actions_total",
+    "The number of actions performed by the debtors scanner, by action.",
+)
+DEBTORS_SCAN_BEAT_SECONDS = metrics.Histogram(
+    "swpt_debtors_scan_beat_seconds",
+    "The time spent processing the rows of one debtors scanner beat.",
+)
+DEBTORS_SCAN_BEAT_OVERRUNS = metrics.Counter(
+    "swpt_debtors_scan_beat_overruns_total",
+    "The number of debtors scanner beats that exceeded the target duration.",
+)
+DEBTORS_SCAN_DISCARD_PLANS_SECONDS = metrics.Histogram(
+    "swpt_debtors_scan_discard_plans_seconds",
+    "The time spent discarding execution plans by the debtors scanner.",
+)
+DOCUMENT_BLOBS_SCAN_DELETED = metrics.Counter(
+    "swpt_debtors_document_blobs_scan_deleted_total",
+    "The number of unreferenced document blobs deleted by the document"
+    " blobs scanner.",
+)
+
 
 class DebtorScanner(TableScanner):
-    """Garbage-collects inactive debtors."""
+    """Garbage-collects inactive and deactivated debtors."""
 
     table = Debtor.__table__
     columns = [
@@ -31,9 +77,15 @@ class DebtorScanner(TableScanner):
     def __init__(self):
         super().__init__()
         self.latest_plans_discard_ts = datetime.now(tz=timezone.utc)
+        self.pass_started_at = time.monotonic()
+        self.pass_duration = None
+        self.pass_stats = Counter()
         self.inactive_interval = timedelta(
             days=current_app.config["APP_INACTIVE_DEBTOR_RETENTION_DAYS"]
         )
+        self.deactivated_interval = timedelta(
+            days=current_app.config["APP_DEACTIVATED_DEBTOR_RETENTION_DAYS"]
+        )
         self.max_heartbeat_delay = timedelta(
             days=current_app.config["APP_MAX_HEARTBEAT_DELAY_DAYS"]
         )
@@ -49,6 +101,66 @@ class DebtorScanner(TableScanner):
     def target_beat_duration(self) -> int:
         return int(current_app.config["APP_DEBTORS_SCAN_BEAT_MILLISECS"])
 
+    def run(self, engine, completion_goal, quit_early=False):
+        # NOTE: The table scanner does not tell us when a pass through
+        # the table has been completed. Instead, we assume that each
+        # pass takes approximately `completion_goal` time.
+        self.pass_duration = completion_goal.total_seconds()
+        self.pass_started_at = time.monotonic()
+        try:
+            super().run(engine, completion_goal, quit_early=quit_early)
+        finally:
+            self._log_pass_summary()
+
+    def _log_pass_summary(self):
+        elapsed_seconds = time.monotonic() - self.pass_started_at
+        stats = self.pass_stats
+        rows = stats["rows"]
+        logger = logging.getLogger(__name__)
+        logger.info(
+            "Scanned %i debtor rows in %.1f seconds (%.1f rows/second):"
+            " %i not activated deleted, %i parent shard deleted,"
+            " %i tombstoned, %i config errors set, %i beat overruns"
+            " (%.3f seconds max beat), %.3f seconds discarding plans.",
+            rows,
+            elapsed_seconds,
+            rows / elapsed_seconds if elapsed_seconds > 0.0 else 0.0,
+            stats["deleted_not_activated"],
+            stats["deleted_parent_shard"],
+            stats["tombstoned"],
+            stats["config_errors_set"],
+            stats["beat_overruns"],
+            stats["max_beat_milliseconds"] / 1000,
+            stats["discard_plans_milliseconds"] / 1000,
+        )
+        self.pass_stats = Counter()
+        self.pass_started_at = time.monotonic()
+
+    def _record_actions(self, action: str, count: int) -> None:
+        if count > 0:
+            self.pass_stats[action] += count
+            DEBTORS_SCAN_ACTIONS.inc(count, action=action)
+
+    def _record_beat(self, rows_count: int, started_at: float) -> None:
+        stats = self.pass_stats
+        beat_seconds = time.monotonic() - started_at
+        beat_milliseconds = int(beat_seconds * 1000)
+        stats["rows"] += rows_count
+        stats["max_beat_milliseconds"] = max(
+            stats["max_beat_milliseconds"], beat_milliseconds
+        )
+        DEBTORS_SCAN_ROWS.inc(rows_count)
+        DEBTORS_SCAN_BEAT_SECONDS.observe(beat_seconds)
+        if beat_milliseconds > self.target_beat_duration:
+            stats["beat_overruns"] += 1
+            DEBTORS_SCAN_BEAT_OVERRUNS.inc()
+
+        if (
+            self.pass_duration is not None
+            and time.monotonic() - self.pass_started_at >= self.pass_duration
+        ):
+            self._log_pass_summary()
+
     def _process_rows_done(self):
         db.session.expunge_all()
         current_ts = datetime.now(tz=timezone.utc)
@@ -57,20 +169,45 @@ class DebtorScanner(TableScanner):
                 >= PLANS_DISCARD_INTERVAL
         ):  # pragma: no cover
             # Discard possibly outdated execution plans.
+            started_at = time.monotonic()
             db.session.execute(DISCARD_PLANS)
             db.session.commit()
             db.session.close()
             self.latest_plans_discard_ts = current_ts
+            discard_seconds = time.monotonic() - started_at
+            self.pass_stats["discard_plans_milliseconds"] += int(
+                discard_seconds * 1000
+            )
+            DEBTORS_SCAN_DISCARD_PLANS_SECONDS.observe(discard_seconds)
 
     def process_rows(self, rows):
+        started_at = time.monotonic()
         current_ts = datetime.now(tz=timezone.utc)
         if current_app.config["DELETE_PARENT_SHARD_RECORDS"]:
-            self._delete_parent_shard_debtors(rows, current_ts)
-        self._delete_debtors_not_activated_for_long_time(rows, current_ts)
-        self._set_config_errors_if_necessary(rows, current_ts)
+            self._record_actions(
+                "deleted_parent_shard",
+                self._delete_parent_shard_debtors(rows, current_ts),
+            )
+        self._record_actions(
+            "deleted_not_activated",
+            self._delete_debtors_not_activated_for_long_time(rows, current_ts),
+        )
+        self._record_actions(
+            "tombstoned",
+            self._replace_deactivated_debtors_with_tombstones(
+                rows, current_ts
+            ),
+        )
+        self._record_actions(
+            "config_errors_set",
+            self._set_config_errors_if_necessary(rows, current_ts),
+        )
         self._process_rows_done()
+        self._record_beat(len(rows), started_at)
 
-    def _delete_debtors_not_activated_for_long_time(self, rows, current_ts):
+    def _delete_debtors_not_activated_for_long_time(
+        self, rows, current_ts
+    ) -> int:
         c = self.table.c
         c_debtor_id = c.debtor_id
         c_status_flags = c.status_flags
@@ -107,8 +244,68 @@ class DebtorScanner(TableScanner):
                 db.session.delete(debtor)
 
             db.session.commit()
+            return len(to_delete)
+
+        return 0
 
-    def _set_config_errors_if_necessary(self, rows, current_ts):
+    def _replace_deactivated_debtors_with_tombstones(
+        self, rows, current_ts
+    ) -> int:
+        c = self.table.c
+        c_debtor_id = c.debtor_id
+        c_status_flags = c.status_flags
+        c_deactivation_date = c.deactivation_date
+        deactivated_flag = Debtor.STATUS_IS_DEACTIVATED_FLAG
+        deactivation_cutoff_date = (
+            current_ts - self.deactivated_interval
+        ).date()
+
+        def deactivated_long_time_ago(row) -> bool:
+            return (
+                row[c_status_flags] & deactivated_flag != 0
+                and row[c_deactivation_date] is not None
+                and row[c_deactivation_date] < deactivation_cutoff_date
+            )
+
+        pks_to_replace = [
+            (row[c_debtor_id],)
+            for row in rows
+            if deactivated_long_time_ago(row)
+        ]
+        if pks_to_replace:
+            chosen = Debtor.choose_rows(pks_to_replace)
+
+            # NOTE: Debtors that have saved documents are not replaced,
+            # because the documents should remain available
+            # indefinitely, and deleting the debtor would delete them.
+            to_replace = (
+                Debtor.query
+                .options(load_only(Debtor.debtor_id))
+                .join(chosen, self.pk == tuple_(*chosen.c))
+                .filter(
+                    Debtor.status_flags.op("&")(deactivated_flag) != 0,
+                    Debtor.deactivation_date < deactivation_cutoff_date,
+                    ~exists().where(Document.debtor_id == Debtor.debtor_id),
+                )
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+
+            if to_replace:
+                db.session.execute(
+                    pg.insert(DebtorTombstone)
+                    .values([{"debtor_id": d.debtor_id} for d in to_replace])
+                    .on_conflict_do_nothing()
+                )
+                for debtor in to_replace:
+                    db.session.delete(debtor)
+
+            db.session.commit()
+            return len(to_replace)
+
+        return 0
+
+    def _set_config_errors_if_necessary(self, rows, current_ts) -> int:
         c = self.table.c
         c_debtor_id = c.debtor_id
         c_is_config_effectual = c.is_config_effectual
@@ -180,8 +377,11 @@ class DebtorScanner(TableScanner):
                 )
 
             db.session.commit()
+            return len(pks_to_update)
+
+        return 0
 
-    def _delete_parent_shard_debtors(self, rows, current_ts):
+    def _delete_parent_shard_debtors(self, rows, current_ts) -> int:
         c = self.table.c
         c_debtor_id = c.debtor_id
 
@@ -209,3 +409,93 @@ class DebtorScanner(TableScanner):
                 db.session.delete(debtor)
 
             db.session.commit()
+            return len(to_delete)
+
+        return 0
+
+
+class DocumentBlobScanner(TableScanner):
+    """Garbage-collects document blobs that are not referenced anymore.
+
+    Blobs stop being referenced when the documents that share them get
+    deleted (together with their debtor). A blob is deleted only when
+    no document with the same content has been saved for some time.
+    """
+
+    table = DocumentBlob.__table__
+    columns = [DocumentBlob.content_hash, DocumentBlob.saved_at]
+    pk = tuple_(DocumentBlob.content_hash)
+
+    def __init__(self):
+        super().__init__()
+        self.retention_interval = timedelta(
+            days=current_app.config[
+                "APP_UNREFERENCED_DOCUMENT_BLOB_RETENTION_DAYS"
+            ]
+        )
+
+    @property
+    def blocks_per_query(self) -> int:
+        return int(
+            current_app.config["APP_DOCUMENT_BLOBS_SCAN_BLOCKS_PER_QUERY"]
+        )
+
+    @property
+    def target_beat_duration(self) -> int:
+        return int(
+            current_app.config["APP_DOCUMENT_BLOBS_SCAN_BEAT_MILLISECS"]
+        )
+
+    def process_rows(self, rows):
+        current_ts = datetime.now(tz=timezone.utc)
+        deleted_count = self._delete_unreferenced_blobs(rows, current_ts)
+        if deleted_count > 0:
+            DOCUMENT_BLOBS_SCAN_DELETED.inc(deleted_count)
+
+        db.session.expunge_all()
+
+    def _delete_unreferenced_blobs(self, rows, current_ts) -> int:
+        c = self.table.c
+        c_content_hash = c.content_hash
+        c_saved_at = c.saved_at
+        saved_at_cutoff_ts = current_ts - self.retention_interval
+
+        pks_to_check = [
+            (row[c_content_hash],)
+            for row in rows
+            if row[c_saved_at] < saved_at_cutoff_ts
+        ]
+        if pks_to_check:
+            chosen = DocumentBlob.choose_rows(pks_to_check)
+
+            # NOTE: `save_document` locks the blob before inserting a
+            # document that references it. Therefore, a blob that is
+            # locked here can not get a new reference before it is
+            # deleted, and locked blobs are skipped.
+            pks_to_delete = [
+                (row.content_hash,)
+                for row in db.session.execute(
+                        select(DocumentBlob.content_hash)
+                        .join(chosen, self.pk == tuple_(*chosen.c))
+                        .where(
+                            DocumentBlob.saved_at < saved_at_cutoff_ts,
+                            ~exists().where(
+                                Document.content_hash
+                                == DocumentBlob.content_hash
+                            ),
+                        )
+                        .with_for_update(skip_locked=True)
+                ).all()
+            ]
+            if pks_to_delete:
+                to_delete = DocumentBlob.choose_rows(pks_to_delete)
+                db.session.execute(
+                    delete(DocumentBlob)
+                    .execution_options(synchronize_session=False)
+                    .where(self.pk == tuple_(*to_delete.c))
+                )
+
+            db.session.commit()
+            return len(pks_to_delete)
+
+        return 0
@@ -0,0 +1,100 @@
+"""Fast building of relative URIs for the application's endpoints.
+
+Building URIs with `flask.url_for` is relatively expensive, because
+for each call the URL map adapter has to be obtained, and the
+endpoint's rules have to be looked up and matched against the passed
+values. Here, a URI template is prepared for each endpoint, once, when
+the application is created, and then URIs are built by plain string
+formatting.
+
+"""
+
+import re
+from typing import Any, Callable, Dict, List, Tuple
+from flask import Flask, current_app, request, has_request_context
+
+EXTENSION_NAME = "swpt_uri_builder"
+
+_RULE_VARIABLE_RE = re.compile(
+    r"<(?:(?P<converter>[a-zA-Z_][a-zA-Z0-9_]*)(?P<args>\(.*?\))?:)?"
+    r"(?P<variable>[a-zA-Z_][a-zA-Z0-9_]*)>"
+)
+
+
+class UriTemplate:
+    """A relative URI, with placeholders for the rule's variables."""
+
+    def __init__(
+        self,
+        format_string: str,
+        variables: List[Tuple[str, Callable[[Any], str]]],
+    ):
+        self.format_string = format_string
+        self.variables = variables
+
+    @classmethod
+    def from_rule(cls, app: Flask, rule) -> "UriTemplate":
+        parts: List[str] = []
+        variables: List[Tuple[str, Callable[[Any], str]]] = []
+        pos = 0
+
+        for m in _RULE_VARIABLE_RE.finditer(rule.rule):
+            if m.group("args"):
+                raise ValueError(
+                    f"Converter arguments are not supported: {rule.rule}"
+                )
+            converter_class = app.url_map.converters[
+                m.group("converter") or "default"
+            ]
+            static_part = rule.rule[pos:m.start()]
+            parts.append(static_part.replace("{", "{{").replace("}", "}}"))
+            parts.append("{}")
+            variables.append(
+                (m.group("variable"), converter_class(app.url_map).to_url)
+            )
+            pos = m.end()
+
+        static_part = rule.rule[pos:]
+        parts.append(static_part.replace("{", "{{").replace("}", "}}"))
+
+        return cls("".join(parts), variables)
+
+    def format(self, values: Dict[str, Any]) -> str:
+        return self.format_string.format(
+            *[to_url(values[name]) for name, to_url in self.variables]
+        )
+
+
+class UriBuilder:
+    """Builds the same relative URIs as `url_for(endpoint, **values)`.
+
+    The URI templates are prepared from the application's URL map, so
+    `init_app` must be called after all the blueprints have been
+    registered. Unlike `url_for`, passing values that are not rule
+    variables (they would be added to the query string) is not
+    supported.
+    """
+
+    def __init__(self, app: Flask = None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask) -> None:
+        templates: Dict[str, UriTemplate] = {}
+        for rule in app.url_map.iter_rules():
+            # NOTE: Just as `url_for` does, we use the first rule
+            # registered for the endpoint.
+            if rule.endpoint not in templates:
+                templates[rule.endpoint] = UriTemplate.from_rule(app, rule)
+
+        app.extensions[EXTENSION_NAME] = templates
+
+    def build(self, endpoint: str, **values: Any) -> str:
+        template = current_app.extensions[EXTENSION_NAME][endpoint]
+
+        if has_request_context():
+            root_path = request.root_path
+        else:
+            root_path = current_app.config["APPLICATION_ROOT"]
+
+        return root_path.rstrip("/") + template.format(values)
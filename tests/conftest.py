@@ -1,3 +1,4 @@
+import os
 import pytest
 import sqlalchemy
 import flask_migrate
@@ -13,14 +14,33 @@ config_dict = {
     "MAX_DEBTOR_ID": 8589934591,
     "APP_ENABLE_CORS": True,
     "APP_DEBTORS_PER_PAGE": 2,
+    "APP_TRANSFERS_PER_PAGE": 2,
     "APP_TRANSFERS_FINALIZATION_APPROX_SECONDS": 10.0,
     "APP_MAX_TRANSFERS_PER_MONTH": 10,
     "APP_DOCUMENT_MAX_CONTENT_LENGTH": 100,
     "APP_DOCUMENT_MAX_SAVES_PER_YEAR": 2,
     "APP_VERIFY_SHARD_YIELD_PER": 1,
+    # Cache invalidations are asynchronous, and would make the tests
+    # depend on timing. The caches are tested separately.
+    "APP_DEBTOR_INFO_CACHE_MAX_ENTRIES": 0,
 }
 
 
+def pytest_collection_modifyitems(config, items):
+    # Benchmarks are slow, and their results depend on the machine, so
+    # they run only when the "SWPT_RUN_BENCHMARKS" environment variable
+    # is set. The measured times are recorded as test properties:
+    #
+    #   $ SWPT_RUN_BENCHMARKS=1 pytest -m benchmark --junitxml=bench.xml
+    if os.environ.get("SWPT_RUN_BENCHMARKS"):
+        return
+
+    skip_benchmark = pytest.mark.skip(reason="SWPT_RUN_BENCHMARKS is not set")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
+
+
 @pytest.fixture(scope="module")
 def app():
     """Get a Flask application object."""
@@ -41,6 +61,8 @@ def db_session(app):
     db.session.remove()
     for cmd in [
         "TRUNCATE TABLE debtor CASCADE",
+        "TRUNCATE TABLE debtor_tombstone",
+        "TRUNCATE TABLE document_blob",
         "TRUNCATE TABLE configure_account_signal",
         "TRUNCATE TABLE prepare_transfer_signal",
         "TRUNCATE TABLE finalize_transfer_signal",
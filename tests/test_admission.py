@@ -0,0 +1,126 @@
+import time
+import pytest
+from swpt_debtors.admission import (
+    PoolWaitAverage,
+    is_waiting_request,
+    SHED_REQUESTS,
+    IN_FLIGHT_REQUESTS,
+)
+
+D_ID = 4294967296
+
+
+def test_pool_wait_average():
+    a = PoolWaitAverage(smoothing_factor=0.5, half_life_seconds=0.05)
+    assert a.get() == 0.0
+    a.observe(1.0)
+    assert 0.0 < a.get() <= 0.5
+    a.observe(1.0)
+    assert 0.5 < a.get() <= 0.75
+    time.sleep(0.2)
+    assert a.get() < 0.1
+
+
+@pytest.fixture(scope="function")
+def admission_config(app):
+    original_config = app.config.copy()
+    yield app.config
+    app.config.update(original_config)
+
+
+def test_shed_requests(app, admission_config):
+    client = app.test_client()
+    state = app.extensions["swpt_admission"]
+    low_shed = SHED_REQUESTS.get(priority="low", reason="in_flight")
+    high_shed = SHED_REQUESTS.get(priority="high", reason="in_flight")
+
+    admission_config["APP_ADMISSION_LOW_PRIORITY_MAX_REQUESTS"] = 2
+    admission_config["APP_ADMISSION_MAX_REQUESTS"] = 3
+    admission_config["APP_ADMISSION_RETRY_AFTER_SECONDS"] = 7
+    r = client.get(f"/debtors/{D_ID}/public")
+    assert r.status_code == 404
+    assert state.in_flight_requests == 0
+
+    state.enter()
+    state.enter()
+    try:
+        in_flight_gauge = IN_FLIGHT_REQUESTS.get()
+        r = client.get(f"/debtors/{D_ID}/public")
+        assert r.status_code == 503
+        assert r.headers["Retry-After"] == "7"
+        assert SHED_REQUESTS.get(priority="low", reason="in_flight") == (
+            low_shed + 1
+        )
+        assert IN_FLIGHT_REQUESTS.get() == in_flight_gauge
+
+        r = client.get(f"/debtors/{D_ID}/")
+        assert r.status_code == 404
+
+        state.enter()
+        try:
+            r = client.get(f"/debtors/{D_ID}/")
+            assert r.status_code == 503
+            assert SHED_REQUESTS.get(priority="high", reason="in_flight") == (
+                high_shed + 1
+            )
+
+            r = client.get("/debtors/health/check/public")
+            assert r.status_code == 200
+        finally:
+            state.leave()
+    finally:
+        state.leave()
+        state.leave()
+
+    assert state.in_flight_requests == 0
+    r = client.get(f"/debtors/{D_ID}/public")
+    assert r.status_code == 404
+
+    r = client.get("/debtors/health/metrics")
+    assert r.status_code == 200
+    assert "swpt_debtors_shed_requests_total{" in r.get_data(as_text=True)
+
+
+def test_shed_requests_on_pool_wait(app, admission_config):
+    client = app.test_client()
+    state = app.extensions["swpt_admission"]
+    original_pool_wait = state.pool_wait
+    state.pool_wait = PoolWaitAverage(smoothing_factor=1.0)
+    try:
+        admission_config["APP_ADMISSION_LOW_PRIORITY_MAX_POOL_WAIT"] = 0.1
+        admission_config["APP_ADMISSION_MAX_POOL_WAIT"] = 1.0
+        state.pool_wait.observe(0.5)
+
+        r = client.get(f"/debtors/{D_ID}/public")
+        assert r.status_code == 503
+        r = client.get(f"/debtors/{D_ID}/")
+        assert r.status_code == 404
+    finally:
+        state.pool_wait = original_pool_wait
+
+
+def test_waiting_requests_are_not_counted(app, admission_config):
+    state = app.extensions["swpt_admission"]
+    transfer_path = (
+        f"/debtors/{D_ID}/transfers/123e4567-e89b-12d3-a456-426655440000"
+    )
+    for path, counted in [
+        (f"/debtors/{D_ID}/", True),
+        (transfer_path, True),
+        (f"{transfer_path}?waitFor=finalization", False),
+        (f"/debtors/{D_ID}/events", False),
+    ]:
+        with app.test_request_context(path):
+            assert is_waiting_request() is not counted
+            assert app.preprocess_request() is None
+            assert state.in_flight_requests == (1 if counted else 0)
+        assert state.in_flight_requests == 0
+
+    # Waiting requests are still shed.
+    admission_config["APP_ADMISSION_LOW_PRIORITY_MAX_REQUESTS"] = 1
+    state.enter()
+    try:
+        r = app.test_client().get(f"/debtors/{D_ID}/events")
+        assert r.status_code == 503
+    finally:
+        state.leave()
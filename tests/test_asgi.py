@@ -0,0 +1,250 @@
+import asyncio
+from uuid import UUID
+import pytest
+from swpt_debtors.extensions import db
+from swpt_debtors.asgi import AsyncReadsApp
+from swpt_debtors import models as m
+from swpt_debtors import procedures as p
+
+D_ID = 4444444444
+TRANSFER_UUID = "123e4567-e89b-12d3-a456-426655440000"
+
+
+@pytest.fixture(scope="function")
+def client(app, db_session):
+    return app.test_client()
+
+
+@pytest.fixture(scope="function")
+def debtor(db_session):
+    debtor = m.Debtor(debtor_id=D_ID, status_flags=0)
+    debtor.activate()
+    db.session.add(debtor)
+    db.session.commit()
+
+
+async def _request(asgi_app, method, path, headers={}, body=b""):
+    path, _, query_string = path.partition("?")
+    scope = {
+        "type": "http",
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "root_path": "",
+        "query_string": query_string.encode("latin1"),
+        "headers": [
+            (k.lower().encode("latin1"), v.encode("latin1"))
+            for k, v in {"Host": "example.com", **headers}.items()
+        ],
+        "server": ("example.com", 80),
+        "client": ("127.0.0.1", 12345),
+    }
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi_app(scope, receive, send)
+    assert [x["type"] for x in sent] == [
+        "http.response.start",
+        "http.response.body",
+    ]
+    headers = {
+        k.decode("latin1"): v.decode("latin1")
+        for k, v in sent[0]["headers"]
+    }
+    return sent[0]["status"], headers, sent[1]["body"]
+
+
+def _run(asgi_app, requests):
+    async def run_requests():
+        try:
+            return [await _request(asgi_app, *r) for r in requests]
+        finally:
+            await asgi_app.engine.dispose()
+
+    return asyncio.run(run_requests())
+
+
+def test_asgi_app(app, client, debtor):
+    r = client.post(
+        f"/debtors/{D_ID}/transfers/",
+        json={
+            "type": "TransferCreationRequest",
+            "recipient": {"uri": f"swpt:{D_ID}/1"},
+            "amount": 1000,
+            "transferUuid": TRANSFER_UUID,
+        },
+    )
+    assert r.status_code == 201
+    r = client.post(
+        f"/debtors/{D_ID}/documents/",
+        content_type="text/plain",
+        data=b"test",
+    )
+    assert r.status_code == 201
+    document_uri = r.headers["Location"].replace("http://example.com", "")
+    r = client.post(
+        f"/debtors/{D_ID}/documents/",
+        content_type="text/plain",
+        data=100 * b"a",
+    )
+    assert r.status_code == 201
+    gzip_uri = r.headers["Location"].replace("http://example.com", "")
+    debtor_etag = client.get(f"/debtors/{D_ID}/").headers["ETag"]
+
+    requests = [
+        ("GET", f"/debtors/{D_ID}/"),
+        ("GET", f"/debtors/{D_ID}/", {"If-None-Match": debtor_etag}),
+        ("GET", f"/debtors/{D_ID}/config"),
+        ("HEAD", f"/debtors/{D_ID}/config"),
+        ("GET", f"/debtors/{D_ID}/transfers/"),
+        ("GET", f"/debtors/{D_ID}/transfers/{TRANSFER_UUID}"),
+        (
+            "GET",
+            f"/debtors/{D_ID}/transfers/{TRANSFER_UUID}"
+            "?waitFor=finalization&timeout=0.1",
+        ),
+        ("GET", f"/debtors/{D_ID}/transfers/{TRANSFER_UUID}?waitFor=xxx"),
+        ("GET", document_uri),
+        ("HEAD", document_uri),
+        ("GET", document_uri, {"If-None-Match": '"xxx"'}),
+        ("GET", gzip_uri, {"Accept-Encoding": "gzip"}),
+        ("GET", gzip_uri),
+        ("GET", f"/debtors/{D_ID}/public"),
+        ("GET", "/debtors/6666666666/"),
+        ("GET", "/debtors/6666666666/transfers/"),
+        ("GET", f"/debtors/{D_ID}/", {"X-Swpt-User-Id": "debtors:1"}),
+        ("GET", "/debtors/health/check/public"),
+        ("GET", "/debtors/.list"),
+        ("GET", "/not-found"),
+    ]
+    expected = []
+    for method, path, *rest in requests:
+        headers = rest[0] if rest else {}
+        r = client.open(path, method=method, headers=headers)
+        expected.append((r.status_code, r.headers, r.get_data()))
+
+    requests.append(
+        ("DELETE", f"/debtors/{D_ID}/transfers/{TRANSFER_UUID}"),
+    )
+    results = _run(AsyncReadsApp(app), requests)
+    assert len(results) == len(expected) + 1
+    for (status, headers, body), (e_status, e_headers, e_body) in zip(
+        results, expected
+    ):
+        assert status == e_status
+        assert headers.get("content-type") == e_headers.get("Content-Type")
+        assert headers.get("etag") == e_headers.get("ETag")
+        assert headers.get("location") == e_headers.get("Location")
+        if b"checkupAt" not in e_body:
+            assert body == e_body
+
+    # The context variables set by the hooks are preserved.
+    assert not results[0][1]["x-logging-context"].startswith("sql=0 ")
+
+    # The last request has been passed to the WSGI application.
+    assert results[-1][0] == 204
+    assert m.RunningTransfer.query.all() == []
+
+
+def test_asgi_request_entity_too_large(app):
+    body = b"x" * (app.config["MAX_CONTENT_LENGTH"] + 1)
+    path = f"/debtors/{D_ID}/documents/"
+    results = _run(
+        AsyncReadsApp(app),
+        [
+            ("POST", path, {"Content-Type": "text/plain"}, body),
+            (
+                "POST",
+                path,
+                {"Content-Type": "text/plain", "Content-Length": "100000"},
+                body,
+            ),
+        ],
+    )
+    assert [status for status, headers, body in results] == [413, 413]
+
+
+def test_asgi_debtor_events(app, client, debtor):
+    r = client.post(
+        f"/debtors/{D_ID}/transfers/",
+        json={
+            "type": "TransferCreationRequest",
+            "recipient": {"uri": f"swpt:{D_ID}/1"},
+            "amount": 1000,
+            "transferUuid": TRANSFER_UUID,
+        },
+    )
+    assert r.status_code == 201
+    asgi_app = AsyncReadsApp(app)
+    listener = app.extensions["swpt_change_listener"]
+
+    def cancel_transfer():
+        with app.app_context():
+            p.cancel_running_transfer(D_ID, UUID(TRANSFER_UUID))
+
+    async def stream_events():
+        scope = {
+            "type": "http",
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": f"/debtors/{D_ID}/events",
+            "root_path": "",
+            "query_string": b"",
+            "headers": [(b"host", b"example.com")],
+            "server": ("example.com", 80),
+            "client": ("127.0.0.1", 12345),
+        }
+        messages = [{"type": "http.request", "body": b"", "more_body": False}]
+        disconnected = asyncio.Event()
+        sent: asyncio.Queue = asyncio.Queue()
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            await sent.put(message)
+
+        task = asyncio.ensure_future(asgi_app(scope, receive, send))
+        try:
+            start = await sent.get()
+            reset = await sent.get()
+            await asyncio.to_thread(cancel_transfer)
+            finalized = await sent.get()
+            disconnected.set()
+            await task
+        finally:
+            task.cancel()
+            await asgi_app.engine.dispose()
+
+        return start, reset, finalized
+
+    start, reset, finalized = asyncio.run(stream_events())
+    assert start["status"] == 200
+    assert (b"content-type", b"text/event-stream; charset=utf-8") in (
+        start["headers"]
+    )
+    assert reset["more_body"]
+    assert reset["body"] == (
+        b"event: Reset\n"
+        + f'data: {{"uri": "/debtors/{D_ID}/"}}\n\n'.encode()
+    )
+    assert finalized["body"] == (
+        b"event: TransferFinalized\n"
+        + f'data: {{"uri": "/debtors/{D_ID}/transfers/{TRANSFER_UUID}"}}\n\n'
+        .encode()
+    )
+    assert listener.subscriptions_count == 0
+
+    results = _run(AsyncReadsApp(app), [("GET", "/debtors/1234/events")])
+    assert results[0][0] == 403
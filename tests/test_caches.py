@@ -0,0 +1,180 @@
+import time
+import pytest
+from swpt_debtors import create_app
+from swpt_debtors.extensions import db
+from swpt_debtors.caches import (
+    TtlLruCache,
+    ByteBudgetLruCache,
+    CACHE_LOOKUPS,
+)
+from swpt_debtors.metrics import Gauge
+from swpt_debtors.notifications import Change, CHANGE_DEBTOR_INFO_CHANGED
+from swpt_debtors import procedures as p
+from swpt_debtors import models as m
+from tests.conftest import config_dict
+
+D_ID = 4294967296
+
+
+def test_ttl_lru_cache():
+    c = TtlLruCache("test", max_entries=2)
+    hits = CACHE_LOOKUPS.get(cache="test", result="hit")
+    misses = CACHE_LOOKUPS.get(cache="test", result="miss")
+
+    assert c.get(1) is None
+    c.set(1, "a", 100.0, c.get_token())
+    c.set(2, "b", 100.0, c.get_token())
+    assert c.get(1) == "a"
+    c.set(3, "c", 100.0, c.get_token())
+    assert len(c) == 2
+    assert c.get(2) is None
+    assert c.get(1) == "a"
+    assert c.get(3) == "c"
+    assert CACHE_LOOKUPS.get(cache="test", result="hit") == hits + 3
+    assert CACHE_LOOKUPS.get(cache="test", result="miss") == misses + 2
+
+    c.set(4, "d", 0.0, c.get_token())
+    assert c.get(4, "expired") == "expired"
+
+    token = c.get_token()
+    c.invalidate(3)
+    assert c.get(3) is None
+    c.set(3, "stale", 100.0, token)
+    assert c.get(3) is None
+    c.set(3, "c", 100.0, c.get_token())
+    assert c.get(3) == "c"
+
+    c.clear()
+    assert len(c) == 0
+
+
+def test_byte_budget_lru_cache():
+    gauge = Gauge("test_cache_bytes", "Test", registry=None)
+    c = ByteBudgetLruCache("test", max_bytes=10, size_gauge=gauge)
+
+    assert c.get(1) is None
+    c.set(1, b"aaaa", 4)
+    c.set(2, b"bbbb", 4)
+    assert c.total_bytes == 8
+    assert c.get(1) == b"aaaa"
+    c.set(3, b"cccc", 4)
+    assert c.get(2) is None
+    assert c.get(1) == b"aaaa"
+    assert c.get(3) == b"cccc"
+    assert c.total_bytes == gauge.get() == 8
+
+    c.set(3, b"cc", 2)
+    assert c.total_bytes == gauge.get() == 6
+    c.set(4, b"d" * 11, 11)
+    assert c.get(4) is None
+    c.set(4, b"d" * 10, 10)
+    assert len(c) == 1
+    assert c.get(4) == b"d" * 10
+    assert c.total_bytes == gauge.get() == 10
+
+
+def test_document_cache(app, db_session):
+    debtor = m.Debtor(debtor_id=D_ID, status_flags=0)
+    debtor.activate()
+    db.session.add(debtor)
+    db.session.commit()
+
+    client = app.test_client()
+    content = b"test document"
+    r = client.post(
+        f"/debtors/{D_ID}/documents/",
+        content_type="text/plain",
+        data=content,
+    )
+    assert r.status_code == 201
+    location = r.headers["Location"]
+    document_id = int(location.split("/")[-2])
+    cache = app.extensions["swpt_document_cache"]
+    assert cache.get((D_ID, document_id)).content == content
+
+    r = client.get(location)
+    assert r.status_code == 200
+    assert r.get_data() == content
+    etag = r.headers["ETag"]
+    last_modified = r.headers["Last-Modified"]
+
+    # Load the document from the database again.
+    app.extensions["swpt_document_cache"] = ByteBudgetLruCache(
+        "document", 1000
+    )
+    try:
+        r = client.get(location, headers={"If-None-Match": etag})
+        assert r.status_code == 304
+        assert len(app.extensions["swpt_document_cache"]) == 0
+
+        r = client.get(location, headers={"If-None-Match": '"xxx"'})
+        assert r.status_code == 200
+        assert r.headers["ETag"] == etag
+        assert r.headers["Last-Modified"] == last_modified
+        assert r.get_data() == content
+        assert len(app.extensions["swpt_document_cache"]) == 1
+
+        r = client.head(location)
+        assert r.status_code == 200
+        assert r.content_length == len(content)
+        assert r.headers["ETag"] == etag
+    finally:
+        app.extensions["swpt_document_cache"] = cache
+
+
+@pytest.fixture(scope="function")
+def cached_app(app, db_session):
+    cached_app = create_app(
+        {**config_dict, "APP_DEBTOR_INFO_CACHE_MAX_ENTRIES": 100}
+    )
+    yield cached_app
+
+    with cached_app.app_context():
+        db.engine.dispose()
+
+
+def test_debtor_info_cache(cached_app):
+    debtor = m.Debtor(debtor_id=D_ID, status_flags=0)
+    debtor.activate()
+    db.session.add(debtor)
+    db.session.commit()
+
+    client = cached_app.test_client()
+    with cached_app.app_context():
+        r = client.get(f"/debtors/{D_ID}/public")
+        assert r.status_code == 404
+        hits = CACHE_LOOKUPS.get(cache="debtor_info", result="hit")
+        r = client.get(f"/debtors/{D_ID}/public")
+        assert r.status_code == 404
+        assert CACHE_LOOKUPS.get(cache="debtor_info", result="hit") == (
+            hits + 1
+        )
+
+        debtor = p.get_debtor(D_ID)
+        debtor.debtor_info_iri = "https://example.com/"
+        p._notify_change(Change(D_ID, CHANGE_DEBTOR_INFO_CHANGED))
+        db.session.commit()
+
+        # The invalidation is asynchronous.
+        deadline = time.monotonic() + 10.0
+        while time.monotonic() < deadline:
+            r = client.get(f"/debtors/{D_ID}/public")
+            if r.status_code == 302:
+                break
+            time.sleep(0.05)
+        assert r.status_code == 302
+        assert r.headers["Location"] == "https://example.com/"
+
+        # Deactivating the debtor invalidates the cached info too.
+        p.deactivate_debtor(D_ID)
+        deadline = time.monotonic() + 10.0
+        while time.monotonic() < deadline:
+            r = client.get(f"/debtors/{D_ID}/public")
+            if r.status_code == 404:
+                break
+            time.sleep(0.05)
+        assert r.status_code == 404
+
+        r = client.get("/debtors/health/metrics")
+        assert r.status_code == 200
+        assert "swpt_debtors_cache_lookups_total{" in r.get_data(as_text=True)
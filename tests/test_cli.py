@@ -3,9 +3,16 @@ import sqlalchemy
 from unittest.mock import Mock
 from uuid import UUID
 from datetime import timedelta
-from swpt_debtors.models import Debtor, FinalizeTransferSignal
+from swpt_debtors.models import (
+    Debtor,
+    DebtorTombstone,
+    Document,
+    DocumentBlob,
+    FinalizeTransferSignal,
+)
 from swpt_debtors.extensions import db
 from swpt_debtors import procedures
+from swpt_debtors import table_scanners
 from swpt_pythonlib.utils import ShardingRealm
 
 TEST_UUID = UUID("123e4567-e89b-12d3-a456-426655440000")
@@ -57,6 +64,11 @@ def test_scan_debtors(app, db_session, current_ts):
     with db.engine.connect() as conn:
         conn.execute(sqlalchemy.text("ANALYZE debtor"))
 
+    scanned_rows = table_scanners.DEBTORS_SCAN_ROWS.get()
+    scan_actions = table_scanners.DEBTORS_SCAN_ACTIONS
+    deleted_not_activated = scan_actions.get(action="deleted_not_activated")
+    config_errors_set = scan_actions.get(action="config_errors_set")
+
     runner = app.test_cli_runner()
     result = runner.invoke(
         args=[
@@ -68,6 +80,14 @@ def test_scan_debtors(app, db_session, current_ts):
         ]
     )
     assert result.exit_code == 0
+    assert table_scanners.DEBTORS_SCAN_ROWS.get() >= scanned_rows + 6
+    assert (
+        scan_actions.get(action="deleted_not_activated")
+        == deleted_not_activated + 1
+    )
+    assert (
+        scan_actions.get(action="config_errors_set") == config_errors_set + 1
+    )
 
     debtors = Debtor.query.all()
     assert len(debtors) == 5
@@ -90,6 +110,94 @@ def test_scan_debtors(app, db_session, current_ts):
     assert all([v is None for v in config_errors.values()])
 
 
+def test_scan_debtors_tombstones(app, db_session, current_ts):
+    _create_new_debtor(MIN_DEBTOR_ID + 1, activate=True)
+    _create_new_debtor(MIN_DEBTOR_ID + 2, activate=True)
+    _create_new_debtor(MIN_DEBTOR_ID + 3, activate=True)
+    procedures.save_document(
+        debtor_id=MIN_DEBTOR_ID + 3,
+        content_type="text/plain",
+        content=b"test",
+    )
+    procedures.deactivate_debtor(MIN_DEBTOR_ID + 1)
+    procedures.deactivate_debtor(MIN_DEBTOR_ID + 2)
+    procedures.deactivate_debtor(MIN_DEBTOR_ID + 3)
+    Debtor.query.filter(Debtor.debtor_id != MIN_DEBTOR_ID + 2).update(
+        {
+            "deactivation_date": (current_ts - timedelta(days=3000)).date(),
+        }
+    )
+    db.session.commit()
+
+    with db.engine.connect() as conn:
+        conn.execute(sqlalchemy.text("ANALYZE debtor"))
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(
+        args=[
+            "swpt_debtors",
+            "scan_debtors",
+            "--days",
+            "0.000001",
+            "--quit-early",
+        ]
+    )
+    assert result.exit_code == 0
+
+    debtors = Debtor.query.all()
+    assert sorted([d.debtor_id - MIN_DEBTOR_ID for d in debtors]) == [2, 3]
+    tombstones = DebtorTombstone.query.all()
+    assert [t.debtor_id - MIN_DEBTOR_ID for t in tombstones] == [1]
+    assert len(Document.query.all()) == 1
+
+    with pytest.raises(procedures.DebtorExists):
+        procedures.reserve_debtor(MIN_DEBTOR_ID + 1)
+    assert procedures.get_debtor(MIN_DEBTOR_ID + 1) is None
+
+
+def test_scan_document_blobs(app, db_session, current_ts):
+    _create_new_debtor(MIN_DEBTOR_ID + 1, activate=True)
+    _create_new_debtor(MIN_DEBTOR_ID + 2, activate=True)
+    for debtor_id, content in [
+        (MIN_DEBTOR_ID + 1, b"shared"),
+        (MIN_DEBTOR_ID + 2, b"shared"),
+        (MIN_DEBTOR_ID + 1, b"deleted"),
+        (MIN_DEBTOR_ID + 1, b"recent"),
+    ]:
+        procedures.save_document(
+            debtor_id=debtor_id, content_type="text/plain", content=content
+        )
+    Document.query.filter(Document.debtor_id == MIN_DEBTOR_ID + 1).delete()
+    DocumentBlob.query.filter(DocumentBlob.content_hash.in_(
+        [
+            blob.content_hash
+            for blob in DocumentBlob.query.all()
+            if blob.content != b"recent"
+        ]
+    )).update({"saved_at": current_ts - timedelta(days=3000)})
+    db.session.commit()
+
+    with db.engine.connect() as conn:
+        conn.execute(sqlalchemy.text("ANALYZE document_blob"))
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(
+        args=[
+            "swpt_debtors",
+            "scan_document_blobs",
+            "--days",
+            "0.000001",
+            "--quit-early",
+        ]
+    )
+    assert result.exit_code == 0
+
+    blobs = DocumentBlob.query.all()
+    assert sorted(blob.content for blob in blobs) == [b"recent", b"shared"]
+    document = Document.query.one()
+    assert document.content == b"shared"
+
+
 def test_delete_parent_debtors(app, db_session, current_ts):
     _create_new_debtor(MIN_DEBTOR_ID, activate=True)
     db.session.commit()
@@ -121,6 +229,64 @@ def test_delete_parent_debtors(app, db_session, current_ts):
     app.config["SHARDING_REALM"] = orig_sharding_realm
 
 
+def test_bulk_debtor_commands(app, db_session, tmp_path):
+    ids_file = tmp_path / "debtor_ids.txt"
+    ids_file.write_text(f"{MIN_DEBTOR_ID + 1}\nINVALID\n{MIN_DEBTOR_ID + 2}\n")
+    runner = app.test_cli_runner()
+
+    result = runner.invoke(
+        args=[
+            "swpt_debtors",
+            "activate_debtors",
+            "--chunk-size",
+            "2",
+            "--file",
+            str(ids_file),
+            str(MIN_DEBTOR_ID),
+        ]
+    )
+    assert result.exit_code == 0
+    debtors = Debtor.query.all()
+    assert len(debtors) == 3
+    assert all(d.is_activated for d in debtors)
+
+    result = runner.invoke(
+        args=[
+            "swpt_debtors",
+            "restrict_debtors",
+            "--min-balance",
+            "1",
+            str(MIN_DEBTOR_ID),
+        ]
+    )
+    assert result.exit_code != 0
+
+    result = runner.invoke(
+        args=[
+            "swpt_debtors",
+            "restrict_debtors",
+            "--min-balance",
+            "-1000",
+            str(MIN_DEBTOR_ID),
+        ]
+    )
+    assert result.exit_code == 0
+    assert procedures.get_debtor(MIN_DEBTOR_ID).min_balance == -1000
+
+    result = runner.invoke(
+        args=[
+            "swpt_debtors",
+            "deactivate_debtors",
+            str(MIN_DEBTOR_ID),
+            str(MIN_DEBTOR_ID + 1),
+        ]
+    )
+    assert result.exit_code == 0
+    assert procedures.get_debtor(MIN_DEBTOR_ID).is_deactivated
+    assert procedures.get_debtor(MIN_DEBTOR_ID + 1).is_deactivated
+    assert procedures.get_debtor(MIN_DEBTOR_ID + 2).is_activated
+
+
 def test_flush_messages(mocker, app, db_session):
     send_signalbus_message = Mock()
     mocker.patch(
@@ -0,0 +1,79 @@
+import re
+from sqlalchemy.pool import NullPool
+from swpt_debtors.extensions import db
+from swpt_debtors.instrumentation import (
+    RequestStats,
+    TimedQueuePool,
+    measure_serialization,
+    _current_stats,
+)
+from swpt_debtors import models as m
+
+D_ID = 4294967296
+LOGGING_CONTEXT_REGEX = re.compile(
+    r"^sql=(\d+) db=[\d.]+ms pool=[\d.]+ms lock=[\d.]+ms ser=[\d.]+ms$"
+)
+
+
+def test_timed_pool(app):
+    assert isinstance(db.engine.pool, (TimedQueuePool, NullPool))
+
+
+def test_measure_serialization():
+    with measure_serialization():
+        pass
+
+    stats = RequestStats()
+    token = _current_stats.set(stats)
+    try:
+
+        @measure_serialization()
+        def f():
+            with measure_serialization():
+                assert stats.serialization_depth == 2
+            assert stats.serialization_seconds == 0.0
+
+        f()
+        assert stats.serialization_depth == 0
+        assert stats.serialization_seconds > 0.0
+    finally:
+        _current_stats.reset(token)
+
+
+def _create_debtor():
+    debtor = m.Debtor(debtor_id=D_ID, status_flags=0)
+    debtor.activate()
+    db.session.add(debtor)
+    db.session.commit()
+
+
+def test_logging_context(app, db_session):
+    _create_debtor()
+    client = app.test_client()
+    r = client.get(f"/debtors/{D_ID}/")
+    assert r.status_code == 200
+    match = LOGGING_CONTEXT_REGEX.match(r.headers["X-Logging-Context"])
+    assert match
+    assert int(match.group(1)) > 0
+    assert "Server-Timing" not in r.headers
+
+    r = client.get("/debtors/health/check/public")
+    assert r.status_code == 200
+    match = LOGGING_CONTEXT_REGEX.match(r.headers["X-Logging-Context"])
+    assert match
+    assert int(match.group(1)) == 0
+
+
+def test_server_timing(app, db_session):
+    _create_debtor()
+    app.config["APP_ENABLE_SERVER_TIMING"] = True
+    try:
+        r = app.test_client().get(f"/debtors/{D_ID}/")
+        assert r.status_code == 200
+        server_timing = r.headers["Server-Timing"]
+        assert 'db;desc="SQL statements: ' in server_timing
+        assert "pool;" in server_timing
+        assert "lock;" in server_timing
+        assert "ser;" in server_timing
+    finally:
+        app.config["APP_ENABLE_SERVER_TIMING"] = False
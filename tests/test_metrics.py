@@ -0,0 +1,58 @@
+import pytest
+from swpt_debtors import metrics
+
+
+@pytest.fixture
+def registry():
+    return metrics.Registry()
+
+
+def test_counter(registry):
+    c = metrics.Counter("test_total", "Test counter.", registry=registry)
+    assert c.get() == 0.0
+    assert registry.render() == (
+        "# HELP test_total Test counter.\n"
+        "# TYPE test_total counter\n"
+        "test_total 0.0\n"
+    )
+    c.inc()
+    c.inc(2, kind="a")
+    c.inc(3, kind="a")
+    assert c.get() == 1.0
+    assert c.get(kind="a") == 5.0
+    assert c.get(kind="b") == 0.0
+    assert 'test_total{kind="a"} 5.0' in registry.render()
+
+    with pytest.raises(ValueError):
+        metrics.Counter("test_total", "Duplicated.", registry=registry)
+
+
+def test_gauge(registry):
+    g = metrics.Gauge("test_gauge", "Test gauge.", registry=registry)
+    g.inc(3)
+    g.dec()
+    assert g.get() == 2.0
+    g.set(10)
+    assert "test_gauge 10.0" in registry.render()
+
+    f = metrics.Gauge(
+        "test_function", "Test gauge.", function=lambda: 7, registry=registry
+    )
+    assert f.get() == 7.0
+
+
+def test_histogram(registry):
+    h = metrics.Histogram(
+        "test_seconds", "Test histogram.", buckets=[0.1, 1.0],
+        registry=registry,
+    )
+    h.observe(0.05)
+    h.observe(0.5)
+    h.observe(5.0)
+    assert h.count == 3
+    assert h.sum == pytest.approx(5.55)
+    lines = registry.render().splitlines()
+    assert 'test_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{le="1.0"} 2' in lines
+    assert 'test_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_seconds_count 3" in lines
@@ -1,7 +1,14 @@
+import json
 import pytest
+import timeit
 import uuid
 from swpt_debtors.extensions import db
-from swpt_debtors.models import Debtor, RunningTransfer
+from swpt_debtors.models import (
+    Debtor,
+    RunningTransfer,
+    encode_document_content,
+    decode_document_content,
+)
 
 D_ID = -1
 C_ID = 1
@@ -78,3 +85,56 @@ def test_debtor_tuple_size(db_session, current_ts):
     toast_tuple_target = 450
     some_extra_bytes = 40
     assert tuple_byte_size + some_extra_bytes <= toast_tuple_target
+
+
+def test_encode_document_content():
+    text = 100 * b"a"
+    stored, encoding = encode_document_content("text/plain", text)
+    assert encoding == "gzip"
+    assert len(stored) < len(text)
+    assert decode_document_content(stored, encoding) == text
+    assert encode_document_content(
+        "application/ld+json; charset=utf-8", text
+    )[1] == "gzip"
+    assert encode_document_content("image/png", text) == (text, None)
+    assert encode_document_content("text/plain", b"a") == (b"a", None)
+    assert decode_document_content(b"a", None) == b"a"
+    with pytest.raises(ValueError):
+        decode_document_content(b"a", "br")
+
+
+def _create_coin_info(n: int) -> bytes:
+    return json.dumps(
+        {
+            "type": "CoinInfo",
+            "uri": "https://example.com/debtors/4444444444/public",
+            "summary": "A test currency. " * n,
+            "linksToOtherCoins": [
+                {"uri": f"https://example.com/debtors/{i}/public"}
+                for i in range(n)
+            ],
+        }
+    ).encode("utf8")
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("n", [20, 100])
+def test_encode_document_content_performance(record_property, n):
+    content = _create_coin_info(n)
+    stored, encoding = encode_document_content("application/json", content)
+    assert encoding == "gzip"
+
+    number = 200
+    encode_seconds = timeit.timeit(
+        lambda: encode_document_content("application/json", content),
+        number=number,
+    )
+    decode_seconds = timeit.timeit(
+        lambda: decode_document_content(stored, encoding), number=number
+    )
+    record_property("content_bytes", len(content))
+    record_property("stored_bytes", len(stored))
+    record_property("encode_us", 1e6 * encode_seconds / number)
+    record_property("decode_us", 1e6 * decode_seconds / number)
+    assert len(stored) < len(content)
+    assert decode_seconds < encode_seconds
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+from swpt_debtors.notifications import (
+    Change,
+    Subscription,
+    AsyncSubscription,
+    CHANGE_RESET,
+    CHANGE_TRANSFER_FINALIZED,
+)
+
+
+def test_change_payload():
+    change = Change(-1, CHANGE_TRANSFER_FINALIZED, "123")
+    assert Change.from_payload(change.to_payload()) == change
+    assert Change.from_payload(Change(1, CHANGE_RESET).to_payload()) == (
+        Change(1, CHANGE_RESET, "")
+    )
+    assert Change.from_payload("") is None
+    assert Change.from_payload("xxx TransferFinalized 123") is None
+
+
+def test_subscription():
+    s = Subscription(1, max_queued=2)
+    assert s.get(0.0) is None
+    assert s.get(-1.0) is None
+
+    s.put(Change(1, CHANGE_TRANSFER_FINALIZED, "1"))
+    s.put(Change(1, CHANGE_TRANSFER_FINALIZED, "2"))
+    assert s.get(0.0) == Change(1, CHANGE_TRANSFER_FINALIZED, "1")
+    assert s.get(0.0) == Change(1, CHANGE_TRANSFER_FINALIZED, "2")
+    assert s.get(0.0) is None
+
+    s.put(Change(1, CHANGE_TRANSFER_FINALIZED, "1"))
+    s.put(Change(1, CHANGE_TRANSFER_FINALIZED, "2"))
+    s.put(Change(1, CHANGE_TRANSFER_FINALIZED, "3"))
+    assert s.get(0.0) == Change(1, CHANGE_RESET)
+    assert s.get(0.0) is None
+
+
+def test_async_subscription():
+    async def receive_changes():
+        s = AsyncSubscription(1, max_queued=2)
+        assert await s.get_async(0.0) is None
+        assert await s.get_async(0.01) is None
+
+        # The changes are put from the listening thread.
+        changes = [
+            Change(1, CHANGE_TRANSFER_FINALIZED, "1"),
+            Change(1, CHANGE_TRANSFER_FINALIZED, "2"),
+        ]
+        thread = threading.Thread(target=lambda: [s.put(c) for c in changes])
+        thread.start()
+        thread.join()
+        assert await s.get_async(10.0) == changes[0]
+        assert await s.get_async(0.0) == changes[1]
+        assert await s.get_async(0.0) is None
+
+        waiting = asyncio.ensure_future(s.get_async(10.0))
+        await asyncio.sleep(0.01)
+        threading.Thread(target=s.put, args=(changes[0],)).start()
+        assert await waiting == changes[0]
+
+    asyncio.run(receive_changes())
@@ -1,11 +1,15 @@
 import pytest
 from uuid import UUID
-from datetime import datetime, date, timedelta
+from datetime import datetime, date, timedelta, timezone
 from swpt_pythonlib.utils import i64_to_u64
 from swpt_debtors.extensions import db
 from swpt_debtors import __version__
 from swpt_debtors.models import (
     Debtor,
+    DebtorTombstone,
+    DebtorQuota,
+    Document,
+    DocumentBlob,
     RunningTransfer,
     PrepareTransferSignal,
     FinalizeTransferSignal,
@@ -17,6 +21,11 @@ from swpt_debtors.models import (
     SC_CANCELED_BY_THE_SENDER,
     DEFAULT_CONFIG_FLAGS,
 )
+from swpt_debtors.notifications import (
+    Change,
+    CHANGE_BALANCE_CHANGED,
+    CHANGE_DEBTOR_INFO_CHANGED,
+)
 from swpt_debtors import procedures as p
 
 D_ID = 4294967296
@@ -229,7 +238,7 @@ def test_account_change_signal_ineffectual_config(debtor, current_ts):
 
 def test_running_transfers(debtor):
     recipient_uri, recipient = acc_id(D_ID, C_ID)
-    Debtor.query.filter_by(debtor_id=D_ID).one().running_transfers_count = 1
+    db.session.add(DebtorQuota(debtor_id=D_ID, running_transfers_count=1))
     db.session.add(
         RunningTransfer(
             debtor_id=D_ID,
@@ -242,7 +251,7 @@ def test_running_transfers(debtor):
         )
     )
     db.session.commit()
-    assert p.get_debtor(D_ID).running_transfers_count == 1
+    assert p.get_debtor_quota(D_ID).running_transfers_count == 1
     with pytest.raises(p.DebtorDoesNotExist):
         p.get_debtor_transfer_uuids(1234567890)
     uuids = p.get_debtor_transfer_uuids(D_ID)
@@ -257,7 +266,7 @@ def test_running_transfers(debtor):
     assert t.recipient_uri == recipient_uri
 
     p.delete_running_transfer(D_ID, TEST_UUID)
-    assert p.get_debtor(D_ID).running_transfers_count == 0
+    assert p.get_debtor_quota(D_ID).running_transfers_count == 0
     assert p.get_running_transfer(D_ID, TEST_UUID) is None
 
 
@@ -283,10 +292,18 @@ def test_initiate_running_transfer(debtor):
     assert t.transfer_note == "test"
     assert not t.is_settled
     assert not t.is_finalized
+    pts = PrepareTransferSignal.query.one()
+    assert pts.coordinator_request_id == t.coordinator_request_id
+    assert pts.amount == 1000
+    assert pts.recipient == recipient
+    assert p.get_running_transfer(D_ID, TEST_UUID).initiated_at == (
+        t.initiated_at
+    )
     with pytest.raises(p.TransferExists):
         p.initiate_running_transfer(
             D_ID, TEST_UUID, *acc_id(D_ID, C_ID), 1000, "fmt", "test"
         )
+    assert p.get_debtor_quota(D_ID).actions_count == 1
     with pytest.raises(p.TransfersConflict):
         p.initiate_running_transfer(
             D_ID, TEST_UUID, *acc_id(D_ID, C_ID), 1001, "fmt", "test"
@@ -307,9 +324,98 @@ def test_initiate_running_transfer(debtor):
     assert len(RunningTransfer.query.all()) == 0
 
 
+def test_initiate_running_transfers(debtor):
+    recipient_uri, recipient = acc_id(D_ID, C_ID)
+
+    def make_transfer(transfer_uuid, amount=1000):
+        return {
+            "transfer_uuid": transfer_uuid,
+            "recipient_uri": recipient_uri,
+            "recipient": recipient,
+            "amount": amount,
+            "transfer_note_format": "fmt",
+            "transfer_note": "test",
+        }
+
+    p.initiate_running_transfer(
+        D_ID, TEST_UUID, recipient_uri, recipient, 1000, "fmt", "test"
+    )
+    TEST_UUID3 = UUID("123e4567-e89b-12d3-a456-426655440002")
+    results = p.initiate_running_transfers(
+        D_ID,
+        [
+            make_transfer(TEST_UUID),
+            make_transfer(TEST_UUID2),
+            make_transfer(TEST_UUID3, amount=1001),
+            make_transfer(TEST_UUID2, amount=1001),
+            make_transfer(TEST_UUID3, amount=1001),
+        ],
+    )
+    assert results == [
+        (p.TRANSFER_EXISTS, TEST_UUID),
+        (p.TRANSFER_CREATED, TEST_UUID2),
+        (p.TRANSFER_CREATED, TEST_UUID3),
+        (p.TRANSFER_CONFLICT, TEST_UUID2),
+        (p.TRANSFER_EXISTS, TEST_UUID3),
+    ]
+    assert len(RunningTransfer.query.all()) == 3
+    assert len(PrepareTransferSignal.query.all()) == 3
+    quota = p.get_debtor_quota(D_ID)
+    assert quota.running_transfers_count == 3
+    assert quota.actions_count == 3
+    assert p.get_running_transfer(D_ID, TEST_UUID3).amount == 1001
+
+    assert p.initiate_running_transfers(
+        D_ID, [make_transfer(TEST_UUID2)]
+    ) == [(p.TRANSFER_EXISTS, TEST_UUID2)]
+    assert p.get_debtor_quota(D_ID).actions_count == 3
+
+    with pytest.raises(p.TooManyManagementActions):
+        p.initiate_running_transfers(
+            D_ID,
+            [
+                make_transfer(UUID(f"123e4567-e89b-12d3-a456-42665544100{i}"))
+                for i in range(3)
+            ],
+            max_actions_per_month=5,
+        )
+    assert len(RunningTransfer.query.all()) == 3
+
+    with pytest.raises(p.DebtorDoesNotExist):
+        p.initiate_running_transfers(1234567890, [make_transfer(TEST_UUID)])
+
+
+def test_delete_running_transfers(debtor):
+    uuids = [UUID(f"123e4567-e89b-12d3-a456-42665544000{i}") for i in range(4)]
+    for uuid in uuids:
+        p.initiate_running_transfer(
+            D_ID, uuid, *acc_id(D_ID, C_ID), 1000, "", ""
+        )
+    p.cancel_running_transfer(D_ID, uuids[0])
+    p.cancel_running_transfer(D_ID, uuids[1])
+    assert p.get_debtor_quota(D_ID).running_transfers_count == 4
+
+    assert p.delete_running_transfers(
+        D_ID, finalized_before=datetime(2000, 1, 1, tzinfo=timezone.utc)
+    ) == 0
+    assert p.delete_running_transfers(
+        D_ID,
+        transfer_uuids=[uuids[1], uuids[2]],
+        finalized_before=datetime.now(tz=timezone.utc),
+    ) == 1
+    assert p.get_debtor_quota(D_ID).running_transfers_count == 3
+    assert p.get_running_transfer(D_ID, uuids[1]) is None
+
+    assert p.delete_running_transfers(
+        D_ID, transfer_uuids=[uuids[0], uuids[1], uuids[3]]
+    ) == 2
+    assert p.get_debtor_quota(D_ID).running_transfers_count == 1
+    assert p.get_debtor_transfer_uuids(D_ID) == [uuids[2]]
+
+
 def test_too_many_initiated_transfers(debtor):
     recipient_uri, recipient = acc_id(D_ID, C_ID)
-    Debtor.query.filter_by(debtor_id=D_ID).one().running_transfers_count = 1
+    db.session.add(DebtorQuota(debtor_id=D_ID, running_transfers_count=1))
     db.session.add(
         RunningTransfer(
             debtor_id=D_ID,
@@ -323,7 +429,7 @@ def test_too_many_initiated_transfers(debtor):
     )
     db.session.commit()
     assert len(RunningTransfer.query.all()) == 1
-    assert p.get_debtor(D_ID).running_transfers_count == 1
+    assert p.get_debtor_quota(D_ID).running_transfers_count == 1
     for i in range(1, 10):
         suffix = "{:0>4}".format(i)
         uuid = UUID(f"123e4567-e89b-12d3-a456-42665544{suffix}")
@@ -331,7 +437,7 @@ def test_too_many_initiated_transfers(debtor):
             D_ID, uuid, *acc_id(D_ID, C_ID), 1000, "", "", 10
         )
     assert len(RunningTransfer.query.all()) == 10
-    assert p.get_debtor(D_ID).running_transfers_count == 10
+    assert p.get_debtor_quota(D_ID).running_transfers_count == 10
     with pytest.raises(p.TooManyRunningTransfers):
         p.initiate_running_transfer(
             D_ID,
@@ -504,6 +610,43 @@ def test_failed_transfer(debtor):
     assert it.total_locked_amount == 666
 
 
+@pytest.mark.parametrize("publish_balance_changes", [False, True])
+def test_account_update_signal_balance_changed(
+    monkeypatch, debtor, current_ts, publish_balance_changes
+):
+    changes = []
+    monkeypatch.setattr(p, "_notify_change", changes.append)
+
+    for seqnum, principal in enumerate([1000, 1000]):
+        p.process_account_update_signal(
+            debtor_id=D_ID,
+            creditor_id=ROOT_CREDITOR_ID,
+            last_change_seqnum=seqnum,
+            last_change_ts=current_ts,
+            principal=principal,
+            interest_rate=0.0,
+            creation_date=DATE0,
+            last_config_ts=TS0,
+            last_config_seqnum=0,
+            config_data="",
+            account_id="0",
+            transfer_note_max_bytes=100,
+            negligible_amount=2.0,
+            config_flags=0,
+            ts=current_ts,
+            ttl=1000000,
+            publish_balance_changes=publish_balance_changes,
+        )
+
+    balance_changes = [
+        c for c in changes if c.change_type == CHANGE_BALANCE_CHANGED
+    ]
+    if publish_balance_changes:
+        assert balance_changes == [Change(D_ID, CHANGE_BALANCE_CHANGED)]
+    else:
+        assert balance_changes == []
+
+
 def test_process_account_purge_signal(debtor, current_ts):
     creation_date = date(2020, 1, 10)
     p.process_account_update_signal(
@@ -604,7 +747,10 @@ def test_cancel_running_transfer_failure(debtor):
         p.cancel_running_transfer(D_ID, TEST_UUID)
 
 
-def test_activate_new_debtor(db_session):
+def test_activate_new_debtor(monkeypatch, db_session):
+    changes = []
+    monkeypatch.setattr(p, "_notify_change", changes.append)
+
     debtor = p.reserve_debtor(D_ID)
     assert debtor.debtor_id == D_ID
     assert not debtor.is_activated
@@ -619,6 +765,7 @@ def test_activate_new_debtor(db_session):
     debtor = p.get_active_debtor(D_ID)
     assert debtor
     assert debtor.is_activated
+    assert changes == [Change(D_ID, CHANGE_DEBTOR_INFO_CHANGED)]
     cas = ConfigureAccountSignal.query.one()
     assert cas.debtor_id == D_ID
     assert cas.config_data == ""
@@ -628,6 +775,66 @@ def test_activate_new_debtor(db_session):
         p.reserve_debtor(D_ID)
 
 
+def test_reserve_random_debtor(db_session):
+    D_ID2 = D_ID + 1
+    D_ID3 = D_ID + 2
+    p.reserve_debtor(D_ID)
+    db.session.add(DebtorTombstone(debtor_id=D_ID2))
+    db.session.commit()
+
+    debtor = p.reserve_random_debtor([D_ID, D_ID2, D_ID3])
+    assert debtor.debtor_id == D_ID3
+    assert not debtor.is_activated
+    assert debtor.reservation_id is not None
+    assert p.get_debtor(D_ID2) is None
+    assert len(Debtor.query.all()) == 2
+
+    with pytest.raises(p.DebtorExists):
+        p.reserve_random_debtor([D_ID, D_ID2, D_ID3])
+    with pytest.raises(p.DebtorExists):
+        p.reserve_random_debtor([])
+
+
+def test_bulk_debtor_operations(monkeypatch, db_session):
+    changes = []
+    monkeypatch.setattr(p, "_notify_change", changes.append)
+
+    D_ID2 = D_ID + 1
+    D_ID3 = D_ID + 2
+    p.reserve_debtor(D_ID)
+    db.session.add(DebtorTombstone(debtor_id=D_ID3))
+    db.session.commit()
+
+    assert p.activate_debtors([]) == []
+    assert p.activate_debtors([D_ID3, D_ID2, D_ID, D_ID2]) == [D_ID2]
+    assert changes == [Change(D_ID2, CHANGE_DEBTOR_INFO_CHANGED)]
+    assert p.get_debtor(D_ID3) is None
+    assert not p.get_debtor(D_ID).is_activated
+    debtor = p.get_active_debtor(D_ID2)
+    cas = ConfigureAccountSignal.query.one()
+    assert cas.debtor_id == D_ID2
+    assert cas.ts == debtor.last_config_ts
+    assert cas.seqnum == debtor.last_config_seqnum
+    assert cas.config_data == ""
+    assert cas.config_flags == 0
+
+    assert p.restrict_debtors([D_ID, D_ID2, D_ID3], -1000) == [D_ID2]
+    assert p.get_debtor(D_ID2).min_balance == -1000
+    assert len(ConfigureAccountSignal.query.all()) == 2
+
+    p.initiate_running_transfer(
+        D_ID2, TEST_UUID, *acc_id(D_ID2, C_ID), 1000, "", ""
+    )
+    assert p.deactivate_debtors([D_ID, D_ID2, D_ID3]) == [D_ID2]
+    debtor = p.get_debtor(D_ID2)
+    assert debtor.is_deactivated
+    assert p.get_debtor_quota(D_ID2).running_transfers_count == 0
+    assert len(RunningTransfer.query.all()) == 0
+    assert len(ConfigureAccountSignal.query.all()) == 3
+    assert p.deactivate_debtors([D_ID2]) == []
+    assert p.restrict_debtors([D_ID2], -1) == []
+
+
 def test_update_debtor_config(debtor):
     last_config_ts = debtor.last_config_ts
     last_config_seqnum = debtor.last_config_seqnum
@@ -691,3 +898,76 @@ def test_process_rejected_config_signal(debtor):
 
     p.process_rejected_config_signal(**params)
     assert d.config_error == "TEST_CODE"
+
+
+def test_debtor_quota(debtor):
+    assert p.get_debtor_quota(D_ID) is None
+    p.save_document(
+        debtor_id=D_ID,
+        content_type="text/plain",
+        content=b"abc",
+        max_saves_per_year=1,
+    )
+    with pytest.raises(p.TooManySavedDocuments):
+        p.save_document(
+            debtor_id=D_ID,
+            content_type="text/plain",
+            content=b"abc",
+            max_saves_per_year=1,
+        )
+    p.initiate_running_transfer(
+        D_ID, TEST_UUID, *acc_id(D_ID, C_ID), 1000, "", ""
+    )
+    quota = p.get_debtor_quota(D_ID)
+    assert quota.documents_count == 1
+    assert quota.actions_count == 1
+    assert quota.running_transfers_count == 1
+
+    p.deactivate_debtor(D_ID)
+    assert p.get_debtor_quota(D_ID).running_transfers_count == 0
+    assert p.get_running_transfer(D_ID, TEST_UUID) is None
+    with pytest.raises(p.DebtorDoesNotExist):
+        p.initiate_running_transfer(
+            D_ID, TEST_UUID2, *acc_id(D_ID, C_ID), 1000, "", ""
+        )
+
+
+def test_save_document(debtor):
+    d1 = p.save_document(
+        debtor_id=D_ID, content_type="text/plain", content=b"abc"
+    )
+    d2 = p.save_document(
+        debtor_id=D_ID, content_type="text/html", content=b"abc"
+    )
+    d3 = p.save_document(
+        debtor_id=D_ID, content_type="text/plain", content=b"xyz"
+    )
+    assert d1.document_id != d2.document_id
+    assert d1.etag == d2.etag != d3.etag
+    assert len(DocumentBlob.query.all()) == 2
+    assert Document.query.filter_by(inline_content=None).count() == 3
+
+    d = p.get_document(D_ID, d2.document_id)
+    assert d.content_type == "text/html"
+    assert d.content == b"abc"
+    d = p.get_document(D_ID, d3.document_id, defer_toasted=True)
+    assert d.content_length == 3
+    assert d.content == b"xyz"
+
+
+def test_get_legacy_document(debtor):
+    db.session.add(
+        Document(
+            debtor_id=D_ID,
+            document_id=1,
+            content_type="text/plain",
+            inline_content=b"legacy",
+        )
+    )
+    db.session.commit()
+
+    d = p.get_document(D_ID, 1, defer_toasted=True)
+    assert d.content_hash is None
+    assert d.content_length == 6
+    assert d.content == b"legacy"
+    assert d.etag == f"{D_ID}-1"
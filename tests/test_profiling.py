@@ -0,0 +1,127 @@
+import os
+import pstats
+from werkzeug.test import Client, EnvironBuilder
+from swpt_debtors.profiling import SamplingProfilerMiddleware
+
+
+def _get_profile_files(profile_dir):
+    return sorted(x for x in os.listdir(profile_dir) if x.endswith(".prof"))
+
+
+def test_sample_all_requests(app, tmp_path):
+    profiler = SamplingProfilerMiddleware(
+        app.wsgi_app,
+        app.url_map,
+        profile_dir=str(tmp_path),
+        sample_rate=1.0,
+        dump_seconds=0.0,
+    )
+    client = Client(profiler)
+
+    r = client.get("/debtors/health/check/public")
+    assert r.status_code == 200
+    r = client.get("/debtors/health/check/public")
+    assert r.status_code == 200
+    r = client.get("/not-found")
+    assert r.status_code == 404
+
+    pid = os.getpid()
+    assert _get_profile_files(tmp_path) == [
+        f"health.HealthCheckEndpoint.{pid}.prof",
+        f"unknown.{pid}.prof",
+    ]
+    stats = pstats.Stats(
+        str(tmp_path / f"health.HealthCheckEndpoint.{pid}.prof")
+    )
+    assert stats.total_calls > 0
+
+
+def test_trigger_profiling(app, tmp_path):
+    profiler = SamplingProfilerMiddleware(
+        app.wsgi_app,
+        app.url_map,
+        profile_dir=str(tmp_path),
+        trigger_token="secret",
+        signal_endpoint="health.HealthCheckEndpoint",
+        signal_requests=1,
+        dump_seconds=3600.0,
+    )
+    client = Client(profiler)
+
+    r = client.get("/debtors/health/check/public")
+    assert r.status_code == 200
+    r = client.get(
+        "/debtors/health/check/public", headers={"X-Swpt-Profile": "wrong"}
+    )
+    assert r.status_code == 200
+    profiler.dump_stats()
+    assert _get_profile_files(tmp_path) == []
+
+    r = client.get("/not-found", headers={"X-Swpt-Profile": "secret"})
+    assert r.status_code == 404
+    profiler.dump_stats()
+    assert _get_profile_files(tmp_path) == [f"unknown.{os.getpid()}.prof"]
+
+    # Simulate a SIGURG signal.
+    profiler._triggered_requests = profiler.signal_requests
+    r = client.get("/not-found")
+    assert r.status_code == 404
+    r = client.get("/debtors/health/check/public")
+    assert r.status_code == 200
+    r = client.get("/debtors/health/check/public")
+    assert r.status_code == 200
+    profiler.dump_stats()
+    assert len(_get_profile_files(tmp_path)) == 2
+    assert profiler._triggered_requests == 0
+    stats = pstats.Stats(
+        str(tmp_path / f"health.HealthCheckEndpoint.{os.getpid()}.prof")
+    )
+    assert stats.total_calls > 0
+
+
+def test_profile_streamed_response(app, tmp_path):
+    generated = []
+
+    def wsgi_app(environ, start_response):
+        def generate():
+            for i in range(3):
+                generated.append(i)
+                yield b"x"
+
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return generate()
+
+    profiler = SamplingProfilerMiddleware(
+        wsgi_app,
+        app.url_map,
+        profile_dir=str(tmp_path),
+        sample_rate=1.0,
+        dump_seconds=3600.0,
+        excluded_endpoints=["debtors.DebtorEventsEndpoint"],
+    )
+
+    def get_environ(path):
+        return EnvironBuilder(
+            path=path, base_url="http://example.com"
+        ).get_environ()
+
+    app_iter = profiler(
+        get_environ("/debtors/health/check/public"), lambda *args: None
+    )
+    assert generated == []
+    assert profiler._profiling_lock.locked()
+    assert list(app_iter) == [b"x", b"x", b"x"]
+    app_iter.close()
+    assert not profiler._profiling_lock.locked()
+    profiler.dump_stats()
+    assert _get_profile_files(tmp_path) == [
+        f"health.HealthCheckEndpoint.{os.getpid()}.prof"
+    ]
+
+    app_iter = profiler(
+        get_environ("/debtors/4294967296/events"), lambda *args: None
+    )
+    assert not profiler._profiling_lock.locked()
+    assert list(app_iter) == [b"x", b"x", b"x"]
+    profiler.dump_stats()
+    assert len(_get_profile_files(tmp_path)) == 1
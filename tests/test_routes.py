@@ -1,10 +1,22 @@
 import re
+import gzip
+import time
+import hashlib
+import threading
+from uuid import UUID
 from datetime import date, datetime, timezone
 from urllib.parse import urljoin, urlparse
 import pytest
-from swpt_debtors.extensions import db
+from sqlalchemy import select
+from swpt_debtors import create_app
+from swpt_debtors.extensions import db, REPLICA_BIND_KEY
+from swpt_debtors.routes import (
+    READ_YOUR_WRITES_COOKIE,
+    get_replica_lag_monitor,
+)
 from swpt_debtors import procedures as p
 from swpt_debtors import models as m
+from tests.conftest import config_dict
 
 
 @pytest.fixture(scope="function")
@@ -59,6 +71,21 @@ def test_auto_genereate_debtor_id(client):
     assert datetime.fromisoformat(data["createdAt"])
 
 
+def test_auto_genereate_debtor_id_on_shard(app, db_session):
+    shard_app = create_app(
+        {**config_dict, "PROTOCOL_BROKER_QUEUE_ROUTING_KEY": "1.#"}
+    )
+    with shard_app.app_context():
+        try:
+            r = shard_app.test_client().post(
+                "/debtors/.debtor-reserve", json={}
+            )
+            assert r.status_code == 200
+            assert m.is_valid_debtor_id(int(r.get_json()["debtorId"]))
+        finally:
+            db.engine.dispose()
+
+
 def test_create_debtor(client):
     r = client.get("/debtors/4294967296/")
     assert r.status_code == 403
@@ -193,6 +220,61 @@ def test_create_debtor(client):
     assert r.status_code == 204
 
 
+def test_bulk_debtor_operations(client):
+    r = client.post(
+        "/debtors/.bulk-activate",
+        json={"debtorIds": ["4294967296", "1", "INVALID"]},
+    )
+    assert r.status_code == 422
+
+    r = client.post(
+        "/debtors/.bulk-activate",
+        json={"debtorIds": ["4294967296", "4294967297", "4294967296"]},
+    )
+    assert r.status_code == 200
+    assert r.get_json() == {
+        "type": "DebtorsBulkOperationResult",
+        "debtorIds": ["4294967296", "4294967297"],
+    }
+    r = client.get("/debtors/4294967297/")
+    assert r.status_code == 200
+
+    r = client.post(
+        "/debtors/.bulk-activate",
+        json={
+            "type": "DebtorsBulkActivationRequest",
+            "debtorIds": ["4294967297", "4294967298"],
+        },
+    )
+    assert r.status_code == 200
+    assert r.get_json()["debtorIds"] == ["4294967298"]
+
+    r = client.post(
+        "/debtors/.bulk-restrict",
+        headers={"X-Swpt-User-Id": "debtors-supervisor"},
+        json={"debtorIds": ["4294967297"], "minBalance": -1000},
+    )
+    assert r.status_code == 403
+
+    r = client.post(
+        "/debtors/.bulk-restrict",
+        json={"debtorIds": ["4294967297", "4294967299"], "minBalance": -1000},
+    )
+    assert r.status_code == 200
+    assert r.get_json()["debtorIds"] == ["4294967297"]
+    r = client.get("/debtors/4294967297/")
+    assert r.get_json()["minBalance"] == -1000
+
+    r = client.post(
+        "/debtors/.bulk-deactivate",
+        json={"debtorIds": ["4294967296", "4294967297"]},
+    )
+    assert r.status_code == 200
+    assert r.get_json()["debtorIds"] == ["4294967296", "4294967297"]
+    r = client.get("/debtors/4294967297/")
+    assert r.status_code == 403
+
+
 def test_get_debtors_list(client):
     r = client.post("/debtors/4294967296/reserve", json={})
     assert r.status_code == 200
@@ -211,6 +293,19 @@ def test_get_debtors_list(client):
     assert data["itemsType"] == "ObjectReference"
     assert data["first"] == "/debtors/9223372036854775808/enumerate"
 
+    r = client.get(data["first"])
+    assert r.status_code == 200
+    assert r.content_type == "application/json"
+    assert r.get_json() == {
+        "type": "ObjectReferencesPage",
+        "uri": "/debtors/9223372036854775808/enumerate?",
+        "items": [
+            {"uri": "/debtors/4294967297/"},
+            {"uri": "/debtors/4294967298/"},
+        ],
+        "next": "/debtors/8589934591/enumerate",
+    }
+
     entries = _get_all_pages(
         client, data["first"], page_type="ObjectReferencesPage"
     )
@@ -341,6 +436,90 @@ def test_change_debtor_config(client, debtor):
     assert r.status_code == 403
 
 
+def test_debtor_etags(client, debtor):
+    r = client.get("/debtors/4444444444/")
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    assert etag
+
+    r = client.get("/debtors/4444444444/config")
+    assert r.status_code == 200
+    assert r.headers["ETag"] == etag
+
+    r = client.get("/debtors/4444444444/", headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert r.data == b""
+
+    r = client.get(
+        "/debtors/4444444444/config", headers={"If-None-Match": '"xxx"'}
+    )
+    assert r.status_code == 200
+    assert r.headers["ETag"] == etag
+
+    r = client.get("/debtors/6666666666/", headers={"If-None-Match": etag})
+    assert r.status_code == 403
+    r = client.get(
+        "/debtors/6666666666/config", headers={"If-None-Match": etag}
+    )
+    assert r.status_code == 404
+
+    request = {"configData": "TEST", "latestUpdateId": 2}
+    r = client.patch(
+        "/debtors/4444444444/config",
+        json=request,
+        headers={"If-Match": '"xxx"'},
+    )
+    assert r.status_code == 412
+    assert p.get_debtor_quota(4444444444) is None
+
+    r = client.patch(
+        "/debtors/4444444444/config", json=request, headers={"If-Match": etag}
+    )
+    assert r.status_code == 200
+    new_etag = r.headers["ETag"]
+    assert new_etag != etag
+
+    r = client.get("/debtors/4444444444/", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] == new_etag
+
+    r = client.get(
+        "/debtors/4444444444/config", headers={"If-None-Match": new_etag}
+    )
+    assert r.status_code == 304
+
+    r = client.patch(
+        "/debtors/4444444444/config", json=request, headers={"If-Match": etag}
+    )
+    assert r.status_code == 412
+
+    p.process_account_update_signal(
+        debtor_id=4444444444,
+        creditor_id=0,
+        creation_date=date(2020, 1, 1),
+        last_change_ts=datetime(2020, 1, 2, tzinfo=timezone.utc),
+        last_change_seqnum=1,
+        principal=1000,
+        interest_rate=0.0,
+        last_config_ts=datetime(2020, 1, 1, tzinfo=timezone.utc),
+        last_config_seqnum=1,
+        negligible_amount=1e30,
+        config_data="",
+        config_flags=0,
+        account_id="0",
+        transfer_note_max_bytes=500,
+        ts=datetime.now(tz=timezone.utc),
+        ttl=10000,
+    )
+    r = client.get(
+        "/debtors/4444444444/", headers={"If-None-Match": new_etag}
+    )
+    assert r.status_code == 200
+    assert r.headers["ETag"] != new_etag
+    assert r.get_json()["balance"] == 1000
+
+
 def test_initiate_running_transfer(client, debtor):
     r = client.get("/debtors/6666666666/transfers/")
     assert r.status_code == 404
@@ -467,6 +646,109 @@ def test_initiate_running_transfer(client, debtor):
             assert r.status_code == 201
 
 
+def test_bulk_create_transfers(client, debtor):
+    def make_request(transfer_uuid, amount=1000, recipient="4444444444/1111"):
+        return {
+            "amount": amount,
+            "recipient": {"uri": f"swpt:{recipient}"},
+            "transferUuid": transfer_uuid,
+        }
+
+    uuid1 = "123e4567-e89b-12d3-a456-426655440000"
+    uuid2 = "123e4567-e89b-12d3-a456-426655440001"
+    r = client.post(
+        "/debtors/4444444444/transfers/", json=make_request(uuid1)
+    )
+    assert r.status_code == 201
+
+    r = client.post(
+        "/debtors/4444444444/transfers/.bulk-create",
+        json={
+            "transfers": [
+                make_request(uuid1),
+                make_request(uuid2, recipient="6666666666/1111"),
+                make_request(uuid2, recipient="INVALID"),
+            ],
+        },
+    )
+    assert r.status_code == 422
+    errors = r.get_json()["errors"]["json"]["transfers"]
+    assert set(errors.keys()) == {"1", "2"}
+
+    r = client.post(
+        "/debtors/4444444444/transfers/.bulk-create",
+        json={"transfers": []},
+    )
+    assert r.status_code == 422
+
+    r = client.post(
+        "/debtors/6666666666/transfers/.bulk-create",
+        json={"transfers": [make_request(uuid2, recipient="6666666666/1")]},
+    )
+    assert r.status_code == 404
+
+    r = client.post(
+        "/debtors/4444444444/transfers/.bulk-create",
+        json={
+            "type": "TransfersBulkCreationRequest",
+            "transfers": [
+                make_request(uuid1),
+                make_request(uuid2),
+                make_request(uuid1, amount=1),
+            ],
+        },
+    )
+    assert r.status_code == 200
+    data = r.get_json()
+    assert data == {
+        "type": "TransfersBulkCreationResult",
+        "transfersList": {"uri": "/debtors/4444444444/transfers/"},
+        "items": [
+            {
+                "type": "TransferCreationResult",
+                "transferUuid": uuid1,
+                "status": "exists",
+                "transfer": {
+                    "uri": f"/debtors/4444444444/transfers/{uuid1}",
+                },
+            },
+            {
+                "type": "TransferCreationResult",
+                "transferUuid": uuid2,
+                "status": "created",
+                "transfer": {
+                    "uri": f"/debtors/4444444444/transfers/{uuid2}",
+                },
+            },
+            {
+                "type": "TransferCreationResult",
+                "transferUuid": uuid1,
+                "status": "conflict",
+                "transfer": {
+                    "uri": f"/debtors/4444444444/transfers/{uuid1}",
+                },
+            },
+        ],
+    }
+
+    r = client.get(f"/debtors/4444444444/transfers/{uuid2}")
+    assert r.status_code == 200
+    assert r.get_json()["amount"] == 1000
+    assert len(m.PrepareTransferSignal.query.all()) == 2
+
+    r = client.post(
+        "/debtors/4444444444/transfers/.bulk-create",
+        json={
+            "transfers": [
+                make_request(f"123e4567-e89b-12d3-a456-4266554410{i:0>2}")
+                for i in range(9)
+            ],
+        },
+    )
+    assert r.status_code == 403
+    assert len(m.RunningTransfer.query.all()) == 2
+
+
 def test_cancel_running_transfer(client, debtor):
     json_request_body = {
         "amount": 1000,
@@ -507,6 +789,230 @@ def test_cancel_running_transfer(client, debtor):
     assert r.status_code == 200
 
 
+def test_wait_for_transfer_finalization(app, client, debtor):
+    transfer_uuid = "123e4567-e89b-12d3-a456-426655440000"
+    transfer_url = f"/debtors/4444444444/transfers/{transfer_uuid}"
+    r = client.post(
+        "/debtors/4444444444/transfers/",
+        json={
+            "amount": 1000,
+            "recipient": {"uri": "swpt:4444444444/1111"},
+            "transferUuid": transfer_uuid,
+        },
+    )
+    assert r.status_code == 201
+
+    r = client.get(f"{transfer_url}?waitFor=something")
+    assert r.status_code == 422
+
+    r = client.get(
+        "/debtors/4444444444/transfers/123e4567-e89b-12d3-a456-426655440001"
+        "?waitFor=finalization&timeout=0.1"
+    )
+    assert r.status_code == 404
+
+    started_at = time.monotonic()
+    r = client.get(f"{transfer_url}?waitFor=finalization&timeout=0.2")
+    assert r.status_code == 200
+    assert time.monotonic() - started_at >= 0.2
+    assert "result" not in r.get_json()
+
+    def cancel_transfer():
+        time.sleep(0.5)
+        with app.app_context():
+            p.cancel_running_transfer(4444444444, UUID(transfer_uuid))
+
+    canceling_thread = threading.Thread(target=cancel_transfer)
+    canceling_thread.start()
+    try:
+        started_at = time.monotonic()
+        r = client.get(f"{transfer_url}?waitFor=finalization&timeout=30")
+        assert r.status_code == 200
+        assert time.monotonic() - started_at < 20.0
+        result = r.get_json()["result"]
+        assert "finalizedAt" in result
+        assert result["error"]["errorCode"] == "CANCELED_BY_THE_SENDER"
+    finally:
+        canceling_thread.join()
+
+    # Finalized transfers are returned immediately.
+    started_at = time.monotonic()
+    r = client.get(f"{transfer_url}?waitFor=finalization&timeout=30")
+    assert r.status_code == 200
+    assert time.monotonic() - started_at < 20.0
+    assert "finalizedAt" in r.get_json()["result"]
+
+
+def test_debtor_events(app, client, debtor):
+    transfer_uuid = "123e4567-e89b-12d3-a456-426655440000"
+    r = client.post(
+        "/debtors/4444444444/transfers/",
+        json={
+            "amount": 1000,
+            "recipient": {"uri": "swpt:4444444444/1111"},
+            "transferUuid": transfer_uuid,
+        },
+    )
+    assert r.status_code == 201
+
+    r = client.get("/debtors/1234/events")
+    assert r.status_code == 403
+
+    listener = app.extensions["swpt_change_listener"]
+    listener.max_subscriptions = 0
+    try:
+        r = client.get("/debtors/4444444444/events")
+        assert r.status_code == 503
+    finally:
+        listener.max_subscriptions = app.config["APP_MAX_CHANGE_SUBSCRIPTIONS"]
+
+    streams = app.extensions["swpt_blocking_event_streams"]
+    no_streams = threading.BoundedSemaphore(0)
+    app.extensions["swpt_blocking_event_streams"] = no_streams
+    try:
+        r = client.get("/debtors/4444444444/events")
+        assert r.status_code == 503
+    finally:
+        app.extensions["swpt_blocking_event_streams"] = streams
+
+    r = client.get("/debtors/4444444444/events")
+    assert r.status_code == 200
+    assert r.mimetype == "text/event-stream"
+    try:
+        events = r.iter_encoded()
+        assert next(events) == (
+            b"event: Reset\n"
+            b'data: {"uri": "/debtors/4444444444/"}\n\n'
+        )
+        with app.app_context():
+            p.cancel_running_transfer(4444444444, UUID(transfer_uuid))
+        assert next(events) == (
+            b"event: TransferFinalized\n"
+            b'data: {"uri": "/debtors/4444444444/transfers/'
+            + transfer_uuid.encode()
+            + b'"}\n\n'
+        )
+    finally:
+        r.close()
+
+    assert listener.subscriptions_count == 0
+    assert streams.acquire(blocking=False)
+    streams.release()
+
+
+def test_get_transfers_page(client, debtor):
+    r = client.get("/debtors/6666666666/transfers/.page")
+    assert r.status_code == 404
+
+    r = client.get("/debtors/4444444444/transfers/.page")
+    assert r.status_code == 200
+    data = r.get_json()
+    assert data == {
+        "type": "TransfersPage",
+        "uri": "/debtors/4444444444/transfers/.page?",
+        "items": [],
+    }
+
+    uuids = [f"123e4567-e89b-12d3-a456-42665544000{i}" for i in range(3)]
+    for uuid in uuids:
+        r = client.post(
+            "/debtors/4444444444/transfers/",
+            json={
+                "amount": 1000,
+                "recipient": {"uri": "swpt:4444444444/1111"},
+                "transferUuid": uuid,
+            },
+        )
+        assert r.status_code == 201
+    r = client.post(f"/debtors/4444444444/transfers/{uuids[1]}", json={})
+    assert r.status_code == 200
+
+    r = client.get("/debtors/4444444444/transfers/.page")
+    assert r.status_code == 200
+    data = r.get_json()
+    assert [t["transferUuid"] for t in data["items"]] == uuids[:2]
+    assert data["items"][0]["type"] == "Transfer"
+    assert data["items"][0]["uri"] == (
+        f"/debtors/4444444444/transfers/{uuids[0]}"
+    )
+    assert data["next"] == f"?prev={uuids[1]}"
+
+    items = _get_all_pages(
+        client, "/debtors/4444444444/transfers/.page", "TransfersPage"
+    )
+    assert [t["transferUuid"] for t in items] == uuids
+
+    items = _get_all_pages(
+        client,
+        "/debtors/4444444444/transfers/.page?finalized=false",
+        "TransfersPage",
+    )
+    assert [t["transferUuid"] for t in items] == [uuids[0], uuids[2]]
+    assert all("result" not in t for t in items)
+
+    items = _get_all_pages(
+        client,
+        "/debtors/4444444444/transfers/.page?finalized=true",
+        "TransfersPage",
+    )
+    assert [t["transferUuid"] for t in items] == [uuids[1]]
+    assert items[0]["result"]["error"]["errorCode"] == "CANCELED_BY_THE_SENDER"
+
+    r = client.get("/debtors/4444444444/transfers/.page?prev=INVALID")
+    assert r.status_code == 422
+
+
+def test_bulk_delete_transfers(client, debtor):
+    uuids = [f"123e4567-e89b-12d3-a456-42665544000{i}" for i in range(3)]
+    for uuid in uuids:
+        r = client.post(
+            "/debtors/4444444444/transfers/",
+            json={
+                "amount": 1000,
+                "recipient": {"uri": "swpt:4444444444/1111"},
+                "transferUuid": uuid,
+            },
+        )
+        assert r.status_code == 201
+    r = client.post(f"/debtors/4444444444/transfers/{uuids[0]}", json={})
+    assert r.status_code == 200
+
+    r = client.post("/debtors/4444444444/transfers/.bulk-delete", json={})
+    assert r.status_code == 422
+
+    r = client.post(
+        "/debtors/4444444444/transfers/.bulk-delete",
+        json={"finalizedBefore": "2000-01-01T00:00:00Z"},
+    )
+    assert r.status_code == 200
+    assert r.get_json() == {
+        "type": "TransfersBulkDeletionResult",
+        "deletedCount": 0,
+    }
+
+    r = client.post(
+        "/debtors/4444444444/transfers/.bulk-delete",
+        json={
+            "type": "TransfersBulkDeletionRequest",
+            "finalizedBefore": datetime.now(tz=timezone.utc).isoformat(),
+        },
+    )
+    assert r.status_code == 200
+    assert r.get_json()["deletedCount"] == 1
+
+    r = client.post(
+        "/debtors/4444444444/transfers/.bulk-delete",
+        json={"transferUuids": uuids},
+    )
+    assert r.status_code == 200
+    assert r.get_json()["deletedCount"] == 2
+    assert p.get_debtor_quota(4444444444).running_transfers_count == 0
+
+    r = client.get("/debtors/4444444444/transfers/")
+    assert r.status_code == 200
+    assert r.get_json()["items"] == []
+
+
 def test_unauthorized_debtor_id(debtor, client):
     json_request_body = {
         "type": "DebtorConfig",
@@ -662,6 +1168,35 @@ def test_save_document(client, debtor):
     assert r.status_code == 200
     assert r.content_type == "application/octet-stream"
     assert r.get_data() == content
+    etag = r.headers["ETag"]
+    last_modified = r.headers["Last-Modified"]
+    assert etag == '"' + hashlib.sha256(content).hexdigest() + '"'
+    assert last_modified
+
+    r = client.head(location)
+    assert r.status_code == 200
+    assert r.content_type == "application/octet-stream"
+    assert r.content_length == len(content)
+    assert r.headers["ETag"] == etag
+    assert r.get_data() == b""
+
+    r = client.get(location, headers={"If-None-Match": etag})
+    assert r.status_code == 304
+    assert r.headers["ETag"] == etag
+    assert r.get_data() == b""
+
+    r = client.get(location, headers={"If-Modified-Since": last_modified})
+    assert r.status_code == 304
+
+    r = client.get(location, headers={"If-None-Match": '"xxx"'})
+    assert r.status_code == 200
+    assert r.get_data() == content
+
+    r = client.get(
+        "/debtors/6666666666/documents/0/public",
+        headers={"If-None-Match": etag},
+    )
+    assert r.status_code == 404
 
     r = client.post(
         "/debtors/4444444444/documents/",
@@ -688,7 +1223,134 @@ def test_save_document(client, debtor):
     assert r.status_code == 404
 
 
+def test_get_compressed_document(client, debtor):
+    content = 100 * b"a"
+    document = p.save_document(
+        debtor_id=4444444444, content_type="text/plain", content=content
+    )
+    location = (
+        f"/debtors/4444444444/documents/{document.document_id}/public"
+    )
+
+    r = client.head(location, headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200
+    assert r.headers["Content-Encoding"] == "gzip"
+    assert r.headers["Vary"] == "Accept-Encoding"
+    assert r.content_length < len(content)
+
+    r = client.head(location)
+    assert r.status_code == 200
+    assert "Content-Encoding" not in r.headers
+    assert r.content_length == len(content)
+
+    # The document is cached by now.
+    for _ in range(2):
+        r = client.get(location, headers={"Accept-Encoding": "gzip, br"})
+        assert r.status_code == 200
+        assert r.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(r.get_data()) == content
+        gzip_etag = r.headers["ETag"]
+
+        r = client.get(location, headers={"Accept-Encoding": "gzip;q=0"})
+        assert r.status_code == 200
+        assert "Content-Encoding" not in r.headers
+        assert r.headers["Vary"] == "Accept-Encoding"
+        assert r.get_data() == content
+        etag = r.headers["ETag"]
+        assert gzip_etag == etag[:-1] + '-gzip"'
+
+        r = client.get(location, headers={"If-None-Match": etag})
+        assert r.status_code == 304
+        assert "Content-Encoding" not in r.headers
+        assert r.headers["ETag"] == etag
+
+        r = client.get(
+            location,
+            headers={"If-None-Match": gzip_etag, "Accept-Encoding": "gzip"},
+        )
+        assert r.status_code == 304
+        assert "Content-Encoding" not in r.headers
+        assert r.headers["ETag"] == gzip_etag
+
+        # The representations are not interchangeable.
+        r = client.get(location, headers={"If-None-Match": gzip_etag})
+        assert r.status_code == 200
+        assert r.get_data() == content
+
+
 def test_health_check(client):
     r = client.get("/debtors/health/check/public")
     assert r.status_code == 200
     assert r.content_type == "text/plain"
+
+
+@pytest.fixture(scope="function")
+def replica_app(app, db_session):
+    # The replica is the primary database itself, which is never lagging.
+    replica_app = create_app(
+        {
+            **config_dict,
+            "SQLALCHEMY_REPLICA_DATABASE_URI": app.config[
+                "SQLALCHEMY_DATABASE_URI"
+            ],
+        }
+    )
+    yield replica_app
+
+    replica_app.extensions["swpt_replica_lag_monitor"].stop()
+    with replica_app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def test_replica_routing(replica_app):
+    with replica_app.test_request_context("/debtors/4294967296/"):
+        assert p.get_replica_lag_seconds() == 0.0
+
+        # The lag is measured in the background.
+        monitor = get_replica_lag_monitor()
+        deadline = time.monotonic() + 10.0
+        while monitor.get_lag_seconds() != 0.0:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+
+        replica_engine = db.engines[REPLICA_BIND_KEY]
+        primary_engine = db.engines[None]
+        stmt = select(m.Debtor)
+        assert db.session.get_bind(clause=stmt) is primary_engine
+        db.session.info["use_replica"] = True
+        assert db.session.get_bind(clause=stmt) is replica_engine
+        assert (
+            db.session.get_bind(clause=stmt.with_for_update())
+            is primary_engine
+        )
+        assert db.session.get_bind(m.Debtor) is primary_engine
+        db.session.remove()
+
+    client = replica_app.test_client()
+    r = client.post("/debtors/4294967296/reserve", json={})
+    assert r.status_code == 200
+    cookie = client.get_cookie(READ_YOUR_WRITES_COOKIE)
+    assert cookie is not None
+    assert cookie.http_only
+    assert float(cookie.value) > datetime.now(tz=timezone.utc).timestamp()
+
+    reservation_id = r.get_json()["reservationId"]
+    r = client.post(
+        "/debtors/4294967296/activate",
+        json={"reservationId": reservation_id},
+    )
+    assert r.status_code == 200
+
+    r = client.get("/debtors/4294967296/")
+    assert r.status_code == 200
+    assert r.get_json()["uri"] == "/debtors/4294967296/"
+
+    client.delete_cookie(READ_YOUR_WRITES_COOKIE)
+    r = client.get("/debtors/4294967296/")
+    assert r.status_code == 200
+    assert r.get_json()["uri"] == "/debtors/4294967296/"
+    assert client.get_cookie(READ_YOUR_WRITES_COOKIE) is None
+
+    r = client.get("/debtors/4294967296/transfers/")
+    assert r.status_code == 200
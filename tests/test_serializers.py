@@ -0,0 +1,145 @@
+import pytest
+import timeit
+from uuid import UUID
+from datetime import datetime, timezone
+from flask import current_app
+from swpt_debtors import schemas
+from swpt_debtors import serializers
+from swpt_debtors.models import (
+    Debtor,
+    RunningTransfer,
+    TS0,
+    SC_OK,
+    SC_INSUFFICIENT_AVAILABLE_AMOUNT,
+)
+from swpt_debtors.routes import context as routes_context
+
+TEST_UUID = UUID("123e4567-e89b-12d3-a456-426655440000")
+CHECKUP_TS = datetime(2020, 1, 5, tzinfo=timezone.utc)
+
+# The real `calc_checkup_datetime` depends on the current time.
+context = {
+    **routes_context,
+    "calc_checkup_datetime": lambda debtor_id, initiated_at: CHECKUP_TS,
+}
+
+
+def _assert_identical(data, expected):
+    assert data == expected
+    assert current_app.json.dumps(data) == current_app.json.dumps(expected)
+
+
+def _create_debtors():
+    return [
+        Debtor(
+            debtor_id=1,
+            created_at=datetime(2020, 1, 1, tzinfo=timezone.utc),
+            balance=0,
+            min_balance=-9223372036854775808,
+            transfer_note_max_bytes=0,
+            account_id="",
+            config_data="",
+            config_latest_update_id=1,
+            last_config_ts=TS0,
+        ),
+        Debtor(
+            debtor_id=-1,
+            created_at=datetime(2020, 1, 1, 10, 30, 15, 123456),
+            balance=-1000,
+            min_balance=-5000,
+            transfer_note_max_bytes=500,
+            account_id="0",
+            config_data='{"info": "Привет"}',
+            config_error="CONFIGURATION_IS_NOT_EFFECTUAL",
+            config_latest_update_id=123,
+            last_config_ts=datetime(2021, 2, 3, tzinfo=timezone.utc),
+        ),
+    ]
+
+
+def _create_transfers():
+    transfers = []
+    for debtor_id, finalized_at, error_code, total_locked_amount in [
+        (1, None, None, None),
+        (-1, datetime(2020, 1, 4), None, None),
+        (-1, datetime(2020, 1, 4, tzinfo=timezone.utc), SC_OK, None),
+        (1, TS0, SC_INSUFFICIENT_AVAILABLE_AMOUNT, None),
+        (1, TS0, SC_INSUFFICIENT_AVAILABLE_AMOUNT, 5),
+        (1, TS0, "RECIPIENT_IS_UNREACHABLE", 5),
+    ]:
+        transfers.append(
+            RunningTransfer(
+                debtor_id=debtor_id,
+                transfer_uuid=TEST_UUID,
+                recipient_uri="swpt:2/1111",
+                recipient="1111",
+                amount=1000,
+                transfer_note_format="json",
+                transfer_note='{"note": "test"}',
+                initiated_at=TS0,
+                finalized_at=finalized_at,
+                error_code=error_code,
+                total_locked_amount=total_locked_amount,
+            )
+        )
+    return transfers
+
+
+def test_serialize_debtor(app):
+    s = schemas.DebtorSchema(context=context)
+    for debtor in _create_debtors():
+        _assert_identical(
+            serializers.serialize_debtor(debtor, context), s.dump(debtor)
+        )
+
+
+def test_serialize_debtor_config(app):
+    s = schemas.DebtorConfigSchema(context=context)
+    for debtor in _create_debtors():
+        _assert_identical(
+            serializers.serialize_debtor_config(debtor, context),
+            s.dump(debtor),
+        )
+
+
+def test_serialize_transfer(app):
+    s = schemas.TransferSchema(context=context)
+    for transfer in _create_transfers():
+        _assert_identical(
+            serializers.serialize_transfer(transfer, context),
+            s.dump(transfer),
+        )
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize(
+    "schema_class, serialize, objects",
+    [
+        (schemas.DebtorSchema, serializers.serialize_debtor, _create_debtors),
+        (
+            schemas.DebtorConfigSchema,
+            serializers.serialize_debtor_config,
+            _create_debtors,
+        ),
+        (
+            schemas.TransferSchema,
+            serializers.serialize_transfer,
+            _create_transfers,
+        ),
+    ],
+)
+def test_serializers_performance(
+    app, record_property, schema_class, serialize, objects
+):
+    n = 2000
+    s = schema_class(context=context)
+    obj = objects()[-1]
+    dumps = current_app.json.dumps
+
+    schema_seconds = timeit.timeit(lambda: dumps(s.dump(obj)), number=n)
+    serializer_seconds = timeit.timeit(
+        lambda: dumps(serialize(obj, context)), number=n
+    )
+    record_property("schema_us_per_dump", 1e6 * schema_seconds / n)
+    record_property("serializer_us_per_dump", 1e6 * serializer_seconds / n)
+    assert serializer_seconds < schema_seconds
@@ -0,0 +1,50 @@
+import pytest
+from uuid import UUID
+from flask import url_for
+from swpt_debtors.extensions import uri_builder
+from swpt_debtors.routes import context
+
+ENDPOINTS = [v for v in context.values() if isinstance(v, str)]
+VALUES = {
+    "debtorId": [0, 1, 4294967296, -1, -9223372036854775808],
+    "transferUuid": [UUID("123e4567-e89b-12d3-a456-426655440000")],
+}
+
+
+def _iter_values(app, endpoint):
+    rule = next(app.url_map.iter_rules(endpoint))
+    if "transferUuid" in rule.arguments:
+        for debtor_id in VALUES["debtorId"]:
+            for transfer_uuid in VALUES["transferUuid"]:
+                yield {"debtorId": debtor_id, "transferUuid": transfer_uuid}
+    else:
+        for debtor_id in VALUES["debtorId"]:
+            yield {"debtorId": debtor_id}
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_build_uri_in_app_context(app, endpoint):
+    for values in _iter_values(app, endpoint):
+        expected = url_for(endpoint, _external=False, **values)
+        assert uri_builder.build(endpoint, **values) == expected
+
+
+@pytest.mark.parametrize("endpoint", ENDPOINTS)
+def test_build_uri_in_request_context(app, endpoint):
+    with app.test_request_context(
+        "/", base_url="http://example.com/prefix/"
+    ):
+        for values in _iter_values(app, endpoint):
+            expected = url_for(endpoint, _external=False, **values)
+            assert expected.startswith("/prefix/")
+            assert uri_builder.build(endpoint, **values) == expected
+
+
+def test_build_uri_for_all_endpoints(app):
+    with app.test_request_context("/"):
+        for rule in app.url_map.iter_rules():
+            if rule.arguments <= {"debtorId", "transferUuid"}:
+                values = next(_iter_values(app, rule.endpoint))
+                values = {k: values[k] for k in rule.arguments}
+                expected = url_for(rule.endpoint, _external=False, **values)
+                assert uri_builder.build(rule.endpoint, **values) == expected